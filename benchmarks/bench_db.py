@@ -0,0 +1,94 @@
+"""Compare connect-per-call against the pooled connection layer.
+
+Simulates budget messages (one get_user each, every tenth one also saving
+settings) from many concurrent users and prints messages/sec for both modes
+with the user cache turned off, then for the pool with the cache on.
+Then every user changes settings, written through one transaction per
+change (one change at a time, so flushes cannot coalesce) versus the
+write-behind batches with all users at once.
+
+    python benchmarks/bench_db.py --users 1000 --messages 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import db
+from cache import user_cache
+from metrics import DB_SECONDS
+
+
+async def simulate(messages: int, users: int, concurrency: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one_message(i: int):
+        async with sem:
+            user_id = i % users
+            await db.get_user(user_id)
+            if i % 10 == 0:
+                await db.add_or_update_user(user_id, 10, 15.0, "en", 1000.0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_message(i) for i in range(messages)))
+    return messages / (time.perf_counter() - start)
+
+
+async def settings_storm(users: int, concurrency: int, write_through: bool):
+    sem = asyncio.Semaphore(concurrency)
+    commits = DB_SECONDS.count("save_user_writes")
+
+    async def change(user_id: int):
+        async with sem:
+            await db.add_or_update_user(user_id, 5, 20.0, "ru", 2000.0)
+            if write_through:
+                await db.user_writes.flush()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(change(user_id) for user_id in range(users)))
+    await db.user_writes.flush()
+    return users / (time.perf_counter() - start), DB_SECONDS.count("save_user_writes") - commits
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, "bench.db")
+        await db.init_db()
+        for user_id in range(args.users):
+            await db.add_or_update_user(user_id, 10, 15.0, "en", 1000.0)
+
+        # Every get_user must reach the database to compare the two modes
+        cache_size = user_cache.maxsize
+        user_cache.maxsize = 0
+        user_cache.clear()
+        legacy = await simulate(args.messages, args.users, args.concurrency)
+        print(f"connect-per-call: {legacy:10.1f} msg/s")
+
+        await db.open_pool(readers=args.readers)
+        try:
+            pooled = await simulate(args.messages, args.users, args.concurrency)
+            print(f"pooled:           {pooled:10.1f} msg/s  ({pooled / legacy:.1f}x)")
+
+            user_cache.maxsize = cache_size
+            cached = await simulate(args.messages, args.users, args.concurrency)
+            print(f"pooled + cache:   {cached:10.1f} msg/s  ({cached / legacy:.1f}x)")
+
+            through, through_commits = await settings_storm(args.users, 1, write_through=True)
+            print(f"settings, commit per change: {through:10.1f} changes/s, {through_commits} commits")
+            behind, behind_commits = await settings_storm(args.users, args.concurrency, write_through=False)
+            print(f"settings, write-behind:      {behind:10.1f} changes/s, {behind_commits} commits")
+        finally:
+            await db.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--readers", type=int, default=db.DB_READERS)
+    asyncio.run(run(parser.parse_args()))
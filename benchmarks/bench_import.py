@@ -0,0 +1,109 @@
+"""Time each stage of the CSV statement import.
+
+Generates a synthetic statement, then measures decode+parse, normalize,
+fingerprinting and the database write separately, plus the peak memory
+of the full import at `--rows` and at a tenth of it.
+
+    python benchmarks/bench_import.py --rows 200000
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import db
+import importer
+
+USER = {"income_day": 10, "savings_percent": 10.0, "language": "en", "monthly_income": 1000.0}
+PAYEES = ["Coffee", "Supermarket", "Metro", "Pharmacy", "Restaurant", "Taxi", "Salary"]
+
+
+def make_statement(rows: int) -> bytes:
+    rng = random.Random(42)
+    start = date(2022, 1, 1)
+    lines = ["Date;Description;Amount"]
+    for i in range(rows):
+        day = start + timedelta(days=i * 730 // rows)
+        amount = -rng.randint(50, 500000) / 100
+        # Decimal comma, as in most local bank exports
+        lines.append(f"{day:%d.%m.%Y};{rng.choice(PAYEES)};" + f"{amount:.2f}".replace(".", ","))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def timed(label: str, rows: int, stage):
+    start = time.perf_counter()
+    deque(stage(), maxlen=0)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {elapsed:8.3f}s  {rows / elapsed:12.0f} rows/s")
+
+
+async def run(args):
+    data = make_statement(args.rows)
+    print(f"statement: {args.rows} rows, {len(data) / 1024 / 1024:.1f} MB")
+
+    def lines():
+        return importer.decode_lines(importer.read_chunks(io.BytesIO(data)))
+
+    def rows():
+        return importer.parse_csv(lines())
+
+    timed("decode + csv", args.rows, rows)
+    timed("+ normalize", args.rows, lambda: importer.normalize(rows()))
+    timed("+ fingerprint", args.rows, lambda: importer.fingerprint(importer.normalize(rows())))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, "bench.db")
+        await db.init_db()
+        await db.open_pool()
+        try:
+            tracemalloc.start()
+            start = time.perf_counter()
+            stats = await importer.import_statement(1, USER, io.BytesIO(data), batch_size=args.batch_size)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{'full import':<22} {elapsed:8.3f}s  {stats.imported / elapsed:12.0f} rows/s  peak {peak / 1024 / 1024:.1f} MB")
+
+            start = time.perf_counter()
+            stats = await importer.import_statement(1, USER, io.BytesIO(data), batch_size=args.batch_size)
+            elapsed = time.perf_counter() - start
+            print(f"{'re-import (dedupe)':<22} {elapsed:8.3f}s  {stats.duplicates / elapsed:12.0f} rows/s")
+        finally:
+            await db.close_pool()
+
+    # Flat memory means the same peak for a statement ten times smaller
+    for rows in (args.rows // 10, args.rows):
+        peak = await import_peak_memory(make_statement(rows), args.batch_size)
+        print(f"peak memory, {rows:>7} rows  {peak / 1024 / 1024:8.1f} MB")
+
+
+async def import_peak_memory(data: bytes, batch_size: int) -> int:
+    """Peak Python heap (tracemalloc) of importing `data` into a new database."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, "bench.db")
+        await db.init_db()
+        await db.open_pool()
+        try:
+            tracemalloc.start()
+            await importer.import_statement(1, USER, io.BytesIO(data), batch_size=batch_size)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            await db.close_pool()
+    return peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=importer.IMPORT_BATCH_SIZE)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,87 @@
+"""Per-message CPU time of the budget reply: plan calculation + rendering.
+
+"before" re-implements the original hot path (relativedelta on every call and
+str.format through a dict lookup chain); "after" uses the memoized income
+date resolution and precompiled templates.
+
+    python benchmarks/bench_message.py --iterations 100000
+"""
+import argparse
+import calendar
+import os
+import sys
+import time
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from logic import calculate_budget_plan
+from messages import get_text, MESSAGES
+
+
+def legacy_plan(current_balance, income_day, savings_percent, monthly_income, now):
+    if now.day < income_day:
+        try:
+            target_date = now.replace(day=income_day)
+        except ValueError:
+            last_day_current = calendar.monthrange(now.year, now.month)[1]
+            target_date = now.replace(day=min(income_day, last_day_current))
+    else:
+        next_month = now + relativedelta(months=1)
+        last_day_next = calendar.monthrange(next_month.year, next_month.month)[1]
+        target_date = next_month.replace(day=min(income_day, last_day_next))
+    days_remaining = (target_date - now).days
+    savings_amount = monthly_income * (savings_percent / 100)
+    safe_to_spend_total = current_balance - savings_amount
+    daily_budget = safe_to_spend_total / days_remaining if days_remaining > 0 else safe_to_spend_total
+    return {
+        "target_date": target_date,
+        "days_remaining": days_remaining,
+        "savings_amount": savings_amount,
+        "safe_to_spend_total": safe_to_spend_total,
+        "daily_budget": daily_budget
+    }
+
+
+def legacy_get_text(key, lang="en", **kwargs):
+    lang_dict = MESSAGES.get(lang, MESSAGES["en"])
+    text = lang_dict.get(key, MESSAGES["en"].get(key, key))
+    if kwargs:
+        return text.format(**kwargs)
+    return text
+
+
+def one_message(plan_fn, text_fn, i, now):
+    income_day = i % 31 + 1
+    lang = "ru" if i % 2 else "en"
+    plan = plan_fn(1000.0 + i, income_day, 10.0, 5000.0, now)
+    return text_fn("financial_plan", lang,
+        next_income=plan['target_date'].strftime('%Y-%m-%d'),
+        days_remaining=plan['days_remaining'],
+        savings_percent=10.0,
+        monthly_income=f"{5000.0:.2f}",
+        savings_amount=f"{plan['savings_amount']:.2f}",
+        safe_to_spend=f"{plan['safe_to_spend_total']:.2f}",
+        daily_budget=f"{plan['daily_budget']:.2f}"
+    )
+
+
+def measure(plan_fn, text_fn, iterations):
+    now = datetime.now()
+    start = time.process_time()
+    for i in range(iterations):
+        one_message(plan_fn, text_fn, i, now)
+    return (time.process_time() - start) / iterations * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    before = measure(legacy_plan, legacy_get_text, args.iterations)
+    after = measure(lambda b, d, p, m, now: calculate_budget_plan(b, d, p, m, now=now), get_text, args.iterations)
+    print(f"before: {before:6.2f} us/message")
+    print(f"after:  {after:6.2f} us/message  ({before / after:.1f}x)")
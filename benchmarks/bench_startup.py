@@ -0,0 +1,71 @@
+"""Cold start: importing the bot and getting the database ready.
+
+Imports are timed in a fresh interpreter with `python -X importtime`, so
+nothing is cached in sys.modules; the slowest modules are listed. Then
+init_db() + open_pool() is timed on a new database (all migrations run)
+and on a current one (the version check only).
+
+    python benchmarks/bench_startup.py --top 15
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+
+
+def import_times(module: str):
+    """(total seconds, [(cumulative seconds, depth, module)]) for importing `module`."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=SRC, capture_output=True, text=True, check=True)
+    total = time.perf_counter() - start
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # One space after the bar, then two per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((int(cumulative) / 1e6, depth, name.strip()))
+    return total, modules
+
+
+async def time_db_ready(path: str) -> float:
+    import db
+    db.DB_NAME = path
+    start = time.perf_counter()
+    await db.init_db()
+    await db.open_pool()
+    elapsed = time.perf_counter() - start
+    await db.close_pool()
+    return elapsed
+
+
+async def run(args):
+    total, modules = import_times("main")
+    print(f"import main: {total:.2f}s in a fresh interpreter")
+    # Depth 1: what main.py imports directly, including what those pull in
+    direct = sorted(((seconds, name) for seconds, depth, name in modules if depth == 1), reverse=True)
+    for seconds, name in direct[:args.top]:
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        print(f"db ready, new schema:     {await time_db_ready(path) * 1000:.1f} ms")
+        print(f"db ready, current schema: {await time_db_ready(path) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Latency of /history and /stats for a user with years of transactions.
+
+Both are served from the rollup tables, so the time should not grow with
+the number of stored transactions.
+
+    python benchmarks/bench_stats.py --years 5 --per-day 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import db
+import ledger
+
+USER = {"income_day": 10, "savings_percent": 10.0, "language": "en", "monthly_income": 1000.0}
+
+
+async def timed(runs: int, call):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await call()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+async def run(args):
+    rng = random.Random(1)
+    today = date.today()
+    days = args.years * 365
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, "bench.db")
+        await db.init_db()
+        await db.open_pool()
+        try:
+            for offset in range(days, 0, -30):
+                entries = [(today - timedelta(days=offset - d), -rng.randint(1, 5000) / 100, None)
+                           for d in range(30) for _ in range(args.per_day)]
+                await ledger.record_transactions(1, USER, entries, today=today, affect_balance=False)
+            await ledger.set_balance(1, USER, 2000, today=today)
+            print(f"user with {days * args.per_day} transactions over {args.years} years")
+
+            for name, call in (
+                ("/history", lambda: ledger.history(1, USER, today)),
+                ("/stats", lambda: ledger.stats(1, USER, today)),
+            ):
+                p50, p99 = await timed(args.runs, call)
+                print(f"{name:<10} p50 {p50:6.2f} ms  p99 {p99:6.2f} ms")
+        finally:
+            await db.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--per-day", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=500)
+    asyncio.run(run(parser.parse_args()))
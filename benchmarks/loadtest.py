@@ -0,0 +1,216 @@
+"""Load test the bot end to end against a fake Telegram API.
+
+Two scenarios, both on a temporary database:
+
+- updates: simulated users go through /start, the settings wizard and a
+  few balance messages. Every update is fed through `dp.feed_update`, with
+  each user's updates in order and many users in flight at once.
+- reminders: the daily reminder broadcast for all users due at once.
+
+Reports p50/p99 update latency, messages/sec, DB calls and Bot API
+requests per update, and peak memory. With --json the results are written
+in a machine-readable form for comparison between commits.
+
+    python benchmarks/loadtest.py --users 1000 --reminder-users 100000 --json results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+# Charts render in a process pool; keep them out of the per-update numbers
+os.environ.setdefault("CHARTS_ENABLED", "0")
+
+from aiogram import Bot
+from aiogram.types import Update
+
+import db
+import main
+from fake_telegram import FakeSession, make_message_update, make_callback_update
+from metrics import DB_SECONDS
+from reminders import send_due_reminders
+
+
+def db_calls() -> int:
+    return sum(count for _, _, count in DB_SECONDS.values.values())
+
+
+def percentile(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def user_script(user_id: int, balances: int):
+    """The updates one new user sends, as (kind, payload) pairs."""
+    yield "message", "/start"
+    yield "callback", "lang_en"
+    yield "message", str(user_id % 28 + 1)
+    yield "message", "5000"
+    yield "message", "10"
+    for i in range(balances):
+        yield "message", str(1000 + user_id % 500 + i)
+
+
+class Measured:
+    """Peak RSS is always reported; tracemalloc is precise but slow, so opt-in."""
+
+    def __init__(self, trace: bool):
+        self.trace = trace
+
+    def __enter__(self):
+        if self.trace:
+            tracemalloc.start()
+        self.started = time.perf_counter()
+        self.db_calls = db_calls()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        self.db_calls = db_calls() - self.db_calls
+        self.traced_peak_mb = None
+        if self.trace:
+            self.traced_peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+        # KB on Linux
+        self.max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run_updates(args) -> dict:
+    session = FakeSession(record=False)
+    bot = Bot(token="42:TEST", session=session)
+    latencies = []
+    update_ids = iter(range(1, 10**9))
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one_user(user_id: int):
+        async with semaphore:
+            for kind, payload in user_script(user_id, args.balances):
+                update_id = next(update_ids)
+                if kind == "message":
+                    raw = make_message_update(update_id, user_id, payload)
+                else:
+                    raw = make_callback_update(update_id, user_id, payload)
+                update = Update.model_validate(raw)
+                start = time.perf_counter()
+                await main.dp.feed_update(bot, update)
+                latencies.append(time.perf_counter() - start)
+
+    with Measured(args.tracemalloc) as m:
+        await asyncio.gather(*(one_user(user_id) for user_id in range(1, args.users + 1)))
+        await main.dp.storage.close()
+    updates = len(latencies)
+    return {
+        "users": args.users,
+        "updates": updates,
+        "seconds": round(m.elapsed, 3),
+        "updates_per_sec": round(updates / m.elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "db_calls_per_update": round(m.db_calls / updates, 2),
+        "api_requests_per_update": round(session.request_count / updates, 2),
+        "max_rss_mb": round(m.max_rss_mb, 1),
+        "traced_peak_mb": m.traced_peak_mb and round(m.traced_peak_mb, 1),
+    }
+
+
+async def seed_reminder_users(count: int, due_at: int):
+    async with db._write() as conn:
+        await conn.executemany(
+            'INSERT INTO users (user_id, income_day, savings_percent, language, monthly_income, '
+            'timezone, reminder_time, next_reminder_at) VALUES (?, 10, 10.0, ?, 1000.0, ?, ?, ?)',
+            ((10**6 + i, "ru" if i % 3 == 0 else "en", "UTC", "11:00", due_at) for i in range(count))
+        )
+        await conn.commit()
+
+
+async def run_reminders(args) -> dict:
+    now = datetime(2024, 1, 15, 11, 0, tzinfo=timezone.utc)
+    await seed_reminder_users(args.reminder_users, int(now.timestamp()))
+    session = FakeSession(record=False)
+    bot = Bot(token="42:TEST", session=session)
+
+    with Measured(args.tracemalloc) as m:
+        stats = await send_due_reminders(bot, now, rate=args.reminder_rate)
+    return {
+        "users": args.reminder_users,
+        "sent": stats.sent,
+        "failed": stats.failed,
+        "seconds": round(m.elapsed, 3),
+        "messages_per_sec": round(stats.sent / m.elapsed, 1) if m.elapsed else None,
+        "db_calls": m.db_calls,
+        "max_rss_mb": round(m.max_rss_mb, 1),
+        "traced_peak_mb": m.traced_peak_mb and round(m.traced_peak_mb, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "args": vars(args),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, "loadtest.db")
+        db.user_cache.clear()
+        await db.init_db()
+        await db.open_pool()
+        try:
+            if args.scenario in ("all", "updates"):
+                results["updates"] = await run_updates(args)
+                r = results["updates"]
+                print(f"updates:   {r['updates']} from {r['users']} users in {r['seconds']} s, "
+                      f"{r['updates_per_sec']} updates/s, p50 {r['p50_ms']} ms, p99 {r['p99_ms']} ms, "
+                      f"{r['db_calls_per_update']} DB calls and {r['api_requests_per_update']} API requests per update")
+            if args.scenario in ("all", "reminders"):
+                results["reminders"] = await run_reminders(args)
+                r = results["reminders"]
+                print(f"reminders: {r['sent']} of {r['users']} sent in {r['seconds']} s, "
+                      f"{r['messages_per_sec']} msg/s, {r['db_calls']} DB calls")
+        finally:
+            await db.close_pool()
+    results["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    print(f"peak RSS:  {results['max_rss_mb']} MB")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", choices=("all", "updates", "reminders"), default="all")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--balances", type=int, default=5, help="balance messages per user after the wizard")
+    parser.add_argument("--concurrency", type=int, default=100, help="users sending updates at once")
+    parser.add_argument("--reminder-users", type=int, default=100000)
+    parser.add_argument("--reminder-rate", type=float, default=1e9, help="broadcast msgs/sec cap")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the traced Python heap peak")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    args = parser.parse_args()
+    results = asyncio.run(run(args))
+    if args.json == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
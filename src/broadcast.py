@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from metrics import BROADCAST_MESSAGES
+
+# Telegram allows roughly 30 messages/sec per bot and 1 message/sec per chat.
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "16"))
+PER_CHAT_INTERVAL = 1.0
+
+
+class TokenBucket:
+    """Async token bucket. `pause()` blocks every caller, e.g. for RetryAfter."""
+
+    def __init__(self, rate: float, capacity: float = None, clock=time.monotonic, sleep=asyncio.sleep):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = self._clock()
+                if now < self._paused_until:
+                    await self._sleep(self._paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await self._sleep((1 - self.tokens) / self.rate)
+
+
+class PerChatLimiter:
+    """Keeps at least `interval` seconds between messages to the same chat."""
+
+    def __init__(self, interval: float = PER_CHAT_INTERVAL, clock=time.monotonic, sleep=asyncio.sleep):
+        self.interval = interval
+        self._clock = clock
+        self._sleep = sleep
+        self._last = {}
+
+    async def wait(self, chat_id: int):
+        now = self._clock()
+        last = self._last.get(chat_id)
+        if last is not None and now - last < self.interval:
+            await self._sleep(self.interval - (now - last))
+            now = self._clock()
+        self._last[chat_id] = now
+        # Entries older than the interval can never delay anyone again
+        if len(self._last) > 10000:
+            cutoff = now - self.interval
+            self._last = {k: v for k, v in self._last.items() if v > cutoff}
+
+
+@dataclass
+class BroadcastStats:
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: float = None
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return (f"sent={self.sent} failed={self.failed} retried={self.retried} "
+                f"elapsed={self.elapsed:.1f}s rate={self.throughput:.1f} msg/s")
+
+
+class Broadcaster:
+    """Sends (chat_id, text) pairs through a bounded pool of workers."""
+
+    def __init__(self, bot, rate: float = BROADCAST_RATE, workers: int = BROADCAST_WORKERS,
+                 per_chat_interval: float = PER_CHAT_INTERVAL, max_retries: int = 3,
+                 limiter: TokenBucket = None, chat_limiter: PerChatLimiter = None):
+        self.bot = bot
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.limiter = limiter or TokenBucket(rate)
+        self.chat_limiter = chat_limiter or PerChatLimiter(per_chat_interval)
+
+    async def run(self, recipients) -> BroadcastStats:
+        """`recipients` may be a plain or an async iterable of (chat_id, text)."""
+        stats = BroadcastStats()
+        queue = asyncio.Queue(maxsize=self.workers * 4)
+
+        async def produce():
+            if hasattr(recipients, "__aiter__"):
+                async for item in recipients:
+                    await queue.put(item)
+            else:
+                for item in recipients:
+                    await queue.put(item)
+            for _ in range(self.workers):
+                await queue.put(None)
+
+        async def work():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                await self._deliver(item[0], item[1], stats)
+
+        workers = [asyncio.create_task(work()) for _ in range(self.workers)]
+        try:
+            await produce()
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            stats.finished_at = time.monotonic()
+        return stats
+
+    async def _deliver(self, chat_id: int, text: str, stats: BroadcastStats):
+        for attempt in range(self.max_retries + 1):
+            await self.chat_limiter.wait(chat_id)
+            await self.limiter.acquire()
+            try:
+                await self.bot.send_message(chat_id, text)
+                stats.sent += 1
+                BROADCAST_MESSAGES.inc("sent")
+                return
+            except TelegramRetryAfter as e:
+                # Flood control applies to the whole bot, so stop every worker
+                self.limiter.pause(e.retry_after)
+                stats.retried += 1
+                BROADCAST_MESSAGES.inc("retried")
+            except Exception as e:
+                logging.error(f"Failed to send broadcast to {chat_id}: {e}")
+                stats.failed += 1
+                BROADCAST_MESSAGES.inc("failed")
+                return
+        logging.error(f"Giving up on {chat_id} after {self.max_retries} retries")
+        stats.failed += 1
+        BROADCAST_MESSAGES.inc("failed")
@@ -0,0 +1,84 @@
+import os
+import time
+from collections import OrderedDict
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Bounded LRU cache with per-entry TTL and hit/miss/eviction counters.
+
+    `None` is a valid cached value (e.g. "user does not exist"), so lookups
+    return the MISSING sentinel on a miss.
+    """
+
+    MISSING = _MISSING
+
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        # Bumped on every write so a read that raced with a write does not
+        # put a stale row back into the cache.
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return _MISSING
+        value, expires_at = entry
+        if expires_at <= self._clock():
+            del self._data[key]
+            self.misses += 1
+            return _MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key):
+        entry = self._data.get(key)
+        if entry is None or entry[1] <= self._clock():
+            return _MISSING
+        return entry[0]
+
+    def set(self, key, value, epoch: int = None):
+        if self.maxsize <= 0:
+            return
+        if epoch is not None and epoch != self.epoch:
+            return
+        self._data[key] = (value, self._clock() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self.epoch += 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        self.epoch += 1
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+user_cache = LRUCache()
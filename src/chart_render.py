@@ -0,0 +1,56 @@
+"""Burn-down chart rendering, run in the chart pool processes.
+
+The pool processes start from this module instead of the bot's entry
+point, so keep its imports to the standard library: matplotlib is loaded
+on first use and aiogram never is.
+"""
+import io
+import os
+from datetime import date, timedelta
+
+
+def load_matplotlib() -> int:
+    """Load matplotlib ahead of the first render; returns the process id."""
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import pyplot  # noqa: F401
+    return os.getpid()
+
+
+def render_burndown(data: dict) -> bytes:
+    """Draw the chart and return PNG bytes."""
+    load_matplotlib()
+    from matplotlib import pyplot as plt
+    from matplotlib import dates as mdates
+
+    start = date.fromisoformat(data["start"])
+    today = date.fromisoformat(data["today"])
+    target = date.fromisoformat(data["target"])
+    labels = data["labels"]
+
+    fig, ax = plt.subplots(figsize=(8, 4.5), dpi=100)
+    try:
+        spent_days = [start + timedelta(days=i) for i in range(len(data["spent"]))]
+        ax.bar(spent_days, data["spent"], color="#e07a5f", alpha=0.8, label=labels["spent"])
+        ax.axhline(data["daily_budget"], color="#3d405b", linestyle="--", linewidth=1, label=labels["daily_budget"])
+        ax.set_ylabel(labels["spent"])
+
+        remaining = ax.twinx()
+        remaining.plot([today, target], [data["safe_to_spend"], 0], color="#81b29a", linewidth=2, label=labels["remaining"])
+        remaining.set_ylabel(labels["remaining"])
+        remaining.set_ylim(bottom=min(0, data["safe_to_spend"]))
+
+        ax.set_xlim(start - timedelta(days=1), max(target, today) + timedelta(days=1))
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%d.%m"))
+        ax.set_title(labels["title"])
+        handles = ax.get_legend_handles_labels()
+        extra = remaining.get_legend_handles_labels()
+        ax.legend(handles[0] + extra[0], handles[1] + extra[1], loc="upper right", fontsize="small")
+        fig.autofmt_xdate()
+        fig.tight_layout()
+
+        out = io.BytesIO()
+        fig.savefig(out, format="png")
+        return out.getvalue()
+    finally:
+        plt.close(fig)
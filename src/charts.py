@@ -0,0 +1,142 @@
+"""Budget burn-down charts.
+
+Rendering happens in a small process pool (see chart_render), so matplotlib
+never runs on the event loop. PNGs are cached by a hash of the chart inputs,
+and once a chart has been uploaded its Telegram file_id is reused instead
+of the bytes.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile
+
+import chart_render
+from cache import LRUCache
+
+# Off by default: every budget calculation then also costs a render and a photo upload
+CHARTS_ENABLED = os.getenv("CHARTS_ENABLED", "0") == "1"
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+# Rendered PNGs (tens of KB each) and uploaded file_ids (a few bytes each)
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "256"))
+CHART_FILE_ID_CACHE_SIZE = int(os.getenv("CHART_FILE_ID_CACHE_SIZE", "10000"))
+CHART_CACHE_TTL = float(os.getenv("CHART_CACHE_TTL", str(24 * 3600)))
+
+png_cache = LRUCache(maxsize=CHART_CACHE_SIZE, ttl=CHART_CACHE_TTL)
+file_id_cache = LRUCache(maxsize=CHART_FILE_ID_CACHE_SIZE, ttl=CHART_CACHE_TTL)
+
+_pool = None
+_inflight = {}
+
+
+def chart_data(plan: dict, today: date, cycle_start: date, spent_by_day: dict, labels: dict) -> dict:
+    """Everything the chart shows, as plain JSON-able values.
+
+    `spent_by_day` maps past days of the cycle to their spend; the planned
+    line goes from today's safe-to-spend amount down to zero on the income
+    date.
+    """
+    target = plan['target_date'].date()
+    return {
+        "start": cycle_start.isoformat(),
+        "today": today.isoformat(),
+        "target": target.isoformat(),
+        "safe_to_spend": round(plan['safe_to_spend_total'], 2),
+        "daily_budget": round(plan['daily_budget'], 2),
+        "spent": [round(spent_by_day.get(cycle_start + timedelta(days=i), 0.0), 2)
+                  for i in range((today - cycle_start).days + 1)],
+        "labels": labels,
+    }
+
+
+def chart_key(data: dict) -> str:
+    """Content hash of the chart inputs."""
+    return hashlib.blake2b(json.dumps(data, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a process with live aiosqlite threads is unsafe
+        _pool = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+@contextmanager
+def _spawning_from(module):
+    """Processes spawned inside start from `module` instead of the bot's __main__.
+
+    A spawned process re-imports the parent's __main__ (as __mp_main__)
+    before it runs anything; for the bot that is main.py with aiogram and
+    every handler.
+    """
+    saved = sys.modules["__main__"]
+    sys.modules["__main__"] = module
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = saved
+
+
+def _run_in_pool(fn, *args) -> asyncio.Future:
+    loop = asyncio.get_running_loop()
+    # The pool starts its processes on demand, inside submit()
+    with _spawning_from(chart_render):
+        return loop.run_in_executor(get_pool(), fn, *args)
+
+
+async def warm_up_pool():
+    """Start the render processes and load matplotlib in them."""
+    await asyncio.gather(*(_run_in_pool(chart_render.load_matplotlib) for _ in range(CHART_WORKERS)))
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def render_chart(data: dict, key: str = None) -> bytes:
+    """PNG for `data`, from the cache or rendered off the event loop.
+
+    Concurrent requests for the same chart share one render.
+    """
+    key = key or chart_key(data)
+    png = png_cache.get(key)
+    if png is not png_cache.MISSING:
+        return png
+
+    future = _inflight.get(key)
+    if future is None:
+        future = _inflight[key] = asyncio.ensure_future(_run_in_pool(chart_render.render_burndown, data))
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+    png = await asyncio.shield(future)
+    png_cache.set(key, png)
+    return png
+
+
+async def send_chart(message, data: dict):
+    """Send the chart as a photo, re-using the file_id of an earlier upload."""
+    key = chart_key(data)
+    file_id = file_id_cache.get(key)
+    if file_id is not file_id_cache.MISSING:
+        try:
+            return await message.answer_photo(file_id)
+        except TelegramBadRequest as e:
+            logging.warning(f"Cached chart file_id rejected, uploading again: {e}")
+            file_id_cache.invalidate(key)
+
+    png = await render_chart(data, key)
+    sent = await message.answer_photo(BufferedInputFile(png, filename="budget.png"))
+    if sent.photo:
+        file_id_cache.set(key, sent.photo[-1].file_id)
+    return sent
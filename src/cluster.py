@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import socket
+import sys
+import time
+from datetime import datetime, timezone
+
+from broadcast import BROADCAST_RATE
+from db import (
+    try_acquire_lease, delete_expired_leases, try_acquire_users_lease, release_users_lease,
+    delete_expired_users_leases
+)
+from reminders import send_due_reminders, schedule_missing_reminders
+import ledger
+
+# Worker processes started by `python src/main.py`. WEBHOOK_WORKERS is the
+# older name of the same setting.
+WORKERS = int(os.getenv("WORKERS", os.getenv("WEBHOOK_WORKERS", "1")))
+# Fixed number of user_id buckets per reminder tick. Independent of WORKERS
+# so adding replicas does not move users between buckets.
+REMINDER_PARTITIONS = int(os.getenv("REMINDER_PARTITIONS", "16"))
+# A worker first takes the buckets assigned to it and only steals the rest
+# (from a dead or slow replica) after this many seconds.
+STEAL_DELAY = float(os.getenv("REMINDER_STEAL_DELAY", "10"))
+LEASE_TTL = 3600
+# A partition's lease is renewed every third of this while its reminders
+# are being sent; a replica that died mid-send holds it this long at most.
+PARTITION_LEASE_TTL = int(os.getenv("REMINDER_LEASE_TTL", "60"))
+# With several processes, or a users table other hosts write to, every
+# process keeps its own user cache, so others' writes must not stay
+# invisible for long.
+CLUSTER_CACHE_TTL = float(os.getenv("CLUSTER_CACHE_TTL", "5"))
+
+
+def worker_owner(worker_index: int) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{worker_index}"
+
+
+def partition_order(worker_index: int, workers: int, partitions: int = REMINDER_PARTITIONS):
+    """(own partitions, the others) for a worker."""
+    own = [p for p in range(partitions) if p % workers == worker_index % workers]
+    others = [p for p in range(partitions) if p % workers != worker_index % workers]
+    return own, others
+
+
+async def run_reminder_tick(bot, worker_index: int = 0, workers: int = WORKERS,
+                            partitions: int = REMINDER_PARTITIONS, now: datetime = None,
+                            steal_delay: float = STEAL_DELAY):
+    """One scheduler tick on one replica.
+
+    Each partition is guarded by a lease stored with the users table and
+    held for as long as its reminders are being sent, so one replica at a
+    time works on it however many are running, including bots on another
+    host during a rolling deploy. A tick that finds a partition busy skips
+    it; the users due meanwhile are picked up by the next tick.
+    """
+    now = (now or datetime.now(timezone.utc)).replace(second=0, microsecond=0)
+    tick = int(now.timestamp())
+    owner = worker_owner(worker_index)
+    rate = BROADCAST_RATE / max(1, workers)
+
+    if await try_acquire_users_lease(f"reminders:{tick}:schedule", owner, tick, LEASE_TTL):
+        await schedule_missing_reminders(now)
+        await delete_expired_users_leases(tick)
+
+    own, others = partition_order(worker_index, workers, partitions)
+
+    async def run(partition_list):
+        for partition in partition_list:
+            name = f"reminders:{partition}"
+            # Per tick, so a slow tick in this process also blocks the next one
+            lease_owner = f"{owner}:{tick}"
+            if not await try_acquire_users_lease(name, lease_owner, int(time.time()), PARTITION_LEASE_TTL):
+                continue
+            renewing = asyncio.create_task(_renew_lease(name, lease_owner))
+            try:
+                await send_due_reminders(bot, now, partition, partitions, rate=rate)
+            finally:
+                renewing.cancel()
+                await release_users_lease(name, lease_owner)
+
+    await run(own)
+    if others:
+        await asyncio.sleep(steal_delay)
+        await run(others)
+
+
+async def _renew_lease(name: str, owner: str, ttl: int = PARTITION_LEASE_TTL):
+    while True:
+        await asyncio.sleep(ttl / 3)
+        try:
+            if not await try_acquire_users_lease(name, owner, int(time.time()), ttl):
+                # Claims are atomic, so this costs no duplicates, only overlap
+                logging.warning(f"Lost lease {name} while sending")
+                return
+        except Exception as e:
+            logging.error(f"Failed to renew lease {name}: {e}")
+
+
+async def run_daily_maintenance(worker_index: int = 0, now: datetime = None):
+    """Nightly housekeeping of DB_PATH, run by one of its processes per day."""
+    now = now or datetime.now(timezone.utc)
+    day = now.date()
+    now_ts = int(now.timestamp())
+    if not await try_acquire_lease(f"maintenance:{day.isoformat()}", worker_owner(worker_index), now_ts, LEASE_TTL):
+        return
+    await delete_expired_leases(now_ts)
+    deleted = await ledger.compact(day)
+    if deleted:
+        logging.info(f"Ledger compaction removed {deleted} transactions")
+
+
+def run_workers(count: int, target):
+    """Run `target(index)` in `count` processes and forward SIGTERM to them.
+
+    If a worker exits on its own (a crash, or worker 0's polling loop
+    dying), the others are stopped and the parent exits with an error, so
+    the container's restart policy brings the whole bot back.
+    """
+    if count <= 1:
+        target(0)
+        return
+
+    processes = [multiprocessing.Process(target=target, args=(i,), name=f"worker-{i}") for i in range(count)]
+    for process in processes:
+        process.start()
+    logging.info(f"Started {count} worker processes")
+    stopping = False
+
+    def stop_all():
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    def forward(signum, frame):
+        nonlocal stopping
+        stopping = True
+        stop_all()
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    multiprocessing.connection.wait([process.sentinel for process in processes])
+    if not stopping:
+        exited = [process for process in processes if not process.is_alive()]
+        for process in exited:
+            logging.error(f"Worker {process.name} exited unexpectedly with code {process.exitcode}")
+        stop_all()
+    for process in processes:
+        process.join()
+    if not stopping:
+        sys.exit(1)
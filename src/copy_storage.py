@@ -0,0 +1,53 @@
+"""Copy the users table from one storage to another.
+
+    python src/copy_storage.py --from sqlite:finance_bot.db --to postgresql://bot@db-host/bot
+
+The target is migrated first and rows are upserted in chunks, so the copy
+can be re-run (e.g. right before switching DATABASE_URL) without clearing
+the target. Stop the bot meanwhile so no settings change mid-copy.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from db import create_user_storage
+from storage import USER_COPY_COLUMNS
+
+COPY_CHUNK_SIZE = 5000
+
+
+async def copy_users(source, target, chunk_size: int = COPY_CHUNK_SIZE) -> int:
+    """Stream every user from `source` into `target`; returns the row count."""
+    copied = 0
+    async for rows in source.iter_user_chunks(USER_COPY_COLUMNS[1:], chunk_size):
+        await target.copy_users(rows)
+        copied += len(rows)
+        logging.info(f"Copied {copied} users")
+    return copied
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--from", dest="source", required=True, help='"sqlite:<path>" or a postgresql:// URL')
+    parser.add_argument("--to", dest="target", required=True, help='"sqlite:<path>" or a postgresql:// URL')
+    parser.add_argument("--chunk-size", type=int, default=COPY_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    source = create_user_storage(args.source)
+    target = create_user_storage(args.target)
+    await source.open()
+    await target.open()
+    try:
+        await target.migrate()
+        start = time.perf_counter()
+        copied = await copy_users(source, target, args.chunk_size)
+        print(f"{copied} users copied in {time.perf_counter() - start:.1f}s")
+    finally:
+        await source.close()
+        await target.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -1,73 +1,901 @@
-
 import aiosqlite
+import asyncio
+import logging
 import os
+import time
+from bisect import bisect_right
+from contextlib import asynccontextmanager
+from datetime import date
+
+from cache import user_cache
+from logic import cycle_bounds
+from metrics import timed, DB_SECONDS
+from migrations import migrate_sqlite
+from storage import UserStorage, USER_COPY_COLUMNS, user_record
 
 DB_NAME = os.getenv("DB_PATH", "finance_bot.db")
+# Where the users table lives: empty for DB_PATH, "sqlite:<path>" or a
+# postgresql:// URL. Everything else stays in DB_PATH.
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "UTC")
+DEFAULT_REMINDER_TIME = os.getenv("DEFAULT_REMINDER_TIME", "11:00")
+# Settings and language changes are batched for this many seconds, or
+# until this many users are pending, then written in one transaction
+USER_WRITE_INTERVAL = float(os.getenv("USER_WRITE_INTERVAL", "0.2"))
+USER_WRITE_BATCH = int(os.getenv("USER_WRITE_BATCH", "500"))
+
+# Applied to every pooled connection. WAL lets the readers run while the
+# single writer commits; NORMAL sync is durable enough in WAL mode.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA mmap_size=67108864",
+)
+
+
+class ConnectionPool:
+    """One long-lived writer connection plus a small pool of readers."""
+
+    def __init__(self, path: str, readers: int = DB_READERS):
+        self.path = path
+        self.size = max(1, readers)
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._readers = asyncio.Queue()
+        self._all_readers = []
+
+    async def _connect(self, read_only: bool = False):
+        conn = await aiosqlite.connect(self.path)
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        if read_only:
+            await conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    async def open(self):
+        self._writer = await self._connect()
+        for _ in range(self.size):
+            conn = await self._connect(read_only=True)
+            self._all_readers.append(conn)
+            self._readers.put_nowait(conn)
+
+    async def close(self):
+        # Wait for the writer to finish whatever it is doing before closing
+        async with self._write_lock:
+            if self._writer is not None:
+                await self._writer.close()
+                self._writer = None
+        for conn in self._all_readers:
+            await conn.close()
+        self._all_readers.clear()
+        self._readers = asyncio.Queue()
+
+    @asynccontextmanager
+    async def reader(self):
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self):
+        async with self._write_lock:
+            yield self._writer
+
+
+_pool = None
+
+
+async def open_pool(path: str = None, readers: int = DB_READERS):
+    """Start the shared connection pool. Call after init_db()."""
+    global _pool
+    if _pool is not None:
+        return _pool
+    pool = ConnectionPool(path or DB_NAME, readers)
+    await pool.open()
+    await user_storage.open()
+    _pool = pool
+    return pool
+
 
+async def close_pool():
+    global _pool
+    # Queued user writes go out before the connections close
+    await user_writes.close()
+    await user_storage.close()
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+
+@asynccontextmanager
+async def _read():
+    # Without a started pool (scripts, one-off tools) fall back to a
+    # short-lived connection so every function keeps working.
+    if _pool is None:
+        async with aiosqlite.connect(DB_NAME) as db:
+            yield db
+    else:
+        async with _pool.reader() as db:
+            yield db
+
+
+@asynccontextmanager
+async def _write():
+    if _pool is None:
+        async with aiosqlite.connect(DB_NAME) as db:
+            yield db
+    else:
+        async with _pool.writer() as db:
+            yield db
 
 
 async def init_db():
+    """Create or upgrade the schema to the latest version."""
     async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                income_day INTEGER NOT NULL,
-                savings_percent REAL NOT NULL,
-                language TEXT DEFAULT 'en',
-                monthly_income REAL DEFAULT 0
-            )
-        ''')
-        # Attempt to add columns if they don't exist
-        try:
-            await db.execute('ALTER TABLE users ADD COLUMN language TEXT DEFAULT "en"')
-        except Exception:
-            pass # Column likely exists
-            
-        try:
-            await db.execute('ALTER TABLE users ADD COLUMN monthly_income REAL DEFAULT 0')
-        except Exception:
-            pass 
-            
-        await db.commit()
+        await migrate_sqlite(db)
+    await user_storage.migrate()
 
 async def add_or_update_user(user_id: int, income_day: int, savings_percent: float, language: str = 'en', monthly_income: float = 0):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute('''
-            INSERT INTO users (user_id, income_day, savings_percent, language, monthly_income)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                income_day = excluded.income_day,
-                savings_percent = excluded.savings_percent,
-                language = excluded.language,
-                monthly_income = excluded.monthly_income
-        ''', (user_id, income_day, savings_percent, language, monthly_income))
-        await db.commit()
+    """Queue a settings upsert; it is written with the next batch."""
+    record = {
+        "income_day": income_day,
+        "savings_percent": savings_percent,
+        "language": language or 'en',
+        "monthly_income": monthly_income if monthly_income is not None else 0
+    }
+    user_writes.put(user_id, record)
+    user_cache.invalidate(user_id)
+    user_cache.set(user_id, record)
 
 async def update_user_language(user_id: int, language: str):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute('''
-            UPDATE users SET language = ? WHERE user_id = ?
-        ''', (language, user_id))
-        await db.commit()
+    """Queue a language change; it is written with the next batch."""
+    user_writes.put_language(user_id, language)
+    cached = user_cache.peek(user_id)
+    user_cache.invalidate(user_id)
+    if cached is not user_cache.MISSING and cached is not None:
+        user_cache.set(user_id, dict(cached, language=language or 'en'))
+
+@timed(DB_SECONDS)
+async def save_user_writes(upserts, languages):
+    """Apply queued settings upserts and language changes in one transaction."""
+    await user_storage.save_users(upserts, languages)
+
+class UserWriteBuffer:
+    """Write-behind queue for user settings.
+
+    Writes are kept per user (a later one replaces an earlier one) and
+    applied in a single transaction every `flush_interval` seconds, or as
+    soon as `batch_size` users are pending. `get_user` overlays the pending
+    writes, so a user always reads their own changes.
+    """
+
+    def __init__(self, flush_interval: float = USER_WRITE_INTERVAL, batch_size: int = USER_WRITE_BATCH):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # user_id -> ("upsert", record) or ("language", language)
+        self.pending = {}
+        self._flush_task = None
+        self._flush_now = None
+        self._flushing = None
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.pending
+
+    def put(self, user_id: int, record: dict):
+        self.pending[user_id] = ("upsert", dict(record))
+        self._schedule()
+
+    def put_language(self, user_id: int, language: str):
+        kind, value = self.pending.get(user_id, (None, None))
+        if kind == "upsert":
+            self.pending[user_id] = ("upsert", dict(value, language=language or 'en'))
+        else:
+            self.pending[user_id] = ("language", language)
+        self._schedule()
+
+    def overlay(self, user_id: int, user):
+        """`user` as read from the cache or database, with pending writes applied."""
+        kind, value = self.pending.get(user_id, (None, None))
+        if kind == "upsert":
+            return dict(value)
+        if kind == "language" and user is not None:
+            return dict(user, language=value or 'en')
+        return user
+
+    def _schedule(self):
+        loop = asyncio.get_running_loop()
+        if self._flush_task is None or self._flush_task.done() or self._flush_task.get_loop() is not loop:
+            self._flush_now = asyncio.Event()
+            self._flush_task = loop.create_task(self._flush_loop())
+        if len(self.pending) >= self.batch_size:
+            self._flush_now.set()
+
+    async def _flush_loop(self):
+        while self.pending:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write everything pending now.
+
+        A flush already in progress is awaited first, so on return every
+        write queued before the call is in the database.
+        """
+        loop = asyncio.get_running_loop()
+        while self._flushing is not None and not self._flushing.done() and self._flushing.get_loop() is loop:
+            await asyncio.shield(self._flushing)
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        self._flushing = asyncio.ensure_future(self._write(batch))
+        await asyncio.shield(self._flushing)
+
+    async def _write(self, batch: dict):
+        upserts = [(user_id, value) for user_id, (kind, value) in batch.items() if kind == "upsert"]
+        languages = [(user_id, value) for user_id, (kind, value) in batch.items() if kind == "language"]
+        try:
+            await save_user_writes(upserts, languages)
+        except BaseException as e:
+            # Keep what failed unless a newer write replaced it meanwhile
+            for user_id, write in batch.items():
+                self.pending.setdefault(user_id, write)
+            if not isinstance(e, Exception):
+                raise
+            logging.error(f"Failed to write {len(batch)} user settings: {e}")
+
+    async def close(self):
+        if self._flush_task is not None and self._flush_task.get_loop() is asyncio.get_running_loop():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+user_writes = UserWriteBuffer()
+
+async def _flush_pending_users(user_id: int = None):
+    """Make queued user writes visible to a query on the users table."""
+    if user_writes.pending and (user_id is None or user_id in user_writes):
+        await user_writes.flush()
 
 async def get_user(user_id: int):
-    async with aiosqlite.connect(DB_NAME) as db:
-        async with db.execute('SELECT income_day, savings_percent, language, monthly_income FROM users WHERE user_id = ?', (user_id,)) as cursor:
-            row = await cursor.fetchone()
-            if row:
-                lang = row[2] if row[2] else 'en'
-                # Handle missing monthly_income (if it's somehow NULL or we didn't migrate properly but here defaulting to 0 is safe usually)
-                monthly_income = row[3] if len(row) > 3 and row[3] is not None else 0
-                return {
-                    "income_day": row[0], 
-                    "savings_percent": row[1], 
-                    "language": lang,
-                    "monthly_income": monthly_income
-                }
-            return None
+    cached = user_cache.get(user_id)
+    if cached is not user_cache.MISSING:
+        user = dict(cached) if cached is not None else None
+    else:
+        epoch = user_cache.epoch
+        user = await _fetch_user(user_id)
+        user_cache.set(user_id, user, epoch)
+        user = dict(user) if user is not None else None
+    if user_id in user_writes:
+        return user_writes.overlay(user_id, user)
+    return user
+
+def get_cache_stats() -> dict:
+    return user_cache.stats()
+
+@timed(DB_SECONDS, "get_user")
+async def _fetch_user(user_id: int):
+    return await user_storage.fetch_user(user_id)
+
+USER_COLUMNS = ("user_id", "income_day", "savings_percent", "language", "monthly_income")
+USER_CHUNK_SIZE = 500
+
+async def iter_users(columns=("user_id",), chunk_size: int = USER_CHUNK_SIZE):
+    """Stream users in user_id order, `chunk_size` rows per query.
+
+    Yields tuples of the requested `columns`. Uses keyset pagination, so
+    memory stays constant and the first rows arrive before the scan ends.
+    """
+    columns = tuple(columns)
+    unknown = set(columns) - set(USER_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown user columns: {sorted(unknown)}")
+
+    await _flush_pending_users()
+    start = time.perf_counter()
+    async for rows in user_storage.iter_user_chunks(columns, chunk_size):
+        DB_SECONDS.observe(time.perf_counter() - start, "iter_users")
+        for row in rows:
+            yield row[1:]
+        start = time.perf_counter()
 
 async def get_all_users():
-    async with aiosqlite.connect(DB_NAME) as db:
-        async with db.execute('SELECT user_id FROM users') as cursor:
-            rows = await cursor.fetchall()
-            return [row[0] for row in rows]
+    return [user_id async for (user_id,) in iter_users()]
+
+@timed(DB_SECONDS)
+async def update_user_reminder(user_id: int, timezone: str, reminder_time: str, next_reminder_at: int):
+    await _flush_pending_users(user_id)
+    await user_storage.update_reminder(user_id, timezone, reminder_time, next_reminder_at)
+
+@timed(DB_SECONDS)
+async def get_user_reminder(user_id: int):
+    await _flush_pending_users(user_id)
+    row = await user_storage.get_reminder(user_id)
+    if row:
+        return {
+            "timezone": row[0] or DEFAULT_TIMEZONE,
+            "reminder_time": row[1] or DEFAULT_REMINDER_TIME
+        }
+    return None
+
+@timed(DB_SECONDS)
+async def fetch_unscheduled_reminders(limit: int = USER_CHUNK_SIZE):
+    """Users that have no next_reminder_at yet (new or pre-migration rows)."""
+    await _flush_pending_users()
+    rows = await user_storage.unscheduled_reminders(limit)
+    return [(row[0], row[1] or DEFAULT_TIMEZONE, row[2] or DEFAULT_REMINDER_TIME) for row in rows]
+
+@timed(DB_SECONDS)
+async def claim_due_reminders(now_ts: int, next_at, limit: int = USER_CHUNK_SIZE, partition: int = 0, partitions: int = 1):
+    """Users whose next reminder is at or before `now_ts`, oldest first.
+
+    They are moved to `next_at(timezone, reminder_time)` in the same
+    transaction, so each due user is claimed by exactly one caller. With
+    `partitions` > 1 only users with user_id % partitions == partition
+    are considered, so replicas can split a tick between them.
+    """
+    rows = await user_storage.claim_due_reminders(
+        now_ts, limit, partition, partitions, lambda row: next_at(*_reminder_row(row)[2:]))
+    return [_reminder_row(row) for row in rows]
+
+def _reminder_row(row):
+    return row[0], row[1] or 'en', row[2] or DEFAULT_TIMEZONE, row[3] or DEFAULT_REMINDER_TIME
+
+@timed(DB_SECONDS)
+async def reschedule_reminders(schedule):
+    """Apply (user_id, next_reminder_at) pairs in one transaction."""
+    await user_storage.reschedule_reminders(schedule)
+
+@timed(DB_SECONDS)
+async def load_fsm_record(key: str):
+    async with _read() as db:
+        async with db.execute('SELECT state, data FROM fsm_storage WHERE key = ?', (key,)) as cursor:
+            return await cursor.fetchone()
+
+@timed(DB_SECONDS)
+async def save_fsm_records(upserts, deletes=()):
+    """Write (key, state, data, updated_at) rows and delete keys in one transaction."""
+    async with _write() as db:
+        if upserts:
+            await db.executemany('''
+                INSERT INTO fsm_storage (key, state, data, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    state = excluded.state,
+                    data = excluded.data,
+                    updated_at = excluded.updated_at
+            ''', upserts)
+        if deletes:
+            await db.executemany('DELETE FROM fsm_storage WHERE key = ?', [(key,) for key in deletes])
+        await db.commit()
+
+@timed(DB_SECONDS)
+async def delete_expired_fsm_records(cutoff: int) -> int:
+    async with _write() as db:
+        cursor = await db.execute('DELETE FROM fsm_storage WHERE updated_at < ?', (cutoff,))
+        await db.commit()
+        return cursor.rowcount
+
+async def _upsert_lease(db, name: str, owner: str, now_ts: int, ttl: int) -> bool:
+    cursor = await db.execute('''
+        INSERT INTO job_leases (name, owner, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            owner = excluded.owner,
+            expires_at = excluded.expires_at
+        WHERE job_leases.expires_at <= ? OR job_leases.owner = excluded.owner
+    ''', (name, owner, now_ts + ttl, now_ts))
+    await db.commit()
+    return cursor.rowcount == 1
+
+async def _delete_expired_leases(db, now_ts: int) -> int:
+    cursor = await db.execute('DELETE FROM job_leases WHERE expires_at <= ?', (now_ts,))
+    await db.commit()
+    return cursor.rowcount
+
+@timed(DB_SECONDS)
+async def try_acquire_lease(name: str, owner: str, now_ts: int, ttl: int) -> bool:
+    """Take (or extend our own) lease `name` unless another owner holds a live one.
+
+    For jobs over DB_PATH (ledger maintenance); reminder jobs lease through
+    try_acquire_users_lease.
+    """
+    async with _write() as db:
+        return await _upsert_lease(db, name, owner, now_ts, ttl)
+
+async def _release_lease(db, name: str, owner: str):
+    await db.execute('DELETE FROM job_leases WHERE name = ? AND owner = ?', (name, owner))
+    await db.commit()
+
+@timed(DB_SECONDS)
+async def release_lease(name: str, owner: str):
+    async with _write() as db:
+        await _release_lease(db, name, owner)
+
+@timed(DB_SECONDS)
+async def delete_expired_leases(now_ts: int) -> int:
+    async with _write() as db:
+        return await _delete_expired_leases(db, now_ts)
+
+@timed(DB_SECONDS)
+async def try_acquire_users_lease(name: str, owner: str, now_ts: int, ttl: int) -> bool:
+    """try_acquire_lease for jobs over the users table, kept in its storage."""
+    return await user_storage.try_acquire_lease(name, owner, now_ts, ttl)
+
+@timed(DB_SECONDS)
+async def release_users_lease(name: str, owner: str):
+    await user_storage.release_lease(name, owner)
+
+@timed(DB_SECONDS)
+async def delete_expired_users_leases(now_ts: int) -> int:
+    return await user_storage.delete_expired_leases(now_ts)
+
+LEDGER_COLUMNS = (
+    "cycle_start", "cycle_end", "spent", "earned", "tx_count",
+    "balance", "day", "day_spent", "day_start_balance"
+)
+
+async def _latest_ledger_row(db, user_id: int, today: str):
+    # By today rather than by the cycle the income day gives: after a payday
+    # change the running cycle may have started later than that
+    async with db.execute(f'''
+        SELECT {", ".join(LEDGER_COLUMNS)} FROM ledger_cycles
+        WHERE user_id = ? AND cycle_start <= ?
+        ORDER BY cycle_start DESC LIMIT 1
+    ''', (user_id, today)) as cursor:
+        row = await cursor.fetchone()
+        return dict(zip(LEDGER_COLUMNS, row)) if row else None
+
+def roll_ledger_state(row, cycle_start: str, cycle_end: str, today: str) -> dict:
+    """State of the current cycle on `today`, given the latest stored row.
+
+    Starts a new cycle (carrying the balance over) or a new day as needed,
+    without touching the database. `cycle_start`/`cycle_end` are the cycle
+    the current income day gives; if the running cycle started on another
+    day (the income day changed), it now ends on the new income date, and a
+    new cycle never starts before the previous one ended.
+    """
+    if row is None:
+        return {
+            "cycle_start": cycle_start, "cycle_end": cycle_end, "spent": 0.0, "earned": 0.0,
+            "tx_count": 0, "balance": None, "day": today, "day_spent": 0.0, "day_start_balance": None
+        }
+    if row["cycle_end"] <= today:
+        return {
+            "cycle_start": max(cycle_start, row["cycle_end"]), "cycle_end": cycle_end, "spent": 0.0,
+            "earned": 0.0, "tx_count": 0, "balance": row["balance"], "day": today, "day_spent": 0.0,
+            "day_start_balance": row["balance"]
+        }
+    if row["cycle_start"] != cycle_start:
+        row = dict(row, cycle_end=cycle_end)
+    if row["day"] != today:
+        return dict(row, day=today, day_spent=0.0, day_start_balance=row["balance"])
+    return dict(row)
+
+@timed(DB_SECONDS)
+async def get_ledger_state(user_id: int, cycle_start: str, cycle_end: str, today: str) -> dict:
+    """Current cycle aggregate for a user: one indexed row read."""
+    async with _read() as db:
+        row = await _latest_ledger_row(db, user_id, today)
+    return roll_ledger_state(row, cycle_start, cycle_end, today)
+
+async def _save_ledger_state(db, user_id: int, state: dict):
+    await db.execute('''
+        INSERT INTO ledger_cycles (user_id, cycle_start, cycle_end, balance, day, day_spent, day_start_balance)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, cycle_start) DO UPDATE SET
+            cycle_end = excluded.cycle_end,
+            balance = excluded.balance,
+            day = excluded.day,
+            day_spent = excluded.day_spent,
+            day_start_balance = excluded.day_start_balance
+    ''', (user_id, state["cycle_start"], state["cycle_end"], state["balance"],
+          state["day"], state["day_spent"], state["day_start_balance"]))
+
+@asynccontextmanager
+async def _immediate(db):
+    await db.execute('BEGIN IMMEDIATE')
+    try:
+        yield db
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+
+@asynccontextmanager
+async def transaction():
+    """Writer connection inside BEGIN IMMEDIATE; commits on success.
+
+    IMMEDIATE takes the write lock up front, so read-modify-write done
+    inside is safe against other processes too.
+    """
+    async with _write() as db:
+        async with _immediate(db):
+            yield db
+
+async def insert_transactions(db, user_id: int, transactions):
+    """Insert (day, amount, description, fingerprint) rows on an open transaction."""
+    now_ts = int(time.time())
+    await db.executemany(
+        'INSERT INTO transactions (user_id, day, amount, description, fingerprint, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+        [(user_id, day, amount, description, fingerprint, now_ts) for day, amount, description, fingerprint in transactions]
+    )
+
+async def existing_fingerprints(db, user_id: int, fingerprints) -> set:
+    """Which of `fingerprints` are already stored for the user."""
+    found = set()
+    fingerprints = list(fingerprints)
+    # Stay well below SQLite's bound parameter limit
+    for i in range(0, len(fingerprints), 500):
+        chunk = fingerprints[i:i + 500]
+        async with db.execute(
+            f'SELECT fingerprint FROM transactions WHERE user_id = ? AND fingerprint IN ({", ".join("?" * len(chunk))})',
+            (user_id, *chunk)
+        ) as cursor:
+            found.update(row[0] for row in await cursor.fetchall())
+    return found
+
+async def _stored_cycles(db, user_id: int):
+    async with db.execute(
+        'SELECT cycle_start, cycle_end FROM ledger_cycles WHERE user_id = ? ORDER BY cycle_start', (user_id,)
+    ) as cursor:
+        return await cursor.fetchall()
+
+def place_in_cycles(day: str, income_day: int, stored) -> tuple:
+    """(cycle_start, cycle_end) that `day` counts towards.
+
+    `stored` are the user's cycles, sorted. A day inside one of them belongs
+    to it; any other day gets the cycle `income_day` gives it, cut short
+    where it would overlap a stored one (the income day changed since).
+    """
+    i = bisect_right(stored, day, key=lambda cycle: cycle[0]) - 1
+    if i >= 0 and day < stored[i][1]:
+        return tuple(stored[i])
+    start, end = (bound.isoformat() for bound in cycle_bounds(date.fromisoformat(day), income_day))
+    if i >= 0:
+        start = max(start, stored[i][1])
+    if i + 1 < len(stored):
+        end = min(end, stored[i + 1][0])
+    return start, end
+
+async def add_cycle_totals(db, user_id: int, day_totals, income_day: int):
+    """Fold (day, spent, earned, count) increments into the cycles they belong to."""
+    stored = await _stored_cycles(db, user_id)
+    cycle_totals = {}
+    for day, spent, earned, count in day_totals:
+        total = cycle_totals.setdefault(place_in_cycles(day, income_day, stored), [0.0, 0.0, 0])
+        total[0] += spent
+        total[1] += earned
+        total[2] += count
+    await db.executemany('''
+        INSERT INTO ledger_cycles (user_id, cycle_start, cycle_end, spent, earned, tx_count)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, cycle_start) DO UPDATE SET
+            spent = spent + excluded.spent,
+            earned = earned + excluded.earned,
+            tx_count = tx_count + excluded.tx_count
+    ''', [(user_id, start, end, spent, earned, count) for (start, end), (spent, earned, count) in cycle_totals.items()])
+
+async def add_rollup_totals(db, user_id: int, day_totals=(), week_totals=()):
+    """Add (day, spent, earned, count) and (week_start, spent, earned, count) increments."""
+    await db.executemany('''
+        INSERT INTO ledger_days (user_id, day, spent, earned, tx_count) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, day) DO UPDATE SET
+            spent = spent + excluded.spent,
+            earned = earned + excluded.earned,
+            tx_count = tx_count + excluded.tx_count
+    ''', [(user_id, *row) for row in day_totals])
+    await db.executemany('''
+        INSERT INTO ledger_weeks (user_id, week_start, spent, earned, tx_count) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, week_start) DO UPDATE SET
+            spent = spent + excluded.spent,
+            earned = earned + excluded.earned,
+            tx_count = tx_count + excluded.tx_count
+    ''', [(user_id, *row) for row in week_totals])
+
+async def _save_day_start_balance(db, user_id: int, state: dict):
+    if state["day_start_balance"] is None:
+        return
+    await db.execute('''
+        INSERT INTO ledger_days (user_id, day, start_balance) VALUES (?, ?, ?)
+        ON CONFLICT(user_id, day) DO UPDATE SET start_balance = excluded.start_balance
+    ''', (user_id, state["day"], state["day_start_balance"]))
+
+@timed(DB_SECONDS)
+async def add_transactions(user_id: int, transactions, income_day: int, cycle_start: str, cycle_end: str,
+                           today: str, day_spent: float = 0, balance_change: float = 0,
+                           day_totals=(), week_totals=()) -> dict:
+    """Insert transactions and fold them into the aggregates atomically.
+
+    `transactions` are (day, amount, description) rows, `day_totals` and
+    `week_totals` are (day or week_start, spent, earned, count) increments
+    for the rollups; the cycle totals follow from the day totals.
+    `day_spent` and `balance_change` apply to the current cycle's running
+    state. Returns the new current state.
+    """
+    async with transaction() as db:
+        await insert_transactions(db, user_id, [(day, amount, description, None) for day, amount, description in transactions])
+        state = roll_ledger_state(await _latest_ledger_row(db, user_id, today), cycle_start, cycle_end, today)
+        if state["balance"] is not None:
+            state["balance"] += balance_change
+        state["day_spent"] += day_spent
+        await _save_ledger_state(db, user_id, state)
+        await _save_day_start_balance(db, user_id, state)
+        await add_cycle_totals(db, user_id, day_totals, income_day)
+        await add_rollup_totals(db, user_id, day_totals, week_totals)
+        state = roll_ledger_state(await _latest_ledger_row(db, user_id, today), cycle_start, cycle_end, today)
+    return state
+
+@timed(DB_SECONDS)
+async def set_ledger_balance(user_id: int, balance: float, cycle_start: str, cycle_end: str, today: str) -> dict:
+    """Re-anchor the running balance to what the user reported.
+
+    A repeated report that changes nothing is answered from a reader, so it
+    does not take the write lock.
+    """
+    state = await get_ledger_state(user_id, cycle_start, cycle_end, today)
+    if state["day"] == today and state["balance"] == balance \
+            and state["day_start_balance"] == balance and state["day_spent"] == 0:
+        return state
+    async with transaction() as db:
+        state = roll_ledger_state(await _latest_ledger_row(db, user_id, today), cycle_start, cycle_end, today)
+        state.update(balance=balance, day_start_balance=balance, day_spent=0.0)
+        await _save_ledger_state(db, user_id, state)
+        await _save_day_start_balance(db, user_id, state)
+    return state
+
+DAY_ROLLUP_COLUMNS = ("day", "spent", "earned", "tx_count", "start_balance")
+WEEK_ROLLUP_COLUMNS = ("week_start", "spent", "earned", "tx_count")
+
+@timed(DB_SECONDS)
+async def get_day_rollups(user_id: int, start: str, end: str):
+    """Daily rollups with start <= day < end, oldest first."""
+    async with _read() as db:
+        async with db.execute(f'''
+            SELECT {", ".join(DAY_ROLLUP_COLUMNS)} FROM ledger_days
+            WHERE user_id = ? AND day >= ? AND day < ? ORDER BY day
+        ''', (user_id, start, end)) as cursor:
+            return [dict(zip(DAY_ROLLUP_COLUMNS, row)) for row in await cursor.fetchall()]
+
+@timed(DB_SECONDS)
+async def get_week_rollups(user_id: int, start: str, end: str):
+    """Weekly rollups with start <= week_start < end, oldest first."""
+    async with _read() as db:
+        async with db.execute(f'''
+            SELECT {", ".join(WEEK_ROLLUP_COLUMNS)} FROM ledger_weeks
+            WHERE user_id = ? AND week_start >= ? AND week_start < ? ORDER BY week_start
+        ''', (user_id, start, end)) as cursor:
+            return [dict(zip(WEEK_ROLLUP_COLUMNS, row)) for row in await cursor.fetchall()]
+
+@timed(DB_SECONDS)
+async def get_recent_cycles(user_id: int, before: str, limit: int):
+    """The last `limit` cycles that started before `before`, newest first."""
+    async with _read() as db:
+        async with db.execute('''
+            SELECT cycle_start, cycle_end, spent, earned, tx_count FROM ledger_cycles
+            WHERE user_id = ? AND cycle_start < ? ORDER BY cycle_start DESC LIMIT ?
+        ''', (user_id, before, limit)) as cursor:
+            return [dict(zip(("cycle_start", "cycle_end", "spent", "earned", "tx_count"), row))
+                    for row in await cursor.fetchall()]
+
+async def _rebuild_rollups(db, since: str = ""):
+    """Recompute the rollups from raw transactions for days >= `since`.
+
+    Weeks are then re-summed from the daily rows, so a week cut by `since`
+    stays complete. Days before compaction have no raw rows left, so only
+    rebuild a range that is still covered by transactions.
+    """
+    await db.execute('''
+        UPDATE ledger_days SET spent = 0, earned = 0, tx_count = 0 WHERE day >= ?
+    ''', (since,))
+    await db.execute('''
+        INSERT INTO ledger_days (user_id, day, spent, earned, tx_count)
+        SELECT user_id, day,
+               SUM(CASE WHEN amount < 0 THEN -amount ELSE 0 END),
+               SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END),
+               COUNT(*)
+        FROM transactions WHERE day >= ? GROUP BY user_id, day
+        ON CONFLICT(user_id, day) DO UPDATE SET
+            spent = excluded.spent, earned = excluded.earned, tx_count = excluded.tx_count
+    ''', (since,))
+    # SQLite's 'weekday 0' is the next Sunday (or the day itself): minus six is Monday
+    await db.execute('''
+        DELETE FROM ledger_weeks WHERE week_start >= date(?, 'weekday 0', '-6 days')
+    ''', (since or "0001-01-01",))
+    await db.execute('''
+        INSERT INTO ledger_weeks (user_id, week_start, spent, earned, tx_count)
+        SELECT user_id, date(day, 'weekday 0', '-6 days') AS week, SUM(spent), SUM(earned), SUM(tx_count)
+        FROM ledger_days WHERE day >= date(?, 'weekday 0', '-6 days') GROUP BY user_id, week
+    ''', (since or "0001-01-01",))
+
+@timed(DB_SECONDS)
+async def rebuild_rollups(since: str = "") -> None:
+    """Repair the /history and /stats rollups from raw transactions."""
+    async with transaction() as db:
+        await _rebuild_rollups(db, since)
+
+@timed(DB_SECONDS)
+async def compact_ledger(before: str) -> int:
+    """Drop raw transactions of cycles that ended before `before`.
+
+    The cycle rows already hold their totals and are kept as summaries.
+    Returns the number of deleted transactions.
+    """
+    async with _write() as db:
+        cursor = await db.execute('''
+            DELETE FROM transactions WHERE id IN (
+                SELECT t.id FROM ledger_cycles c
+                JOIN transactions t ON t.user_id = c.user_id
+                    AND t.day >= c.cycle_start AND t.day < c.cycle_end
+                WHERE c.cycle_end <= ? AND c.compacted = 0
+            )
+        ''', (before,))
+        deleted = cursor.rowcount
+        await db.execute('UPDATE ledger_cycles SET compacted = 1 WHERE cycle_end <= ? AND compacted = 0', (before,))
+        await db.commit()
+        return deleted
+
+class SQLiteUserStorage(UserStorage):
+    """Users table in SQLite: DB_PATH through the shared pool, or its own file."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._pool = None
+
+    async def open(self):
+        if self.path is not None and self._pool is None:
+            pool = ConnectionPool(self.path, readers=1)
+            await pool.open()
+            self._pool = pool
+
+    async def close(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await pool.close()
+
+    @asynccontextmanager
+    async def _read(self):
+        if self.path is None:
+            async with _read() as db:
+                yield db
+        elif self._pool is None:
+            async with aiosqlite.connect(self.path) as db:
+                yield db
+        else:
+            async with self._pool.reader() as db:
+                yield db
+
+    @asynccontextmanager
+    async def _write(self):
+        if self.path is None:
+            async with _write() as db:
+                yield db
+        elif self._pool is None:
+            async with aiosqlite.connect(self.path) as db:
+                yield db
+        else:
+            async with self._pool.writer() as db:
+                yield db
+
+    async def migrate(self) -> int:
+        # DB_PATH itself is migrated by init_db()
+        if self.path is None:
+            return 0
+        async with aiosqlite.connect(self.path) as db:
+            return await migrate_sqlite(db)
+
+    async def fetch_user(self, user_id: int):
+        async with self._read() as db:
+            async with db.execute('SELECT income_day, savings_percent, language, monthly_income FROM users WHERE user_id = ?', (user_id,)) as cursor:
+                return user_record(await cursor.fetchone())
+
+    async def save_users(self, upserts, languages):
+        async with self._write() as db, _immediate(db):
+            await db.executemany('''
+                INSERT INTO users (user_id, income_day, savings_percent, language, monthly_income)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    income_day = excluded.income_day,
+                    savings_percent = excluded.savings_percent,
+                    language = excluded.language,
+                    monthly_income = excluded.monthly_income
+            ''', [(user_id, r["income_day"], r["savings_percent"], r["language"], r["monthly_income"])
+                  for user_id, r in upserts])
+            await db.executemany('UPDATE users SET language = ? WHERE user_id = ?',
+                                 [(language, user_id) for user_id, language in languages])
+
+    async def users_after(self, columns, after_id: int, limit: int):
+        # A reader per chunk, so a slow consumer does not hold one
+        async with self._read() as db:
+            async with db.execute(
+                f'SELECT user_id, {", ".join(columns)} FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?',
+                (after_id, limit)
+            ) as cursor:
+                return await cursor.fetchall()
+
+    async def get_reminder(self, user_id: int):
+        async with self._read() as db:
+            async with db.execute('SELECT timezone, reminder_time FROM users WHERE user_id = ?', (user_id,)) as cursor:
+                return await cursor.fetchone()
+
+    async def update_reminder(self, user_id: int, timezone: str, reminder_time: str, next_reminder_at: int):
+        async with self._write() as db:
+            await db.execute('''
+                UPDATE users SET timezone = ?, reminder_time = ?, next_reminder_at = ? WHERE user_id = ?
+            ''', (timezone, reminder_time, next_reminder_at, user_id))
+            await db.commit()
+
+    async def unscheduled_reminders(self, limit: int):
+        async with self._read() as db:
+            async with db.execute('''
+                SELECT user_id, timezone, reminder_time FROM users
+                WHERE next_reminder_at IS NULL LIMIT ?
+            ''', (limit,)) as cursor:
+                return await cursor.fetchall()
+
+    async def claim_due_reminders(self, now_ts: int, limit: int, partition: int, partitions: int, next_slot):
+        # IMMEDIATE: no other process can read the same due rows before we move them
+        async with self._write() as db, _immediate(db):
+            async with db.execute('''
+                SELECT user_id, language, timezone, reminder_time FROM users
+                WHERE next_reminder_at <= ? AND user_id % ? = ?
+                ORDER BY next_reminder_at LIMIT ?
+            ''', (now_ts, partitions, partition, limit)) as cursor:
+                rows = await cursor.fetchall()
+            await db.executemany('UPDATE users SET next_reminder_at = ? WHERE user_id = ?',
+                                 [(next_slot(row), row[0]) for row in rows])
+        return rows
+
+    async def reschedule_reminders(self, schedule):
+        async with self._write() as db:
+            await db.executemany(
+                'UPDATE users SET next_reminder_at = ? WHERE user_id = ?',
+                [(next_at, user_id) for user_id, next_at in schedule]
+            )
+            await db.commit()
+
+    async def copy_users(self, rows):
+        columns = ", ".join(USER_COPY_COLUMNS)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in USER_COPY_COLUMNS[1:])
+        async with self._write() as db, _immediate(db):
+            await db.executemany(f'''
+                INSERT INTO users ({columns}) VALUES ({", ".join("?" * len(USER_COPY_COLUMNS))})
+                ON CONFLICT(user_id) DO UPDATE SET {updates}
+            ''', rows)
+
+    async def try_acquire_lease(self, name: str, owner: str, now_ts: int, ttl: int) -> bool:
+        async with self._write() as db:
+            return await _upsert_lease(db, name, owner, now_ts, ttl)
+
+    async def release_lease(self, name: str, owner: str):
+        async with self._write() as db:
+            await _release_lease(db, name, owner)
+
+    async def delete_expired_leases(self, now_ts: int) -> int:
+        async with self._write() as db:
+            return await _delete_expired_leases(db, now_ts)
+
+def create_user_storage(url: str = "") -> UserStorage:
+    """Storage for a DATABASE_URL-style location (see DATABASE_URL)."""
+    if url.startswith(("postgres://", "postgresql://")):
+        from pg_storage import PostgresUserStorage
+        return PostgresUserStorage(url)
+    if url and not url.startswith("sqlite:"):
+        raise ValueError(f"Unsupported database URL: {url}")
+    return SQLiteUserStorage(url.removeprefix("sqlite:") or None)
+
+user_storage = create_user_storage(DATABASE_URL)
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from db import load_fsm_record, save_fsm_records, delete_expired_fsm_records
+
+# Abandoned wizard flows are dropped after this many seconds
+FSM_TTL = int(os.getenv("FSM_TTL", str(7 * 24 * 3600)))
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "0.5"))
+FSM_BATCH_SIZE = int(os.getenv("FSM_BATCH_SIZE", "200"))
+# How long an in-memory copy is trusted without re-reading SQLite. Keep it
+# at 0 when several processes serve the same users.
+FSM_HOT_TTL = float(os.getenv("FSM_HOT_TTL", "60"))
+FSM_HOT_SIZE = int(os.getenv("FSM_HOT_SIZE", "10000"))
+EXPIRE_INTERVAL = 300
+
+
+def storage_key(key: StorageKey) -> str:
+    return ":".join(str(part) if part is not None else "" for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id,
+        key.business_connection_id, key.destiny
+    ))
+
+
+class _Record:
+    __slots__ = ("state", "data", "loaded_at", "touched_at")
+
+    def __init__(self, state, data, now):
+        self.state = state
+        self.data = data
+        self.loaded_at = now
+        self.touched_at = now
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage kept in the bot's SQLite file.
+
+    Reads are served from a bounded in-memory tier. Writes land in that tier
+    and are flushed in batches every `flush_interval` seconds (or as soon as
+    `batch_size` keys are dirty), so a wizard step does not cost a commit.
+
+    When several processes share the database, pass `write_through=True`
+    (and `hot_ttl=0`): every write then reaches SQLite before set_state /
+    set_data return, so the next step is seen by whichever process gets it.
+    """
+
+    def __init__(self, ttl: int = FSM_TTL, flush_interval: float = FSM_FLUSH_INTERVAL,
+                 batch_size: int = FSM_BATCH_SIZE, hot_ttl: float = FSM_HOT_TTL,
+                 hot_size: int = FSM_HOT_SIZE, write_through: bool = False, clock=time.time):
+        self.ttl = ttl
+        self.write_through = write_through
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.hot_ttl = hot_ttl
+        self.hot_size = hot_size
+        self._clock = clock
+        self._hot = OrderedDict()
+        self._dirty = set()
+        self._flush_task = None
+        self._flush_now = None
+        self._last_expire = clock()
+
+    async def _record(self, key: StorageKey) -> _Record:
+        k = storage_key(key)
+        now = self._clock()
+        rec = self._hot.get(k)
+        if rec is not None and (k in self._dirty or now - rec.loaded_at < self.hot_ttl):
+            self._hot.move_to_end(k)
+            return rec
+
+        row = await load_fsm_record(k)
+        # A write for this key may have landed while we were reading
+        rec = self._hot.get(k)
+        if rec is not None and k in self._dirty:
+            return rec
+        if row is not None:
+            rec = _Record(row[0], json.loads(row[1]) if row[1] else {}, now)
+        else:
+            rec = _Record(None, {}, now)
+        self._hot[k] = rec
+        self._trim()
+        return rec
+
+    def _trim(self):
+        if len(self._hot) <= self.hot_size:
+            return
+        for k in list(self._hot):
+            if len(self._hot) <= self.hot_size:
+                break
+            if k not in self._dirty:
+                del self._hot[k]
+
+    def _mark_dirty(self, key: StorageKey, rec: _Record):
+        k = storage_key(key)
+        rec.touched_at = self._clock()
+        self._hot[k] = rec
+        self._dirty.add(k)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_now = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        if len(self._dirty) >= self.batch_size:
+            self._flush_now.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+            if self._clock() - self._last_expire >= EXPIRE_INTERVAL:
+                await self.expire()
+
+    async def flush(self):
+        """Write every dirty key to SQLite in one transaction."""
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        upserts, deletes = [], []
+        for k in keys:
+            rec = self._hot.get(k)
+            if rec is None:
+                continue
+            if rec.state is None and not rec.data:
+                deletes.append(k)
+            else:
+                upserts.append((k, rec.state, json.dumps(rec.data), int(rec.touched_at)))
+        try:
+            await save_fsm_records(upserts, deletes)
+        except asyncio.CancelledError:
+            self._dirty |= keys
+            raise
+        except Exception as e:
+            logging.error(f"Failed to flush FSM storage: {e}")
+            self._dirty |= keys
+
+    async def expire(self):
+        """Forget flows that have not been touched for `ttl` seconds."""
+        self._last_expire = now = self._clock()
+        cutoff = now - self.ttl
+        for k in [k for k, rec in self._hot.items() if rec.touched_at < cutoff and k not in self._dirty]:
+            del self._hot[k]
+        try:
+            await delete_expired_fsm_records(int(cutoff))
+        except Exception as e:
+            logging.error(f"Failed to expire FSM storage: {e}")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        rec = await self._record(key)
+        rec.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, rec)
+        if self.write_through:
+            await self.flush()
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        rec = await self._record(key)
+        rec.data = dict(data)
+        self._mark_dirty(key, rec)
+        if self.write_through:
+            await self.flush()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._record(key)).data)
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
@@ -0,0 +1,279 @@
+"""Bank statement (CSV) import.
+
+The file is streamed to a spooled temp file, then pushed through a chain of
+generators (decode -> csv -> normalize -> fingerprint -> batch) and written
+with executemany, one transaction per batch. Every stage holds at most one
+chunk or batch, so memory stays flat regardless of the statement size.
+"""
+import asyncio
+import codecs
+import csv
+import hashlib
+import itertools
+import os
+import re
+import sqlite3
+import tempfile
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import date, datetime
+
+from db import transaction, insert_transactions, existing_fingerprints, add_cycle_totals, add_rollup_totals
+from ledger import LedgerTotals
+
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(20 * 1024 * 1024)))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+CHUNK_SIZE = 64 * 1024
+
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d", "%d.%m.%y", "%m/%d/%Y")
+DATE_HEADERS = ("date", "дата")
+AMOUNT_HEADERS = ("amount", "sum", "сумма")
+DEBIT_HEADERS = ("debit", "withdrawal", "расход", "списание")
+CREDIT_HEADERS = ("credit", "deposit", "приход", "поступление", "зачисление")
+DESCRIPTION_HEADERS = ("description", "details", "payee", "memo", "merchant", "описание", "назначение", "комментарий", "получатель")
+
+
+class StatementError(Exception):
+    pass
+
+
+@dataclass
+class ImportStats:
+    imported: int = 0
+    duplicates: int = 0
+    skipped: int = 0
+
+
+def read_chunks(fileobj, chunk_size: int = CHUNK_SIZE):
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def decode_lines(chunks):
+    """Bytes chunks -> text lines. UTF-8 (with or without BOM), else cp1251."""
+    chunks = iter(chunks)
+    first = next(chunks, b"")
+    try:
+        first.decode("utf-8-sig")
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut at the chunk boundary is still UTF-8
+        encoding = "utf-8-sig" if e.start >= len(first) - 3 else "cp1251"
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+
+    tail = ""
+    for chunk in itertools.chain((first,), chunks):
+        text = tail + decoder.decode(chunk)
+        lines = text.splitlines(keepends=True)
+        # The last piece may be an incomplete line (or a \r\n cut in half)
+        tail = lines.pop() if lines and not lines[-1].endswith("\n") else ""
+        yield from lines
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def parse_csv(lines):
+    """Lines -> lists of fields; the delimiter is sniffed from the first line."""
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    delimiter = max(";,\t|", key=first.count)
+    yield from csv.reader(itertools.chain((first,), lines), delimiter=delimiter)
+
+
+_AMOUNT_JUNK = re.compile(r"[^\d,.\-+()]")
+
+
+def parse_amount(value: str):
+    """'1 234,56', '-1,234.56', '(12.50)', '−300 ₽' -> float, or None."""
+    value = value.strip().replace("−", "-")
+    if not value:
+        return None
+    value = _AMOUNT_JUNK.sub("", value)
+    negative = value.startswith("(") and value.endswith(")")
+    value = value.strip("()")
+    if "," in value and "." in value:
+        # Whichever comes last is the decimal separator
+        if value.rfind(",") > value.rfind("."):
+            value = value.replace(".", "").replace(",", ".")
+        else:
+            value = value.replace(",", "")
+    elif "," in value:
+        if re.fullmatch(r"[-+]?\d{1,3}(,\d{3})+", value):
+            value = value.replace(",", "")
+        else:
+            value = value.replace(",", ".")
+    try:
+        amount = float(value)
+    except ValueError:
+        return None
+    return -amount if negative else amount
+
+
+_date_cache = {}
+
+
+def parse_date(value: str):
+    """Common statement date formats (time part ignored) -> date, or None."""
+    value = value.strip().split(" ")[0].split("T")[0]
+    parsed = _date_cache.get(value)
+    if parsed is not None:
+        return parsed
+    for fmt in DATE_FORMATS:
+        try:
+            parsed = datetime.strptime(value, fmt).date()
+            break
+        except ValueError:
+            continue
+    else:
+        return None
+    # Statements repeat the same few hundred dates; keep the cache bounded
+    if len(_date_cache) > 4096:
+        _date_cache.clear()
+    _date_cache[value] = parsed
+    return parsed
+
+
+def _find_column(header, names):
+    for i, title in enumerate(header):
+        title = title.strip().lower()
+        if any(name in title for name in names):
+            return i
+    return None
+
+
+def normalize(rows, stats: ImportStats = None):
+    """CSV rows -> (day, amount, description); bad rows are counted and skipped."""
+    stats = stats if stats is not None else ImportStats()
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+
+    date_col = _find_column(header, DATE_HEADERS)
+    amount_col = _find_column(header, AMOUNT_HEADERS)
+    debit_col = _find_column(header, DEBIT_HEADERS)
+    credit_col = _find_column(header, CREDIT_HEADERS)
+    desc_col = _find_column(header, DESCRIPTION_HEADERS)
+    if date_col is None or (amount_col is None and debit_col is None and credit_col is None):
+        # No recognizable header: assume date, amount, description
+        date_col, amount_col, debit_col, credit_col, desc_col = 0, 1, None, None, 2
+        rows = itertools.chain((header,), rows)
+
+    for row in rows:
+        if not row:
+            continue
+        try:
+            day = parse_date(row[date_col])
+            if amount_col is not None:
+                amount = parse_amount(row[amount_col])
+            else:
+                debit = parse_amount(row[debit_col]) if debit_col is not None else None
+                credit = parse_amount(row[credit_col]) if credit_col is not None else None
+                amount = None if debit is None and credit is None else (credit or 0) - abs(debit or 0)
+            description = row[desc_col].strip() if desc_col is not None and desc_col < len(row) else ""
+        except IndexError:
+            stats.skipped += 1
+            continue
+        if day is None or amount is None or amount == 0:
+            stats.skipped += 1
+            continue
+        yield day, amount, description or None
+
+
+def fingerprint(records, chunk_size: int = IMPORT_BATCH_SIZE):
+    """Attach a stable fingerprint to each record.
+
+    Identical rows (two equal coffees) are told apart by how many times the
+    same day, amount and description were seen earlier in the file, so
+    re-importing the same statement yields the same fingerprints. Statements
+    are not always sorted by date, so the counts span the whole file; they
+    live in a temporary SQLite file rather than in memory, one chunk of
+    records at a time.
+    """
+    # "" opens a private temporary database that spills to disk past its page cache
+    with closing(sqlite3.connect("")) as seen:
+        seen.execute("CREATE TABLE seen (key TEXT PRIMARY KEY, n INTEGER NOT NULL) WITHOUT ROWID")
+        for chunk in batched(records, chunk_size):
+            keys = [f"{day}|{amount:.2f}|{description or ''}" for day, amount, description in chunk]
+            counts = _seen_counts(seen, list(set(keys)))
+            for (day, amount, description), key in zip(chunk, keys):
+                n = counts[key] = counts.get(key, 0) + 1
+                digest = hashlib.blake2b(f"{key}|{n}".encode(), digest_size=12).hexdigest()
+                yield day, amount, description, digest
+            seen.executemany("INSERT OR REPLACE INTO seen (key, n) VALUES (?, ?)", counts.items())
+
+
+def _seen_counts(seen, keys) -> dict:
+    counts = {}
+    # Stay well below SQLite's bound parameter limit
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        counts.update(seen.execute(f"SELECT key, n FROM seen WHERE key IN ({', '.join('?' * len(chunk))})", chunk))
+    return counts
+
+
+def batched(items, size: int = IMPORT_BATCH_SIZE):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def pipeline(fileobj, stats: ImportStats, batch_size: int = IMPORT_BATCH_SIZE):
+    return batched(fingerprint(normalize(parse_csv(decode_lines(read_chunks(fileobj))), stats), batch_size), batch_size)
+
+
+async def import_statement(user_id: int, user_data: dict, fileobj, batch_size: int = IMPORT_BATCH_SIZE) -> ImportStats:
+    """Import a CSV statement from a binary file object.
+
+    Each batch is committed together with its share of the aggregates, and
+    the writer is released in between so other users are not blocked by a
+    long statement. An import cut short can simply be re-run: rows already
+    committed are recognized by their fingerprints.
+
+    Imported rows do not change the running balance: the balance the user
+    reports already includes them.
+    """
+    stats = ImportStats()
+    for batch in pipeline(fileobj, stats, batch_size):
+        totals = LedgerTotals()
+        async with transaction() as db:
+            known = await existing_fingerprints(db, user_id, [record[3] for record in batch])
+            fresh = [(day.isoformat(), amount, description, fp)
+                     for day, amount, description, fp in batch if fp not in known]
+            if fresh:
+                await insert_transactions(db, user_id, fresh)
+                for day, amount, _, _ in fresh:
+                    totals.add(date.fromisoformat(day), amount)
+                await add_cycle_totals(db, user_id, totals.day_rows(), user_data['income_day'])
+                await add_rollup_totals(db, user_id, totals.day_rows(), totals.week_rows())
+        stats.duplicates += len(batch) - len(fresh)
+        stats.imported += len(fresh)
+        # Parsing is CPU work; let other handlers (and writers) run between batches
+        await asyncio.sleep(0)
+    return stats
+
+
+async def download_to_tempfile(bot, file_path: str, max_bytes: int = IMPORT_MAX_BYTES):
+    """Stream a Telegram file into a spooled temp file (in memory up to 1 MB)."""
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    size = 0
+    url = bot.session.api.file_url(bot.token, file_path)
+    async for chunk in bot.session.stream_content(url, chunk_size=CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_bytes:
+            spool.close()
+            raise StatementError("file too large")
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
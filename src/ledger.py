@@ -0,0 +1,200 @@
+import os
+from datetime import date, datetime, timedelta
+
+from db import (
+    add_transactions, get_ledger_state, set_ledger_balance, compact_ledger,
+    get_day_rollups, get_week_rollups, get_recent_cycles
+)
+from logic import calculate_budget_plan, cycle_bounds
+
+# Raw transactions older than this are folded into their cycle totals
+LEDGER_KEEP_DAYS = int(os.getenv("LEDGER_KEEP_DAYS", "400"))
+# How far back /history and /stats look by default
+HISTORY_DAYS = 14
+STATS_WEEKS = 4
+STATS_CYCLES = 3
+
+
+def cycle_of(day: date, income_day: int):
+    """(cycle_start, cycle_end) of `day` as ISO strings, the ledger's keys."""
+    start, end = cycle_bounds(day, income_day)
+    return start.isoformat(), end.isoformat()
+
+
+def week_of(day: date) -> date:
+    """Monday of the week containing `day`, the weekly rollup key."""
+    return day - timedelta(days=day.weekday())
+
+
+class LedgerTotals:
+    """Accumulates spent/earned/count per day and week for a batch of entries.
+
+    Cycle totals follow from the day totals in the database, which knows
+    which stored cycle each day belongs to.
+    """
+
+    def __init__(self):
+        self.days = {}
+        self.weeks = {}
+
+    @staticmethod
+    def _add(totals: dict, key, amount: float):
+        total = totals.setdefault(key, [0.0, 0.0, 0])
+        if amount < 0:
+            total[0] -= amount
+        else:
+            total[1] += amount
+        total[2] += 1
+
+    def add(self, day: date, amount: float):
+        self._add(self.days, day.isoformat(), amount)
+        self._add(self.weeks, week_of(day).isoformat(), amount)
+
+    def day_rows(self):
+        return [(day, spent, earned, count) for day, (spent, earned, count) in self.days.items()]
+
+    def week_rows(self):
+        return [(week, spent, earned, count) for week, (spent, earned, count) in self.weeks.items()]
+
+
+def summarize(state: dict, user_data: dict, today: date) -> dict:
+    """Turn a ledger state row into the numbers the bot shows."""
+    summary = {
+        "balance": state["balance"],
+        "day_spent": state["day_spent"],
+        "cycle_spent": state["spent"],
+        "cycle_earned": state["earned"],
+        "daily_budget": None,
+        "left_today": None,
+        "remaining": None,
+        "next_income": None,
+    }
+    if state["day_start_balance"] is None:
+        return summary
+
+    plan = calculate_budget_plan(
+        state["day_start_balance"], user_data['income_day'], user_data['savings_percent'],
+        user_data.get('monthly_income', 0), now=datetime.combine(today, datetime.min.time())
+    )
+    summary.update(
+        daily_budget=plan['daily_budget'],
+        left_today=plan['daily_budget'] - state["day_spent"],
+        remaining=state["balance"] - plan['savings_amount'],
+        next_income=plan['target_date'].date(),
+    )
+    return summary
+
+
+async def record_transactions(user_id: int, user_data: dict, entries, today: date = None,
+                              affect_balance: bool = True) -> dict:
+    """Store (day, amount, description) entries; amount < 0 is a spend.
+
+    Day and week totals are computed here and applied in the same
+    transaction as the inserts. With `affect_balance` False (e.g. imported
+    statements the reported balance already includes) the running balance
+    is untouched.
+    """
+    today = today or date.today()
+    income_day = user_data['income_day']
+    cycle_start, cycle_end = cycle_of(today, income_day)
+
+    rows = []
+    totals = LedgerTotals()
+    day_spent = 0.0
+    balance_change = 0.0
+    for day, amount, description in entries:
+        rows.append((day.isoformat(), amount, description))
+        totals.add(day, amount)
+        if affect_balance:
+            balance_change += amount
+            if day == today and amount < 0:
+                day_spent -= amount
+
+    state = await add_transactions(
+        user_id, rows, income_day, cycle_start, cycle_end, today.isoformat(), day_spent, balance_change,
+        totals.day_rows(), totals.week_rows()
+    )
+    return summarize(state, user_data, today)
+
+
+async def record_spend(user_id: int, user_data: dict, amount: float, description: str = None, today: date = None) -> dict:
+    today = today or date.today()
+    return await record_transactions(user_id, user_data, [(today, -abs(amount), description)], today)
+
+
+async def record_income(user_id: int, user_data: dict, amount: float, description: str = None, today: date = None) -> dict:
+    today = today or date.today()
+    return await record_transactions(user_id, user_data, [(today, abs(amount), description)], today)
+
+
+async def set_balance(user_id: int, user_data: dict, balance: float, today: date = None) -> dict:
+    today = today or date.today()
+    state = await set_ledger_balance(user_id, balance, *cycle_of(today, user_data['income_day']), today.isoformat())
+    return summarize(state, user_data, today)
+
+
+async def today_summary(user_id: int, user_data: dict, today: date = None) -> dict:
+    today = today or date.today()
+    state = await get_ledger_state(user_id, *cycle_of(today, user_data['income_day']), today.isoformat())
+    return summarize(state, user_data, today)
+
+
+async def compact(today: date = None) -> int:
+    today = today or date.today()
+    return await compact_ledger((today - timedelta(days=LEDGER_KEEP_DAYS)).isoformat())
+
+
+def daily_budget(start_balance: float, user_data: dict, day: date) -> float:
+    """The daily budget a day started with, from that morning's balance."""
+    return calculate_budget_plan(
+        start_balance, user_data['income_day'], user_data['savings_percent'],
+        user_data.get('monthly_income', 0), now=datetime.combine(day, datetime.min.time())
+    )['daily_budget']
+
+
+async def history(user_id: int, user_data: dict, today: date = None, days: int = HISTORY_DAYS) -> list:
+    """Spend per day for the last `days` days, newest first.
+
+    Days without activity are filled in with zeros. `budget` is None for
+    days that started without a known balance.
+    """
+    today = today or date.today()
+    start = today - timedelta(days=days - 1)
+    rows = {row["day"]: row for row in await get_day_rollups(user_id, start.isoformat(), (today + timedelta(days=1)).isoformat())}
+    result = []
+    for offset in range(days):
+        day = today - timedelta(days=offset)
+        row = rows.get(day.isoformat())
+        start_balance = row["start_balance"] if row else None
+        result.append({
+            "day": day,
+            "spent": row["spent"] if row else 0.0,
+            "earned": row["earned"] if row else 0.0,
+            "budget": daily_budget(start_balance, user_data, day) if start_balance is not None else None,
+        })
+    return result
+
+
+async def stats(user_id: int, user_data: dict, today: date = None, weeks: int = STATS_WEEKS,
+                cycles: int = STATS_CYCLES) -> dict:
+    """Weekly and per-cycle spend, read from the rollups only."""
+    today = today or date.today()
+    summary = await today_summary(user_id, user_data, today)
+    this_week = week_of(today)
+    first_week = this_week - timedelta(weeks=weeks - 1)
+    week_rows = {row["week_start"]: row for row in await get_week_rollups(
+        user_id, first_week.isoformat(), (this_week + timedelta(days=7)).isoformat())}
+
+    cycle_start, cycle_end = cycle_of(today, user_data['income_day'])
+    cycle_days = (today - date.fromisoformat(cycle_start)).days + 1
+    return {
+        "summary": summary,
+        "cycle_start": cycle_start,
+        "cycle_end": cycle_end,
+        "cycle_avg": summary["cycle_spent"] / cycle_days,
+        "weeks": [
+            {"week_start": week, "spent": week_rows[week.isoformat()]["spent"] if week.isoformat() in week_rows else 0.0}
+            for week in (this_week - timedelta(weeks=i) for i in range(weeks))
+        ],
+        "cycles": await get_recent_cycles(user_id, cycle_start, cycles),
+    }
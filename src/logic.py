@@ -1,25 +1,62 @@
 
-from datetime import datetime
+from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
 import calendar
 
-def calculate_budget_plan(current_balance: float, income_day: int, savings_percent: float, monthly_income: float = 0, now: datetime = None):
-    if now is None:
-        now = datetime.now()
-    
-    # Calculate next income date
-    if now.day < income_day:
+# Next income date per (today, income_day). There are at most 31 entries
+# per day, so the cache is simply dropped when the date rolls over.
+_income_date_cache = {}
+_income_date_cache_day = None
+
+def resolve_income_date(today: date, income_day: int) -> date:
+    global _income_date_cache_day
+    if today != _income_date_cache_day:
+        _income_date_cache.clear()
+        _income_date_cache_day = today
+    target = _income_date_cache.get(income_day)
+    if target is None:
+        target = _resolve_income_date(today, income_day)
+        _income_date_cache[income_day] = target
+    return target
+
+def _resolve_income_date(today: date, income_day: int) -> date:
+    if today.day < income_day:
         # Income is this month
         try:
-             target_date = now.replace(day=income_day)
+             return today.replace(day=income_day)
         except ValueError:
-             last_day_current = calendar.monthrange(now.year, now.month)[1]
-             target_date = now.replace(day=min(income_day, last_day_current))
+             last_day_current = calendar.monthrange(today.year, today.month)[1]
+             return today.replace(day=min(income_day, last_day_current))
     else:
         # Income is next month
-        next_month = now + relativedelta(months=1)
+        next_month = today + relativedelta(months=1)
         last_day_next = calendar.monthrange(next_month.year, next_month.month)[1]
-        target_date = next_month.replace(day=min(income_day, last_day_next))
+        return next_month.replace(day=min(income_day, last_day_next))
+
+def _income_date_in_month(year: int, month: int, income_day: int) -> date:
+    last_day = calendar.monthrange(year, month)[1]
+    return date(year, month, min(income_day, last_day))
+
+def cycle_bounds(day: date, income_day: int):
+    """(start, end) of the income cycle containing `day`.
+
+    A cycle starts on an income date (clamped to short months) and ends on
+    the next one, exclusive.
+    """
+    start = _income_date_in_month(day.year, day.month, income_day)
+    if day < start:
+        prev = day.replace(day=1) - relativedelta(months=1)
+        start = _income_date_in_month(prev.year, prev.month, income_day)
+    nxt = start.replace(day=1) + relativedelta(months=1)
+    return start, _income_date_in_month(nxt.year, nxt.month, income_day)
+
+def calculate_budget_plan(current_balance: float, income_day: int, savings_percent: float, monthly_income: float = 0, now: datetime = None):
+    if now is None:
+        now = datetime.now()
+
+    # Calculate next income date (keeps the time of day of `now`)
+    target = resolve_income_date(now.date(), income_day)
+    target_date = now.replace(year=target.year, month=target.month, day=target.day)
 
     days_remaining = (target_date - now).days
     
@@ -47,3 +84,55 @@ def calculate_budget_plan(current_balance: float, income_day: int, savings_perce
         "safe_to_spend_total": safe_to_spend_total,
         "daily_budget": daily_budget
     }
+
+def calculate_budget_plans(current_balances, income_days, savings_percents, monthly_incomes, now: datetime = None):
+    """Vectorized calculate_budget_plan for many users at one reference date.
+
+    Takes array-likes of equal length and returns a dict with the same keys
+    as calculate_budget_plan, each holding a NumPy array (target_date is
+    datetime64[D]). Results match the scalar function exactly.
+    """
+    import numpy as np
+
+    if now is None:
+        now = datetime.now()
+
+    balances = np.asarray(current_balances, dtype=np.float64)
+    days = np.asarray(income_days, dtype=np.int64)
+    percents = np.asarray(savings_percents, dtype=np.float64)
+    incomes = np.asarray(monthly_incomes, dtype=np.float64)
+    if days.size and (days.min() < 1 or days.max() > 31):
+        raise ValueError("income_days must be between 1 and 31")
+
+    # There are only 31 possible income days, so resolve each one once for
+    # this date and look the users up in the table.
+    month = np.datetime64(now.date(), 'M')
+    this_start = month.astype('datetime64[D]')
+    next_start = (month + 1).astype('datetime64[D]')
+    this_len = (next_start - this_start).astype(np.int64)
+    next_len = ((month + 2).astype('datetime64[D]') - next_start).astype(np.int64)
+
+    candidates = np.arange(32, dtype=np.int64)
+    table = np.where(
+        candidates > now.day,
+        this_start + (np.minimum(candidates, this_len) - 1),
+        next_start + (np.minimum(candidates, next_len) - 1)
+    )
+
+    target_dates = table[days]
+    days_remaining = (target_dates - np.datetime64(now.date(), 'D')).astype(np.int64)
+
+    savings_amount = incomes * (percents / 100)
+    safe_to_spend_total = balances - savings_amount
+    daily_budget = np.divide(
+        safe_to_spend_total, days_remaining,
+        out=safe_to_spend_total.copy(), where=days_remaining > 0
+    )
+
+    return {
+        "target_date": target_dates,
+        "days_remaining": days_remaining,
+        "savings_amount": savings_amount,
+        "safe_to_spend_total": safe_to_spend_total,
+        "daily_budget": daily_budget
+    }
@@ -2,9 +2,13 @@
 import asyncio
 import logging
 import os
+import signal
 import sys
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
+from contextlib import AsyncExitStack
+from datetime import date, datetime, timedelta, timezone
+
+# First, so the startup report covers the imports below
+from startup import startup_timer
 
 from aiogram import Bot, Dispatcher, html, F
 from aiogram.client.default import DefaultBotProperties
@@ -12,15 +16,36 @@ from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile
 from dotenv import load_dotenv
 
-from db import init_db, add_or_update_user, get_user, get_all_users, update_user_language
+startup_timer.mark("import aiogram")
+
+from db import (
+    init_db, open_pool, close_pool, add_or_update_user, get_user, update_user_language,
+    get_user_reminder, update_user_reminder, user_storage
+)
+from reminders import next_reminder_at, parse_reminder_time, parse_timezone
+from cluster import WORKERS, CLUSTER_CACHE_TTL, run_reminder_tick, run_daily_maintenance, run_workers
+from cache import user_cache
 from messages import get_text, MESSAGES
+from fsm_storage import SQLiteStorage
+from logic import calculate_budget_plan, cycle_bounds
+from ledger import record_spend, record_income, set_balance, today_summary, history, stats, HISTORY_DAYS
+from charts import CHARTS_ENABLED, chart_data, send_chart, png_cache, warm_up_pool as warm_up_chart_pool, shutdown_pool as shutdown_chart_pool
+from metrics import METRICS_PORT, start_metrics_server, watch_cache
+from middlewares import MetricsMiddleware, TelegramMetricsMiddleware, UserOrderingMiddleware
+# The statement importer, the profiler, the webhook server and APScheduler
+# are imported where they are first used, see warm_up()
 
 load_dotenv()
+startup_timer.mark("import bot modules")
 
 TOKEN = os.getenv("BOT_TOKEN")
+# "polling" (default) or "webhook", see webhook.py
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Telegram user ids allowed to use operator commands such as /profile
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if user_id}
 
 class Settings(StatesGroup):
     language_selection = State()
@@ -28,7 +53,15 @@ class Settings(StatesGroup):
     monthly_income = State()
     savings_percent = State()
 
-dp = Dispatcher()
+# Wizard progress survives restarts and is shared between processes
+dp = Dispatcher(storage=SQLiteStorage(hot_ttl=0, write_through=True) if WORKERS > 1 else SQLiteStorage())
+# One user's updates in order (the wizard reads and writes the same state),
+# different users in parallel
+dp.update.outer_middleware(UserOrderingMiddleware())
+dp.message.middleware(MetricsMiddleware())
+dp.callback_query.middleware(MetricsMiddleware())
+watch_cache("users", user_cache)
+watch_cache("charts", png_cache)
 
 def get_language_keyboard():
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -128,6 +161,246 @@ async def command_settings_handler(message: Message, state: FSMContext) -> None:
     await state.set_state(Settings.income_day)
     await state.update_data(language=lang)
 
+@dp.message(Command("timezone"))
+async def command_timezone_handler(message: Message) -> None:
+    user_data = await get_user(message.from_user.id)
+    if not user_data:
+        await message.answer(get_text("start_first", "en"))
+        return
+    lang = user_data.get('language', 'en')
+    reminder = await get_user_reminder(message.from_user.id)
+
+    args = message.text.split()
+    tz_name = parse_timezone(args[1]) if len(args) > 1 else None
+    if not tz_name:
+        await message.answer(get_text("timezone_usage", lang, timezone=reminder['timezone']), parse_mode=ParseMode.HTML)
+        return
+
+    await save_reminder(message.from_user.id, tz_name, reminder['reminder_time'])
+    await message.answer(get_text("timezone_set", lang, timezone=tz_name, reminder_time=reminder['reminder_time']))
+
+@dp.message(Command("reminder"))
+async def command_reminder_handler(message: Message) -> None:
+    user_data = await get_user(message.from_user.id)
+    if not user_data:
+        await message.answer(get_text("start_first", "en"))
+        return
+    lang = user_data.get('language', 'en')
+    reminder = await get_user_reminder(message.from_user.id)
+
+    args = message.text.split()
+    reminder_time = parse_reminder_time(args[1]) if len(args) > 1 else None
+    if not reminder_time:
+        await message.answer(get_text("reminder_usage", lang, reminder_time=reminder['reminder_time']), parse_mode=ParseMode.HTML)
+        return
+
+    await save_reminder(message.from_user.id, reminder['timezone'], reminder_time)
+    await message.answer(get_text("reminder_set", lang, timezone=reminder['timezone'], reminder_time=reminder_time))
+
+async def save_reminder(user_id: int, tz_name: str, reminder_time: str):
+    next_at = next_reminder_at(tz_name, reminder_time, datetime.now(timezone.utc))
+    await update_user_reminder(user_id, tz_name, reminder_time, next_at)
+
+def parse_amount_args(text: str):
+    """'/spend 250 coffee' -> (250.0, 'coffee'); None if there is no positive amount."""
+    parts = text.split(maxsplit=2)
+    if len(parts) < 2:
+        return None
+    try:
+        amount = float(parts[1].replace(',', '.'))
+    except ValueError:
+        return None
+    if amount <= 0:
+        return None
+    return amount, parts[2] if len(parts) > 2 else None
+
+def format_ledger_reply(key: str, lang: str, amount: float, summary: dict) -> str:
+    if summary['left_today'] is None:
+        return get_text(key, lang, amount=f"{amount:.2f}") + "\n" + get_text("no_balance_yet", lang)
+    return get_text(key, lang, amount=f"{amount:.2f}") + "\n" + get_text("left_today", lang,
+        day_spent=f"{summary['day_spent']:.2f}",
+        left_today=f"{summary['left_today']:.2f}"
+    )
+
+@dp.message(Command("spend", "income"))
+async def command_transaction_handler(message: Message) -> None:
+    user_data = await get_user(message.from_user.id)
+    if not user_data:
+        await message.answer(get_text("start_first", "en"))
+        return
+    lang = user_data.get('language', 'en')
+    is_spend = message.text.split()[0].lstrip('/').split('@')[0] == "spend"
+
+    parsed = parse_amount_args(message.text)
+    if not parsed:
+        await message.answer(get_text("spend_usage" if is_spend else "income_usage", lang))
+        return
+
+    amount, note = parsed
+    if is_spend:
+        summary = await record_spend(message.from_user.id, user_data, amount, note)
+    else:
+        summary = await record_income(message.from_user.id, user_data, amount, note)
+    await message.answer(format_ledger_reply("spend_logged" if is_spend else "income_logged", lang, amount, summary))
+
+@dp.message(Command("today"))
+async def command_today_handler(message: Message) -> None:
+    user_data = await get_user(message.from_user.id)
+    if not user_data:
+        await message.answer(get_text("start_first", "en"))
+        return
+    lang = user_data.get('language', 'en')
+
+    summary = await today_summary(message.from_user.id, user_data)
+    if summary['left_today'] is None:
+        await message.answer(get_text("no_balance_yet", lang))
+        return
+    await message.answer(get_text("today_summary", lang,
+        day_spent=f"{summary['day_spent']:.2f}",
+        left_today=f"{summary['left_today']:.2f}",
+        daily_budget=f"{summary['daily_budget']:.2f}",
+        cycle_spent=f"{summary['cycle_spent']:.2f}",
+        remaining=f"{summary['remaining']:.2f}",
+        next_income=summary['next_income'].strftime('%Y-%m-%d')
+    ), parse_mode=ParseMode.HTML)
+
+# Longest range /history accepts
+MAX_HISTORY_DAYS = 31
+
+@dp.message(Command("history"))
+async def command_history_handler(message: Message) -> None:
+    user_data = await get_user(message.from_user.id)
+    if not user_data:
+        await message.answer(get_text("start_first", "en"))
+        return
+    lang = user_data.get('language', 'en')
+
+    args = message.text.split()
+    days = HISTORY_DAYS
+    if len(args) > 1:
+        days = int(args[1]) if args[1].isdigit() else 0
+        if not 1 <= days <= MAX_HISTORY_DAYS:
+            await message.answer(get_text("history_usage", lang, max_days=MAX_HISTORY_DAYS))
+            return
+
+    rows = await history(message.from_user.id, user_data, days=days)
+    if not any(row['spent'] or row['earned'] or row['budget'] is not None for row in rows):
+        await message.answer(get_text("no_history", lang))
+        return
+
+    lines = [get_text("history_title", lang, days=days)]
+    for row in rows:
+        if row['budget'] is None:
+            lines.append(get_text("history_line_no_budget", lang, day=row['day'].strftime('%d.%m'), spent=f"{row['spent']:.2f}"))
+        else:
+            lines.append(get_text("history_line", lang,
+                mark="✅" if row['spent'] <= row['budget'] else "⚠️",
+                day=row['day'].strftime('%d.%m'),
+                spent=f"{row['spent']:.2f}",
+                budget=f"{row['budget']:.2f}"
+            ))
+    await message.answer("\n".join(lines), parse_mode=ParseMode.HTML)
+
+@dp.message(Command("stats"))
+async def command_stats_handler(message: Message) -> None:
+    user_data = await get_user(message.from_user.id)
+    if not user_data:
+        await message.answer(get_text("start_first", "en"))
+        return
+    lang = user_data.get('language', 'en')
+
+    report = await stats(message.from_user.id, user_data)
+    summary = report['summary']
+    if not summary['cycle_spent'] and not summary['cycle_earned'] and not report['cycles'] \
+            and not any(week['spent'] for week in report['weeks']):
+        await message.answer(get_text("no_history", lang))
+        return
+
+    lines = [get_text("stats_cycle", lang,
+        cycle_start=report['cycle_start'],
+        cycle_end=report['cycle_end'],
+        cycle_spent=f"{summary['cycle_spent']:.2f}",
+        cycle_earned=f"{summary['cycle_earned']:.2f}",
+        cycle_avg=f"{report['cycle_avg']:.2f}"
+    )]
+    if summary['daily_budget'] is not None:
+        lines.append(get_text("stats_daily_budget", lang, daily_budget=f"{summary['daily_budget']:.2f}"))
+    lines += ["", get_text("stats_weeks", lang)]
+    lines += [get_text("stats_week_line", lang, week_start=week['week_start'].strftime('%d.%m'), spent=f"{week['spent']:.2f}")
+              for week in report['weeks']]
+    if report['cycles']:
+        lines += ["", get_text("stats_cycles", lang)]
+        lines += [get_text("stats_cycle_line", lang,
+                      cycle_start=cycle['cycle_start'], cycle_end=cycle['cycle_end'],
+                      spent=f"{cycle['spent']:.2f}", earned=f"{cycle['earned']:.2f}")
+                  for cycle in report['cycles']]
+    await message.answer("\n".join(lines), parse_mode=ParseMode.HTML)
+
+@dp.message(Command("profile"), F.from_user.id.in_(ADMIN_IDS))
+async def command_profile_handler(message: Message) -> None:
+    """/profile start [interval_ms] | stop | status; profiles this worker process only."""
+    from profiler import profiler
+    args = message.text.split()
+    action = args[1] if len(args) > 1 else "status"
+
+    if action == "start":
+        if len(args) > 2:
+            try:
+                profiler.interval = max(0.001, float(args[2]) / 1000)
+            except ValueError:
+                await message.answer("Usage: /profile start [interval_ms]")
+                return
+        profiler.start()
+        await message.answer(f"Profiling pid {os.getpid()} every {profiler.interval * 1000:g} ms "
+                             f"for up to {profiler.max_seconds:g} s. Send /profile stop for the report.")
+    elif action == "stop":
+        profiler.stop()
+        if not profiler.samples:
+            await message.answer("No samples collected.")
+            return
+        lines = [f"{profiler.samples} samples in {profiler.duration:.1f} s", "own   total  function"]
+        lines += [f"{own:5d} {total:6d}  {name}" for name, own, total in profiler.top()]
+        await message.answer(f"<pre>{html.quote(chr(10).join(lines))}</pre>", parse_mode=ParseMode.HTML)
+        await message.answer_document(BufferedInputFile(profiler.collapsed().encode(), filename="profile.collapsed.txt"))
+    else:
+        state = "running" if profiler.running else "stopped"
+        await message.answer(f"Profiler {state} in pid {os.getpid()}, {profiler.samples} samples.")
+
+@dp.message(F.document)
+async def document_import_handler(message: Message, bot: Bot) -> None:
+    from importer import IMPORT_MAX_BYTES, StatementError, download_to_tempfile, import_statement
+    user_data = await get_user(message.from_user.id)
+    if not user_data:
+        await message.answer(get_text("start_first", "en"))
+        return
+    lang = user_data.get('language', 'en')
+    max_mb = f"{IMPORT_MAX_BYTES / (1024 * 1024):g}"
+
+    document = message.document
+    if not (document.file_name or "").lower().endswith((".csv", ".txt")):
+        await message.answer(get_text("import_not_csv", lang))
+        return
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await message.answer(get_text("import_too_large", lang, max_mb=max_mb))
+        return
+
+    await message.answer(get_text("import_started", lang))
+    try:
+        file = await bot.get_file(document.file_id)
+        spool = await download_to_tempfile(bot, file.file_path)
+        with spool:
+            stats = await import_statement(message.from_user.id, user_data, spool)
+    except StatementError:
+        await message.answer(get_text("import_too_large", lang, max_mb=max_mb))
+        return
+    except Exception as e:
+        logging.error(f"Statement import failed for {message.from_user.id}: {e}")
+        await message.answer(get_text("import_failed", lang))
+        return
+
+    await message.answer(get_text("import_done", lang,
+        imported=stats.imported, duplicates=stats.duplicates, skipped=stats.skipped))
+
 @dp.message(Settings.income_day)
 async def process_income_day(message: Message, state: FSMContext) -> None:
     data = await state.get_data()
@@ -187,7 +460,7 @@ async def process_savings_percent(message: Message, state: FSMContext) -> None:
 
 @dp.message()
 async def calculate_budget_message(message: Message) -> None:
-    if message.text.startswith('/'): return
+    if not message.text or message.text.startswith('/'): return
     
     user_data = await get_user(message.from_user.id)
     if not user_data:
@@ -216,9 +489,9 @@ async def run_calculation(message: Message, user_data: dict, current_balance: fl
         # "Settings incomplete" message handles it.
         return
 
-    from logic import calculate_budget_plan
-    
     plan = calculate_budget_plan(current_balance, income_day, savings_percent, monthly_income)
+    # The reported balance becomes the starting point for /spend and /today
+    await set_balance(message.from_user.id, user_data, current_balance)
     
     response = get_text("financial_plan", lang,
         next_income=plan['target_date'].strftime('%Y-%m-%d'),
@@ -231,29 +504,101 @@ async def run_calculation(message: Message, user_data: dict, current_balance: fl
     )
 
     await message.answer(response, parse_mode=ParseMode.HTML)
+    if CHARTS_ENABLED:
+        await send_budget_chart(message, user_data, plan, lang)
+
+async def send_budget_chart(message: Message, user_data: dict, plan: dict, lang: str):
+    today = date.today()
+    cycle_start, _ = cycle_bounds(today, user_data['income_day'])
+    rows = await history(message.from_user.id, user_data, today, days=(today - cycle_start).days + 1)
+    labels = {name: get_text(f"chart_{name}", lang) for name in ("title", "spent", "daily_budget", "remaining")}
+    data = chart_data(plan, today, cycle_start, {row['day']: row['spent'] for row in rows}, labels)
+    try:
+        await send_chart(message, data)
+    except Exception as e:
+        # The text plan has already been sent; the chart is a bonus
+        logging.error(f"Failed to send budget chart to {message.from_user.id}: {e}")
 
-# Scheduler
-async def send_daily_reminders(bot: Bot):
-    users = await get_all_users()
-    for user_id in users:
-        try:
-            user_data = await get_user(user_id)
-            lang = user_data.get('language', 'en') if user_data else 'en'
-            await bot.send_message(user_id, get_text("reminder", lang))
-        except Exception as e:
-            logging.error(f"Failed to send reminder to {user_id}: {e}")
-
-async def main() -> None:
-    await init_db()
+async def warm_up(bot: Bot, worker_index: int, started: AsyncExitStack) -> None:
+    """Start what the first updates do not need, once the bot is serving.
+
+    Everything started here registers its shutdown on `started`.
+    """
+    try:
+        with startup_timer.phase("scheduler"):
+            from apscheduler.schedulers.asyncio import AsyncIOScheduler
+            scheduler = AsyncIOScheduler()
+            # Every minute, send to the users whose local reminder time has come.
+            # Every worker runs the tick; leases split the users between them.
+            scheduler.add_job(run_reminder_tick, 'cron', minute='*', args=[bot, worker_index, WORKERS], max_instances=1, coalesce=True)
+            scheduler.add_job(run_daily_maintenance, 'cron', hour=3, minute=30, args=[worker_index], coalesce=True)
+            scheduler.start()
+            started.callback(scheduler.shutdown, wait=False)
+
+        if METRICS_PORT:
+            with startup_timer.phase("metrics server"):
+                # One endpoint per worker process, on consecutive ports
+                runner = await start_metrics_server(port=METRICS_PORT + worker_index)
+                started.push_async_callback(runner.cleanup)
+
+        with startup_timer.phase("lazy imports"):
+            import importer, profiler  # noqa: F401
+        if CHARTS_ENABLED:
+            # Spawning the render processes and loading matplotlib takes about
+            # a second; better now than on the first budget calculation.
+            with startup_timer.phase("chart pool"):
+                await warm_up_chart_pool()
+        startup_timer.report("Warmed up")
+    except Exception:
+        logging.exception("Background warm-up failed")
+
+async def main(worker_index: int = 0) -> None:
+    with startup_timer.phase("init_db"):
+        await init_db()
+    with startup_timer.phase("open_pool"):
+        await open_pool()
+    if WORKERS > 1 or user_storage.shared:
+        user_cache.ttl = min(user_cache.ttl, CLUSTER_CACHE_TTL)
     bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    
-    from apscheduler.schedulers.asyncio import AsyncIOScheduler
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(send_daily_reminders, 'cron', hour=11, minute=0, args=[bot])
-    scheduler.start()
+    bot.session.middleware(TelegramMetricsMiddleware())
+
+    # Serve as soon as the database is ready; the rest starts meanwhile
+    background = AsyncExitStack()
+    warming = asyncio.create_task(warm_up(bot, worker_index, background))
+    startup_timer.report("Serving")
 
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == "webhook":
+            from webhook import serve_webhook
+            await serve_webhook(dp, bot, reuse_port=WORKERS > 1)
+        elif worker_index == 0:
+            await dp.start_polling(bot)
+        else:
+            # Telegram allows a single getUpdates consumer, so the other
+            # workers only take their share of the scheduled jobs.
+            stop = asyncio.Event()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+            await stop.wait()
+    finally:
+        warming.cancel()
+        await asyncio.gather(warming, return_exceptions=True)
+        await background.aclose()
+        shutdown_chart_pool()
+        from profiler import profiler
+        profiler.stop()
+        await dp.storage.close()
+        await close_pool()
+        await bot.session.close()
+
+def run_worker(worker_index: int) -> None:
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    asyncio.run(main(worker_index))
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
-    asyncio.run(main())
+    if BOT_MODE == "webhook":
+        from webhook import set_webhook
+        with startup_timer.phase("set_webhook"):
+            asyncio.run(set_webhook(TOKEN, dp.resolve_used_update_types(), WORKERS))
+    run_workers(WORKERS, run_worker)
@@ -1,3 +1,5 @@
+import string
+
 MESSAGES = {
     "en": {
         "welcome_back": "Hello, <b>{name}</b>! Welcome back. Send me your current balance to calculate your daily budget.",
@@ -25,16 +27,56 @@ MESSAGES = {
             "/balance &lt;amount&gt; - Calculate budget for a specific balance\n"
             "/settings - Change your settings\n"
             "/language - Change language / Сменить язык\n"
+            "/spend &lt;amount&gt; [note] - Log an expense\n"
+            "/income &lt;amount&gt; [note] - Log an income\n"
+            "/today - How much is left for today\n"
+            "/history [days] - Daily spending against the budget\n"
+            "/stats - Weekly and per-cycle spending\n"
+            "/timezone &lt;zone&gt; - Set your time zone, e.g. Europe/London\n"
+            "/reminder &lt;HH:MM&gt; - Set the daily reminder time\n"
+            "Send a .csv bank statement to import its transactions\n"
             "/help - Show this help message"
         ),
         "provide_balance_args": "Please provide a valid number, e.g., /balance 1000",
         "provide_balance": "Please provide your balance, e.g., /balance 1000",
         "invalid_format": "Invalid format.",
         "reminder": "Good morning! ☀️\nWhat is your current balance today? Send it to me to update your budget.",
+        "timezone_usage": "Your time zone is <b>{timezone}</b>.\nTo change it, send e.g. /timezone Europe/London",
+        "timezone_set": "Time zone set to {timezone}. I will remind you daily at {reminder_time}.",
+        "reminder_usage": "I remind you daily at <b>{reminder_time}</b>.\nTo change it, send e.g. /reminder 09:30",
+        "reminder_set": "Done! I will remind you daily at {reminder_time} ({timezone}).",
         "choose_language": "Please choose your language / Пожалуйста, выберите язык:",
         "language_set": "Language set to English.",
         "btn_en": "🇬🇧 English",
-        "btn_ru": "🇷🇺 Русский"
+        "btn_ru": "🇷🇺 Русский",
+        "spend_usage": "Please provide an amount, e.g., /spend 250 coffee",
+        "income_usage": "Please provide an amount, e.g., /income 5000 salary",
+        "spend_logged": "✅ Spent {amount}.",
+        "income_logged": "✅ Income {amount} added.",
+        "left_today": "Spent today: {day_spent}. Left for today: {left_today}",
+        "no_balance_yet": "Send me your current balance first, then I can track what is left for today.",
+        "import_started": "Importing your statement…",
+        "import_done": "Statement imported: {imported} new transactions, {duplicates} already known, {skipped} rows skipped.",
+        "import_failed": "Sorry, I could not read this file. Please send a CSV export from your bank.",
+        "import_not_csv": "Please send your bank statement as a .csv file.",
+        "import_too_large": "This file is too large. Please send a statement under {max_mb} MB.",
+        "history_title": "🗓 <b>Spending, last {days} days</b>",
+        "history_line": "{mark} {day}: {spent} of {budget}",
+        "history_line_no_budget": "▫️ {day}: {spent}",
+        "history_usage": "Usage: /history [days], up to {max_days} days.",
+        "no_history": "No transactions yet. Log one with /spend or send a CSV statement.",
+        "stats_cycle": "📊 <b>This cycle</b> ({cycle_start} – {cycle_end})\nSpent: {cycle_spent}\nEarned: {cycle_earned}\nAverage per day: {cycle_avg}",
+        "stats_daily_budget": "Daily budget: {daily_budget}",
+        "stats_weeks": "<b>By week</b>",
+        "stats_week_line": "Week of {week_start}: {spent}",
+        "stats_cycles": "<b>Previous cycles</b>",
+        "stats_cycle_line": "{cycle_start} – {cycle_end}: spent {spent}, earned {earned}",
+        "slow_down": "You are sending messages faster than I can process them. Please wait a moment.",
+        "chart_title": "Budget until next income",
+        "chart_spent": "Spent per day",
+        "chart_daily_budget": "Daily budget",
+        "chart_remaining": "Safe to spend left",
+        "today_summary": "📅 <b>Today</b>\nDaily Budget: {daily_budget}\nSpent Today: {day_spent}\n<b>Left for Today: {left_today}</b>\nSpent This Cycle: {cycle_spent}\nAvailable until {next_income}: {remaining}"
     },
     "ru": {
         "welcome_back": "Привет, <b>{name}</b>! С возвращением. Отправь мне текущий баланс, чтобы рассчитать дневной бюджет.",
@@ -62,23 +104,102 @@ MESSAGES = {
             "/balance &lt;сумма&gt; - Рассчитать бюджет для конкретной суммы\n"
             "/settings - Изменить настройки\n"
             "/language - Change language / Сменить язык\n"
+            "/spend &lt;сумма&gt; [заметка] - Записать расход\n"
+            "/income &lt;сумма&gt; [заметка] - Записать доход\n"
+            "/today - Сколько осталось на сегодня\n"
+            "/history [дней] - Расходы по дням против бюджета\n"
+            "/stats - Расходы по неделям и периодам\n"
+            "/timezone &lt;пояс&gt; - Указать часовой пояс, например Europe/Moscow\n"
+            "/reminder &lt;ЧЧ:ММ&gt; - Время ежедневного напоминания\n"
+            "Отправь выписку в .csv, чтобы импортировать операции\n"
             "/help - Показать это сообщение"
         ),
         "provide_balance_args": "Пожалуйста, укажи число, например, /balance 1000",
         "provide_balance": "Пожалуйста, укажи баланс, например, /balance 1000",
         "invalid_format": "Неверный формат.",
         "reminder": "Доброе утро! ☀️\nКакой у тебя сегодня баланс? Отправь его мне, чтобы обновить бюджет.",
+        "timezone_usage": "Твой часовой пояс: <b>{timezone}</b>.\nЧтобы изменить, отправь, например, /timezone Europe/Moscow",
+        "timezone_set": "Часовой пояс установлен: {timezone}. Буду напоминать каждый день в {reminder_time}.",
+        "reminder_usage": "Я напоминаю каждый день в <b>{reminder_time}</b>.\nЧтобы изменить, отправь, например, /reminder 09:30",
+        "reminder_set": "Готово! Буду напоминать каждый день в {reminder_time} ({timezone}).",
         "choose_language": "Please choose your language / Пожалуйста, выберите язык:",
         "language_set": "Язык установлен на Русский.",
         "btn_en": "🇬🇧 English",
-        "btn_ru": "🇷🇺 Русский"
+        "btn_ru": "🇷🇺 Русский",
+        "spend_usage": "Пожалуйста, укажи сумму, например, /spend 250 кофе",
+        "income_usage": "Пожалуйста, укажи сумму, например, /income 5000 зарплата",
+        "spend_logged": "✅ Расход {amount} записан.",
+        "income_logged": "✅ Доход {amount} добавлен.",
+        "left_today": "Потрачено сегодня: {day_spent}. Осталось на сегодня: {left_today}",
+        "no_balance_yet": "Сначала отправь мне текущий баланс, тогда я смогу считать, сколько осталось на сегодня.",
+        "import_started": "Импортирую выписку…",
+        "import_done": "Выписка загружена: новых операций {imported}, уже известных {duplicates}, пропущено строк {skipped}.",
+        "import_failed": "Не удалось прочитать файл. Пожалуйста, отправь CSV-выгрузку из банка.",
+        "import_not_csv": "Пожалуйста, отправь выписку в формате .csv.",
+        "import_too_large": "Файл слишком большой. Пожалуйста, отправь выписку до {max_mb} МБ.",
+        "history_title": "🗓 <b>Расходы за {days} дн.</b>",
+        "history_line": "{mark} {day}: {spent} из {budget}",
+        "history_line_no_budget": "▫️ {day}: {spent}",
+        "history_usage": "Использование: /history [дней], не больше {max_days}.",
+        "no_history": "Операций пока нет. Запиши расход через /spend или отправь выписку в CSV.",
+        "stats_cycle": "📊 <b>Текущий период</b> ({cycle_start} – {cycle_end})\nПотрачено: {cycle_spent}\nПолучено: {cycle_earned}\nВ среднем в день: {cycle_avg}",
+        "stats_daily_budget": "Дневной бюджет: {daily_budget}",
+        "stats_weeks": "<b>По неделям</b>",
+        "stats_week_line": "Неделя с {week_start}: {spent}",
+        "stats_cycles": "<b>Прошлые периоды</b>",
+        "stats_cycle_line": "{cycle_start} – {cycle_end}: потрачено {spent}, получено {earned}",
+        "slow_down": "Ты отправляешь сообщения быстрее, чем я успеваю их обработать. Подожди немного.",
+        "chart_title": "Бюджет до следующего дохода",
+        "chart_spent": "Расходы по дням",
+        "chart_daily_budget": "Дневной бюджет",
+        "chart_remaining": "Осталось потратить",
+        "today_summary": "📅 <b>Сегодня</b>\nДневной бюджет: {daily_budget}\nПотрачено сегодня: {day_spent}\n<b>Осталось на сегодня: {left_today}</b>\nПотрачено за период: {cycle_spent}\nДоступно до {next_income}: {remaining}"
     }
 }
 
+class Template:
+    """A message pre-split into literal text and field names.
+
+    Rendering is a single join instead of re-parsing the format string on
+    every call. Templates with conversions or format specs fall back to
+    str.format.
+    """
+    __slots__ = ("text", "parts", "simple")
+
+    def __init__(self, text: str):
+        self.text = text
+        parsed = list(string.Formatter().parse(text))
+        self.simple = all(
+            field.isidentifier() and not spec and not conv
+            for _, field, spec, conv in parsed if field is not None
+        )
+        self.parts = [(literal, field) for literal, field, _, _ in parsed]
+
+    def render(self, **kwargs) -> str:
+        if not kwargs:
+            return self.text
+        if not self.simple:
+            return self.text.format(**kwargs)
+        return "".join([
+            literal if field is None else literal + str(kwargs[field])
+            for literal, field in self.parts
+        ])
+
+def compile_templates(messages: dict = MESSAGES) -> dict:
+    """Build {lang: {key: Template}}, filling gaps from English."""
+    default = messages["en"]
+    return {
+        lang: {key: Template(texts[key] if key in texts else default[key]) for key in set(default) | set(texts)}
+        for lang, texts in messages.items()
+    }
+
+TEMPLATES = compile_templates()
+
 def get_text(key: str, lang: str = "en", **kwargs) -> str:
     """Get localized text."""
-    lang_dict = MESSAGES.get(lang, MESSAGES["en"])
-    text = lang_dict.get(key, MESSAGES["en"].get(key, key))
-    if kwargs:
-        return text.format(**kwargs)
-    return text
+    templates = TEMPLATES.get(lang, TEMPLATES["en"])
+    template = templates.get(key)
+    if template is None:
+        text = key
+        return text.format(**kwargs) if kwargs else text
+    return template.render(**kwargs)
@@ -0,0 +1,201 @@
+"""In-process metrics in the Prometheus text format.
+
+Counters, gauges and histograms keyed by label values, a timing decorator
+for coroutines, and a small aiohttp server exposing /metrics. Every worker
+process keeps its own registry and listens on METRICS_PORT + its index.
+"""
+import functools
+import logging
+import os
+import time
+from bisect import bisect_left
+
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+# 0 disables the endpoint
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Seconds; from a cached lookup up to a slow Telegram call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels) -> float:
+        return self.values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield self.name + _labels(self.labelnames, labels), value
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self.values = {}
+
+    def observe(self, value: float, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def count(self, *labels) -> int:
+        entry = self.values.get(labels)
+        return entry[2] if entry else 0
+
+    def samples(self):
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                yield self.name + "_bucket" + _labels(self.labelnames, labels, f'le="{_number(bound)}"'), cumulative
+            yield self.name + "_sum" + _labels(self.labelnames, labels), total
+            yield self.name + "_count" + _labels(self.labelnames, labels), count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._collectors = []
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def on_collect(self, callback):
+        """Call `callback()` before every scrape, e.g. to refresh gauges."""
+        self._collectors.append(callback)
+        return callback
+
+    def render(self) -> str:
+        for callback in self._collectors:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"Metrics collector {callback.__name__} failed: {e}")
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name} {_number(value)}" for name, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.register(Histogram(
+    "bot_handler_seconds", "Time spent in update handlers.", ("handler",)))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    "bot_handler_errors_total", "Update handlers that raised.", ("handler", "error")))
+DB_SECONDS = REGISTRY.register(Histogram(
+    "bot_db_seconds", "Time spent in database calls.", ("operation",)))
+TELEGRAM_SECONDS = REGISTRY.register(Histogram(
+    "bot_telegram_request_seconds", "Telegram Bot API request latency.", ("method",)))
+TELEGRAM_ERRORS = REGISTRY.register(Counter(
+    "bot_telegram_errors_total", "Failed Telegram Bot API requests.", ("method", "error")))
+UPDATES_DROPPED = REGISTRY.register(Counter(
+    "bot_updates_dropped_total", "Updates dropped before reaching a handler.", ("reason",)))
+BROADCAST_MESSAGES = REGISTRY.register(Counter(
+    "bot_broadcast_messages_total", "Broadcast (reminder) deliveries.", ("status",)))
+CACHE_ENTRIES = REGISTRY.register(Gauge(
+    "bot_cache_entries", "Entries in an in-process cache.", ("cache",)))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "bot_cache_requests_total", "Cache lookups.", ("cache", "result")))
+CACHE_EVICTIONS = REGISTRY.register(Counter(
+    "bot_cache_evictions_total", "Entries dropped to stay within a cache's size bound.", ("cache",)))
+
+
+def timed(histogram: Histogram, label: str = None):
+    """Decorator recording the duration of a coroutine function in `histogram`."""
+    def decorator(func):
+        name = label or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, name)
+        return wrapper
+    return decorator
+
+
+def _catch_up(counter: Counter, total: float, *labels):
+    """Advance `counter` to a running total kept elsewhere."""
+    counter.inc(*labels, amount=max(0, total - counter.get(*labels)))
+
+
+def watch_cache(name: str, cache):
+    """Export an LRUCache's size, hit/miss and eviction counts on every scrape."""
+    def collect():
+        stats = cache.stats()
+        CACHE_ENTRIES.set(stats["size"], name)
+        _catch_up(CACHE_REQUESTS, stats["hits"], name, "hit")
+        _catch_up(CACHE_REQUESTS, stats["misses"], name, "miss")
+        _catch_up(CACHE_EVICTIONS, stats["evictions"], name)
+    collect.__name__ = f"watch_cache_{name}"
+    REGISTRY.on_collect(collect)
+
+
+async def metrics_handler(request):
+    from aiohttp import web
+    return web.Response(body=REGISTRY.render().encode(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Serve GET /metrics in the background; call `runner.cleanup()` to stop."""
+    # aiohttp.web is only needed with METRICS_PORT set
+    from aiohttp import web
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, handle_signals=False, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Metrics on http://{host}:{port}/metrics (pid {os.getpid()})")
+    return runner
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import os
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from messages import get_text, MESSAGES
+from metrics import HANDLER_SECONDS, HANDLER_ERRORS, TELEGRAM_SECONDS, TELEGRAM_ERRORS, UPDATES_DROPPED
+
+# Updates one user may have queued or running before further ones are dropped
+USER_QUEUE_SIZE = int(os.getenv("USER_QUEUE_SIZE", "10"))
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Inner middleware recording latency and errors per handler function."""
+
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__ if "handler" in data else type(event).__name__
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, name)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware recording Bot API latency and errors per method."""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - start, name)
+
+
+class _Lane:
+    __slots__ = ("lock", "pending", "notified")
+
+    def __init__(self):
+        # asyncio.Lock wakes its waiters in arrival order
+        self.lock = asyncio.Lock()
+        self.pending = 0
+        self.notified = False
+
+
+class UserOrderingMiddleware(BaseMiddleware):
+    """Outer update middleware: one user's updates run one at a time, in order.
+
+    Different users still run concurrently. A user with `max_queue` updates
+    already queued or running gets further updates dropped (and one notice
+    per flood), so a flood cannot pile up unbounded tasks. Ordering holds
+    within one process, like the FSM hot tier.
+
+    If the update comes with a `concurrency_limit` semaphore (webhook mode),
+    a permit is taken only once it is the update's turn in its lane, so the
+    queued updates of one busy user do not hold permits others could use.
+    """
+
+    def __init__(self, max_queue: int = USER_QUEUE_SIZE):
+        self.max_queue = max_queue
+        self.lanes = {}
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None:
+            return await self._run(handler, event, data)
+
+        lane = self.lanes.get(user.id)
+        if lane is None:
+            lane = self.lanes[user.id] = _Lane()
+        if lane.pending >= self.max_queue:
+            UPDATES_DROPPED.inc("user_queue_full")
+            if not lane.notified:
+                lane.notified = True
+                await self._notify(data, user)
+            return None
+
+        lane.pending += 1
+        try:
+            async with lane.lock:
+                return await self._run(handler, event, data)
+        finally:
+            lane.pending -= 1
+            if lane.pending == 0:
+                del self.lanes[user.id]
+
+    @staticmethod
+    async def _run(handler, event, data):
+        limit = data.get("concurrency_limit")
+        if limit is None:
+            return await handler(event, data)
+        async with limit:
+            return await handler(event, data)
+
+    async def _notify(self, data, user):
+        chat = data.get("event_chat")
+        bot = data.get("bot")
+        if chat is None or bot is None:
+            return
+        lang = user.language_code if user.language_code in MESSAGES else "en"
+        try:
+            await bot.send_message(chat.id, get_text("slow_down", lang))
+        except Exception as e:
+            logging.warning(f"Could not send slow down notice to {user.id}: {e}")
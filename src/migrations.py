@@ -0,0 +1,202 @@
+"""Versioned schema migrations.
+
+SQLite keeps its version in `PRAGMA user_version`, Postgres in the
+schema_migrations table. Only migrations newer than the stored version run,
+each in its own transaction.
+
+Databases created before versioning start at version 0 but already have
+some of the schema, so the SQLite steps only add what is missing.
+"""
+import logging
+
+
+async def _columns(db, table: str) -> set:
+    async with db.execute(f'PRAGMA table_info({table})') as cursor:
+        return {row[1] for row in await cursor.fetchall()}
+
+
+async def _add_missing_columns(db, table: str, columns):
+    existing = await _columns(db, table)
+    for name, definition in columns:
+        if name not in existing:
+            await db.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+
+async def _users(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            income_day INTEGER NOT NULL,
+            savings_percent REAL NOT NULL,
+            language TEXT DEFAULT 'en',
+            monthly_income REAL DEFAULT 0
+        )
+    ''')
+    await _add_missing_columns(db, 'users', [('language', "TEXT DEFAULT 'en'"), ('monthly_income', 'REAL DEFAULT 0')])
+
+
+async def _reminders(db):
+    # Local time per user, next run as a UTC timestamp
+    await _add_missing_columns(db, 'users', [
+        ('timezone', 'TEXT'), ('reminder_time', 'TEXT'), ('next_reminder_at', 'INTEGER')
+    ])
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_users_next_reminder ON users (next_reminder_at)')
+
+
+async def _fsm_storage(db):
+    # FSM state of the settings wizard, see fsm_storage.py
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at INTEGER NOT NULL
+        )
+    ''')
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated ON fsm_storage (updated_at)')
+
+
+async def _job_leases(db):
+    # Leases that make a scheduled job run once across replicas, see cluster.py
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS job_leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at INTEGER NOT NULL
+        )
+    ''')
+
+
+async def _ledger(db):
+    # Raw transactions (amount < 0 is a spend) and one aggregate row per
+    # user and income cycle, kept up to date on every insert.
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            amount REAL NOT NULL,
+            description TEXT,
+            created_at INTEGER NOT NULL
+        )
+    ''')
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_transactions_user_day ON transactions (user_id, day)')
+    # Imported statement rows carry a fingerprint so re-imports are skipped
+    await _add_missing_columns(db, 'transactions', [('fingerprint', 'TEXT')])
+    await db.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_fingerprint
+        ON transactions (user_id, fingerprint) WHERE fingerprint IS NOT NULL
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_cycles (
+            user_id INTEGER NOT NULL,
+            cycle_start TEXT NOT NULL,
+            cycle_end TEXT NOT NULL,
+            spent REAL NOT NULL DEFAULT 0,
+            earned REAL NOT NULL DEFAULT 0,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            balance REAL,
+            day TEXT,
+            day_spent REAL NOT NULL DEFAULT 0,
+            day_start_balance REAL,
+            compacted INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, cycle_start)
+        )
+    ''')
+
+
+async def _ledger_rollups(db):
+    # Rollups behind /history and /stats, updated in the same transaction
+    # as the inserts and kept after compaction. start_balance is the
+    # balance a day started with, when known, for its daily budget.
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_days (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            spent REAL NOT NULL DEFAULT 0,
+            earned REAL NOT NULL DEFAULT 0,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            start_balance REAL,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_weeks (
+            user_id INTEGER NOT NULL,
+            week_start TEXT NOT NULL,
+            spent REAL NOT NULL DEFAULT 0,
+            earned REAL NOT NULL DEFAULT 0,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, week_start)
+        ) WITHOUT ROWID
+    ''')
+    # Backfill for transactions stored before the rollups existed
+    async with db.execute('SELECT EXISTS (SELECT 1 FROM ledger_days)') as cursor:
+        has_rollups = (await cursor.fetchone())[0]
+    if not has_rollups:
+        from db import _rebuild_rollups
+        await _rebuild_rollups(db)
+
+
+# (version, name, step); append only, never renumber
+SQLITE_MIGRATIONS = (
+    (1, "users", _users),
+    (2, "reminder schedule", _reminders),
+    (3, "fsm storage", _fsm_storage),
+    (4, "job leases", _job_leases),
+    (5, "ledger", _ledger),
+    (6, "ledger rollups", _ledger_rollups),
+)
+SQLITE_SCHEMA_VERSION = SQLITE_MIGRATIONS[-1][0]
+
+
+async def sqlite_schema_version(db) -> int:
+    async with db.execute('PRAGMA user_version') as cursor:
+        return (await cursor.fetchone())[0]
+
+
+async def migrate_sqlite(db) -> int:
+    """Apply pending migrations on an open connection; returns how many ran."""
+    version = await sqlite_schema_version(db)
+    pending = [m for m in SQLITE_MIGRATIONS if m[0] > version]
+    for number, name, step in pending:
+        await db.execute('BEGIN IMMEDIATE')
+        try:
+            await step(db)
+            await db.execute(f'PRAGMA user_version = {number}')
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+        logging.info(f"SQLite schema migrated to version {number} ({name})")
+    return len(pending)
+
+
+# The Postgres backend only holds the users table, see pg_storage.py
+POSTGRES_MIGRATIONS = (
+    (1, "users", (
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            income_day SMALLINT NOT NULL,
+            savings_percent DOUBLE PRECISION NOT NULL,
+            language TEXT DEFAULT 'en',
+            monthly_income DOUBLE PRECISION DEFAULT 0,
+            timezone TEXT,
+            reminder_time TEXT,
+            next_reminder_at BIGINT
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_users_next_reminder ON users (next_reminder_at)',
+    )),
+    (2, "job leases", (
+        '''
+        CREATE TABLE IF NOT EXISTS job_leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at BIGINT NOT NULL
+        )
+        ''',
+    )),
+)
+POSTGRES_SCHEMA_VERSION = POSTGRES_MIGRATIONS[-1][0]
@@ -0,0 +1,194 @@
+"""PostgreSQL storage for the users table, on asyncpg.
+
+Keeps the users table, and the leases of the reminder jobs that work on
+it, on a database server instead of the local file. asyncpg prepares every
+statement once per connection and keeps it in its statement cache, so all
+queries here are constant strings; batches go through executemany and bulk
+loads through COPY.
+"""
+import logging
+import os
+from contextlib import asynccontextmanager
+
+from migrations import POSTGRES_MIGRATIONS, POSTGRES_SCHEMA_VERSION
+from storage import UserStorage, USER_COPY_COLUMNS, user_record
+
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+# Serializes migrations when several bots start at once
+MIGRATION_LOCK_ID = 0x6462_6f74
+
+_UPSERT_USERS = '''
+    INSERT INTO users (user_id, income_day, savings_percent, language, monthly_income)
+    VALUES ($1, $2, $3, $4, $5)
+    ON CONFLICT (user_id) DO UPDATE SET
+        income_day = EXCLUDED.income_day,
+        savings_percent = EXCLUDED.savings_percent,
+        language = EXCLUDED.language,
+        monthly_income = EXCLUDED.monthly_income
+'''
+
+
+class PostgresUserStorage(UserStorage):
+    name = "postgres"
+    shared = True
+
+    def __init__(self, url: str, min_size: int = PG_POOL_MIN, max_size: int = PG_POOL_MAX):
+        self.url = url
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = None
+
+    async def open(self):
+        # Imported here so SQLite-only installs do not need asyncpg
+        import asyncpg
+        if self._pool is None:
+            self._pool = await asyncpg.create_pool(self.url, min_size=self.min_size, max_size=self.max_size)
+
+    async def close(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await pool.close()
+
+    @asynccontextmanager
+    async def _connection(self):
+        if self._pool is None:
+            import asyncpg
+            conn = await asyncpg.connect(self.url)
+            try:
+                yield conn
+            finally:
+                await conn.close()
+        else:
+            async with self._pool.acquire() as conn:
+                yield conn
+
+    async def schema_version(self) -> int:
+        async with self._connection() as conn:
+            return await self._schema_version(conn)
+
+    async def _schema_version(self, conn) -> int:
+        exists = await conn.fetchval("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        if not exists:
+            return 0
+        return await conn.fetchval('SELECT COALESCE(MAX(version), 0) FROM schema_migrations')
+
+    async def migrate(self) -> int:
+        async with self._connection() as conn:
+            # The usual case on boot: one read, no lock
+            if await self._schema_version(conn) >= POSTGRES_SCHEMA_VERSION:
+                return 0
+            async with conn.transaction():
+                await conn.execute('SELECT pg_advisory_xact_lock($1)', MIGRATION_LOCK_ID)
+                await conn.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                    )
+                ''')
+                version = await conn.fetchval('SELECT COALESCE(MAX(version), 0) FROM schema_migrations')
+                pending = [m for m in POSTGRES_MIGRATIONS if m[0] > version]
+                for number, name, statements in pending:
+                    for statement in statements:
+                        await conn.execute(statement)
+                    await conn.execute('INSERT INTO schema_migrations (version, name) VALUES ($1, $2)', number, name)
+                    logging.info(f"Postgres schema migrated to version {number} ({name})")
+        return len(pending)
+
+    async def fetch_user(self, user_id: int):
+        async with self._connection() as conn:
+            row = await conn.fetchrow(
+                'SELECT income_day, savings_percent, language, monthly_income FROM users WHERE user_id = $1', user_id)
+        return user_record(row)
+
+    async def save_users(self, upserts, languages):
+        async with self._connection() as conn:
+            async with conn.transaction():
+                if upserts:
+                    await conn.executemany(_UPSERT_USERS, [
+                        (user_id, r["income_day"], float(r["savings_percent"]), r["language"], float(r["monthly_income"]))
+                        for user_id, r in upserts
+                    ])
+                if languages:
+                    await conn.executemany('UPDATE users SET language = $1 WHERE user_id = $2',
+                                           [(language, user_id) for user_id, language in languages])
+
+    async def users_after(self, columns, after_id: int, limit: int):
+        async with self._connection() as conn:
+            rows = await conn.fetch(
+                f'SELECT user_id, {", ".join(columns)} FROM users WHERE user_id > $1 ORDER BY user_id LIMIT $2',
+                after_id, limit)
+        return [tuple(row) for row in rows]
+
+    async def get_reminder(self, user_id: int):
+        async with self._connection() as conn:
+            row = await conn.fetchrow('SELECT timezone, reminder_time FROM users WHERE user_id = $1', user_id)
+        return tuple(row) if row else None
+
+    async def update_reminder(self, user_id: int, timezone: str, reminder_time: str, next_reminder_at: int):
+        async with self._connection() as conn:
+            await conn.execute(
+                'UPDATE users SET timezone = $1, reminder_time = $2, next_reminder_at = $3 WHERE user_id = $4',
+                timezone, reminder_time, next_reminder_at, user_id)
+
+    async def unscheduled_reminders(self, limit: int):
+        async with self._connection() as conn:
+            rows = await conn.fetch(
+                'SELECT user_id, timezone, reminder_time FROM users WHERE next_reminder_at IS NULL LIMIT $1', limit)
+        return [tuple(row) for row in rows]
+
+    async def claim_due_reminders(self, now_ts: int, limit: int, partition: int, partitions: int, next_slot):
+        async with self._connection() as conn:
+            async with conn.transaction():
+                # SKIP LOCKED: rows another bot is claiming right now are left to it
+                rows = await conn.fetch('''
+                    SELECT user_id, language, timezone, reminder_time FROM users
+                    WHERE next_reminder_at <= $1 AND user_id % $2 = $3
+                    ORDER BY next_reminder_at LIMIT $4
+                    FOR UPDATE SKIP LOCKED
+                ''', now_ts, partitions, partition, limit)
+                rows = [tuple(row) for row in rows]
+                await conn.executemany('UPDATE users SET next_reminder_at = $1 WHERE user_id = $2',
+                                       [(next_slot(row), row[0]) for row in rows])
+        return rows
+
+    async def reschedule_reminders(self, schedule):
+        async with self._connection() as conn:
+            await conn.executemany('UPDATE users SET next_reminder_at = $1 WHERE user_id = $2',
+                                   [(next_at, user_id) for user_id, next_at in schedule])
+
+    async def copy_users(self, rows):
+        # COPY into a scratch table, then one upsert: far fewer round trips
+        # than row-by-row inserts, and re-running a copy is safe.
+        columns = ", ".join(USER_COPY_COLUMNS)
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in USER_COPY_COLUMNS[1:])
+        async with self._connection() as conn:
+            async with conn.transaction():
+                await conn.execute('CREATE TEMP TABLE users_copy (LIKE users INCLUDING DEFAULTS) ON COMMIT DROP')
+                await conn.copy_records_to_table('users_copy', records=rows, columns=USER_COPY_COLUMNS)
+                await conn.execute(f'''
+                    INSERT INTO users ({columns}) SELECT {columns} FROM users_copy
+                    ON CONFLICT (user_id) DO UPDATE SET {updates}
+                ''')
+
+    async def try_acquire_lease(self, name: str, owner: str, now_ts: int, ttl: int) -> bool:
+        async with self._connection() as conn:
+            status = await conn.execute('''
+                INSERT INTO job_leases (name, owner, expires_at) VALUES ($1, $2, $3)
+                ON CONFLICT (name) DO UPDATE SET
+                    owner = EXCLUDED.owner,
+                    expires_at = EXCLUDED.expires_at
+                WHERE job_leases.expires_at <= $4 OR job_leases.owner = EXCLUDED.owner
+            ''', name, owner, now_ts + ttl, now_ts)
+        # "INSERT 0 1", or "INSERT 0 0" when a live lease of another owner stays
+        return status.endswith(" 1")
+
+    async def release_lease(self, name: str, owner: str):
+        async with self._connection() as conn:
+            await conn.execute('DELETE FROM job_leases WHERE name = $1 AND owner = $2', name, owner)
+
+    async def delete_expired_leases(self, now_ts: int) -> int:
+        async with self._connection() as conn:
+            status = await conn.execute('DELETE FROM job_leases WHERE expires_at <= $1', now_ts)
+        return int(status.split()[-1])
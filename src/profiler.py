@@ -0,0 +1,94 @@
+"""Sampling profiler for the running bot, toggled by the /profile admin command.
+
+A background thread samples the event loop thread's stack every `interval`
+seconds. Nothing is traced between samples, so the overhead stays low
+enough to run it in production for a few minutes.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+# Stops by itself after this long, in case nobody sends /profile stop
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILE_INTERVAL, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, thread_id: int = None):
+        """Start sampling `thread_id` (default: the calling thread)."""
+        if self.running:
+            return
+        target = thread_id or threading.get_ident()
+        self.stacks.clear()
+        self.samples = 0
+        self.started_at = time.monotonic()
+        self.stopped_at = None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(target,), name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, thread_id: int):
+        deadline = self.started_at + self.max_seconds
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+            if time.monotonic() >= deadline:
+                break
+        self.stopped_at = time.monotonic()
+
+    @property
+    def duration(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.stopped_at or time.monotonic()) - self.started_at
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format flamegraph tools read."""
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def top(self, limit: int = 15):
+        """(function, own samples, total samples), by own samples."""
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for name in set(stack):
+                total[name] += count
+        return [(name, n, total[name]) for name, n in own.most_common(limit)]
+
+
+profiler = SamplingProfiler()
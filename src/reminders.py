@@ -0,0 +1,90 @@
+import logging
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from broadcast import Broadcaster, BROADCAST_RATE
+from db import (
+    claim_due_reminders, fetch_unscheduled_reminders, reschedule_reminders,
+    USER_CHUNK_SIZE
+)
+from messages import get_text, MESSAGES
+
+_TIME_RE = re.compile(r"^([01]?\d|2[0-3]):([0-5]\d)$")
+
+
+def parse_reminder_time(value: str):
+    """Normalize "9:05" to "09:05"; returns None if the value is not HH:MM."""
+    match = _TIME_RE.match(value.strip())
+    if not match:
+        return None
+    return f"{int(match.group(1)):02d}:{match.group(2)}"
+
+
+def parse_timezone(value: str):
+    """Return the canonical IANA name, or None if it is unknown."""
+    try:
+        return ZoneInfo(value.strip()).key
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def next_reminder_at(timezone: str, reminder_time: str, after: datetime) -> int:
+    """UTC timestamp of the first `reminder_time` in `timezone` strictly after `after`."""
+    try:
+        tz = ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        tz = dt_timezone.utc
+    hour, minute = map(int, reminder_time.split(":"))
+    local = after.astimezone(tz)
+    candidate = local.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if candidate <= local:
+        # Wall-clock arithmetic, so DST changes keep the local time
+        candidate = (local + timedelta(days=1)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return int(candidate.timestamp())
+
+
+async def schedule_missing_reminders(now: datetime = None):
+    """Give every user without a next_reminder_at its next slot."""
+    now = now or datetime.now(dt_timezone.utc)
+    while True:
+        rows = await fetch_unscheduled_reminders()
+        if not rows:
+            return
+        await reschedule_reminders([
+            (user_id, next_reminder_at(tz, at, now)) for user_id, tz, at in rows
+        ])
+        if len(rows) < USER_CHUNK_SIZE:
+            return
+
+
+async def _claim_due(now: datetime, texts: dict, partition: int, partitions: int):
+    now_ts = int(now.timestamp())
+    while True:
+        # The users are moved to their next slot before sending, so a crash
+        # mid-broadcast never sends the same reminder twice.
+        rows = await claim_due_reminders(now_ts, lambda tz, at: next_reminder_at(tz, at, now),
+                                         partition=partition, partitions=partitions)
+        if not rows:
+            return
+        for user_id, lang, _, _ in rows:
+            yield user_id, texts.get(lang, texts["en"])
+        if len(rows) < USER_CHUNK_SIZE:
+            return
+
+
+async def send_due_reminders(bot, now: datetime = None, partition: int = 0, partitions: int = 1,
+                             rate: float = BROADCAST_RATE):
+    """Scheduler tick: send reminders to the users due in this minute.
+
+    `partition`/`partitions` restrict the tick to one user_id hash bucket.
+    """
+    now = now or datetime.now(dt_timezone.utc)
+    if partitions == 1:
+        await schedule_missing_reminders(now)
+    # Render once per language instead of once per user
+    texts = {lang: get_text("reminder", lang) for lang in MESSAGES}
+    stats = await Broadcaster(bot, rate=rate).run(_claim_due(now, texts, partition, partitions))
+    if stats.sent or stats.failed:
+        logging.info(f"Reminders {now:%H:%M} [{partition}/{partitions}]: {stats}")
+    return stats
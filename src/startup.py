@@ -0,0 +1,45 @@
+"""Startup timing report.
+
+main.py imports this first, so the clock starts before aiogram and the bot
+modules load. Each boot phase is recorded and logged in one line when the
+bot starts serving and again when the background warm-up has finished.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        # (name, seconds) in the order they happened
+        self.phases = []
+
+    def mark(self, name: str):
+        """Record the time since the previous mark (or start) as phase `name`."""
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+            self._last = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def report(self, title: str) -> str:
+        parts = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases)
+        line = f"{title} after {self.elapsed():.2f}s (pid {os.getpid()}): {parts}"
+        logging.info(line)
+        return line
+
+
+startup_timer = StartupTimer()
@@ -0,0 +1,109 @@
+"""Storage backends for the users table.
+
+The users table is the only state every worker reads and writes, so it is
+the part that can live outside the local SQLite file (see pg_storage.py).
+Backends return plain tuples; db.py applies defaults, caching and the
+write-behind queue on top.
+"""
+from abc import ABC, abstractmethod
+
+# Everything a row holds, in the order copy_users() expects
+USER_COPY_COLUMNS = (
+    "user_id", "income_day", "savings_percent", "language", "monthly_income",
+    "timezone", "reminder_time", "next_reminder_at"
+)
+
+
+def user_record(row):
+    """(income_day, savings_percent, language, monthly_income) -> settings dict."""
+    if row is None:
+        return None
+    return {
+        "income_day": row[0],
+        "savings_percent": row[1],
+        "language": row[2] or 'en',
+        "monthly_income": row[3] if row[3] is not None else 0
+    }
+
+
+class UserStorage(ABC):
+    name = None
+    # True when other hosts may write to it, so cached rows go stale sooner
+    shared = False
+
+    async def open(self):
+        """Start connections; without it every call uses a short-lived one."""
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def migrate(self) -> int:
+        """Apply pending schema migrations; returns how many ran."""
+
+    @abstractmethod
+    async def fetch_user(self, user_id: int):
+        """Settings dict (see user_record) or None."""
+
+    @abstractmethod
+    async def save_users(self, upserts, languages):
+        """(user_id, record) upserts and (user_id, language) changes, in one transaction."""
+
+    @abstractmethod
+    async def users_after(self, columns, after_id: int, limit: int):
+        """Up to `limit` (user_id, *columns) rows with user_id > after_id, in user_id order."""
+
+    @abstractmethod
+    async def get_reminder(self, user_id: int):
+        """(timezone, reminder_time) or None."""
+
+    @abstractmethod
+    async def update_reminder(self, user_id: int, timezone: str, reminder_time: str, next_reminder_at: int):
+        pass
+
+    @abstractmethod
+    async def unscheduled_reminders(self, limit: int):
+        """(user_id, timezone, reminder_time) rows without next_reminder_at."""
+
+    @abstractmethod
+    async def claim_due_reminders(self, now_ts: int, limit: int, partition: int, partitions: int, next_slot):
+        """(user_id, language, timezone, reminder_time) rows due at `now_ts`, oldest first.
+
+        In the same transaction each row's next_reminder_at is set to
+        `next_slot(row)`, so two processes never claim the same user.
+        """
+
+    @abstractmethod
+    async def reschedule_reminders(self, schedule):
+        """Apply (user_id, next_reminder_at) pairs in one transaction."""
+
+    @abstractmethod
+    async def copy_users(self, rows):
+        """Upsert full USER_COPY_COLUMNS rows in one transaction."""
+
+    @abstractmethod
+    async def try_acquire_lease(self, name: str, owner: str, now_ts: int, ttl: int) -> bool:
+        """Take (or extend our own) lease `name` unless another owner holds a live one.
+
+        Jobs over the users table (reminders) lease here, next to the rows
+        they work on, so every bot sharing the table shares the leases.
+        """
+
+    @abstractmethod
+    async def release_lease(self, name: str, owner: str):
+        pass
+
+    @abstractmethod
+    async def delete_expired_leases(self, now_ts: int) -> int:
+        pass
+
+    async def iter_user_chunks(self, columns=USER_COPY_COLUMNS[1:], chunk_size: int = 500):
+        """Lists of (user_id, *columns) rows, `chunk_size` at a time (keyset pagination)."""
+        after_id = -2**63
+        while True:
+            rows = await self.users_after(columns, after_id, chunk_size)
+            if rows:
+                yield rows
+            if len(rows) < chunk_size:
+                return
+            after_id = rows[-1][0]
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+import signal
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from middlewares import UserOrderingMiddleware
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Updates processed at once per worker, and accepted before answering 503
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "100"))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", str(WEBHOOK_MAX_CONCURRENCY * 4)))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))
+
+
+class LimitedRequestHandler(SimpleRequestHandler):
+    """Answers Telegram at once and processes updates in the background.
+
+    At most `max_concurrency` updates run at a time. Past `max_pending`
+    accepted updates, or while draining, requests get a 503 and Telegram
+    redelivers them later. With UserOrderingMiddleware on the dispatcher the
+    limit is applied there, after an update's turn in its user's lane has
+    come; updates waiting behind the same user do not count against it.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: str = None,
+                 max_concurrency: int = WEBHOOK_MAX_CONCURRENCY, max_pending: int = WEBHOOK_MAX_PENDING,
+                 drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT, **data):
+        # Without a secret anyone who can reach the port could post updates
+        # as any user, so webhook mode refuses to start without one.
+        if not secret_token:
+            raise RuntimeError("WEBHOOK_SECRET must be set in webhook mode")
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.max_pending = max_pending
+        self.drain_timeout = drain_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._draining = False
+        self._ordered = any(isinstance(m, UserOrderingMiddleware) for m in dispatcher.update.outer_middleware)
+        if self._ordered:
+            self.data["concurrency_limit"] = self._semaphore
+
+    @property
+    def pending(self) -> int:
+        return len(self._background_feed_update_tasks)
+
+    async def _background_feed_update(self, bot: Bot, update: dict) -> None:
+        if self._ordered:
+            return await self._feed_update(bot, update)
+        async with self._semaphore:
+            await self._feed_update(bot, update)
+
+    async def _feed_update(self, bot: Bot, update: dict) -> None:
+        try:
+            await super()._background_feed_update(bot, update)
+        except Exception as e:
+            logging.exception(f"Failed to process update: {e}")
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self._draining or self.pending >= self.max_pending:
+            return web.Response(status=503, text="Busy")
+        return await super().handle(request)
+
+    async def drain(self):
+        """Stop accepting updates and wait for the in-flight ones."""
+        self._draining = True
+        tasks = set(self._background_feed_update_tasks)
+        if tasks:
+            logging.info(f"Draining {len(tasks)} in-flight updates")
+            await asyncio.wait(tasks, timeout=self.drain_timeout)
+
+    async def close(self) -> None:
+        await self.drain()
+        await super().close()
+
+
+WEBHOOK_HANDLER = web.AppKey("webhook_handler", LimitedRequestHandler)
+
+
+def create_app(dispatcher: Dispatcher, bot: Bot, path: str = WEBHOOK_PATH,
+               secret_token: str = WEBHOOK_SECRET, **kwargs) -> web.Application:
+    app = web.Application()
+    handler = LimitedRequestHandler(dispatcher, bot, secret_token=secret_token, **kwargs)
+    handler.register(app, path=path)
+    app[WEBHOOK_HANDLER] = handler
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+
+async def serve_webhook(dispatcher: Dispatcher, bot: Bot, host: str = WEBHOOK_HOST,
+                        port: int = WEBHOOK_PORT, reuse_port: bool = False):
+    """Serve updates until SIGTERM/SIGINT, then drain and shut down."""
+    app = create_app(dispatcher, bot)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    # reuse_port lets several worker processes accept on the same port
+    site = web.TCPSite(runner, host, port, reuse_port=reuse_port or None)
+    await site.start()
+    logging.info(f"Webhook server listening on {host}:{port}{WEBHOOK_PATH} (pid {os.getpid()})")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+
+async def set_webhook(token: str, allowed_updates=None, workers: int = 1):
+    """Register WEBHOOK_URL with Telegram. Run once, not per worker."""
+    if not WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL must be set in webhook mode")
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET must be set in webhook mode")
+    async with Bot(token=token) as bot:
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=allowed_updates,
+            max_connections=min(100, max(1, WEBHOOK_MAX_CONCURRENCY * workers))
+        )
+
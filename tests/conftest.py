@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Modules under src/ import each other by bare name (as when running
+# `python src/main.py`), so make them importable the same way in tests.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
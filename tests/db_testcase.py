@@ -0,0 +1,31 @@
+import os
+import tempfile
+import unittest
+
+import db
+
+
+class DatabaseTestCase(unittest.IsolatedAsyncioTestCase):
+    """A fresh database file per test, migrated, with the shared pool open.
+
+    Set `readers = 0` to test without a pool (short-lived connections).
+    `db.DB_NAME` is restored afterwards.
+    """
+
+    readers = 2
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self._saved_db_name = db.DB_NAME
+        db.DB_NAME = os.path.join(self.tmp.name, "test.db")
+        db.user_cache.clear()
+        await db.init_db()
+        if self.readers:
+            await db.open_pool(readers=self.readers)
+
+    async def asyncTearDown(self):
+        # Also writes out queued user settings
+        await db.close_pool()
+        db.DB_NAME = self._saved_db_name
+        db.user_cache.clear()
+        self.tmp.cleanup()
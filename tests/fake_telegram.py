@@ -0,0 +1,82 @@
+"""A Bot session that answers API calls locally and records them."""
+import itertools
+from datetime import datetime
+
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Chat, Message
+
+
+class FakeSession(BaseSession):
+
+    def __init__(self, record: bool = True):
+        super().__init__()
+        # Load tests send too much to keep; they only need the count
+        self.record = record
+        self.requests = []
+        self.request_count = 0
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.request_count += 1
+        if self.record:
+            self.requests.append(method)
+        returning = getattr(method, "__returning__", None)
+        if returning is Message:
+            chat_id = getattr(method, "chat_id", 0)
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(),
+                chat=Chat(id=chat_id, type="private"),
+                text=getattr(method, "text", None),
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        if False:
+            yield b""
+
+    async def close(self):
+        pass
+
+    def sent_texts(self, chat_id=None):
+        return [
+            request.text for request in self.requests
+            if getattr(request, "text", None) is not None
+            and (chat_id is None or request.chat_id == chat_id)
+        ]
+
+
+def make_message_update(update_id: int, user_id: int, text: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+    entities = None
+    if text.startswith("/"):
+        entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    message = {
+        "message_id": update_id,
+        "date": int(datetime.now().timestamp()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": user,
+        "text": text,
+    }
+    if entities:
+        message["entities"] = entities
+    return {"update_id": update_id, "message": message}
+
+
+def make_callback_update(update_id: int, user_id: int, data: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": int(datetime.now().timestamp()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "Please choose your language",
+            },
+        },
+    }
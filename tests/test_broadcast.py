@@ -0,0 +1,70 @@
+import asyncio
+import unittest
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from broadcast import Broadcaster, TokenBucket
+
+
+class FakeBot:
+    def __init__(self, flood_once=(), forbidden=()):
+        self.sent = []
+        self.flood_once = set(flood_once)
+        self.forbidden = set(forbidden)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(0)
+        method = SendMessage(chat_id=chat_id, text=text)
+        if chat_id in self.flood_once:
+            self.flood_once.discard(chat_id)
+            raise TelegramRetryAfter(method, "Flood control exceeded", 0)
+        if chat_id in self.forbidden:
+            raise TelegramForbiddenError(method, "bot was blocked by the user")
+        self.sent.append((chat_id, text))
+
+
+class TestBroadcaster(unittest.IsolatedAsyncioTestCase):
+
+    async def test_sends_to_everyone_and_counts_failures(self):
+        bot = FakeBot(flood_once={3}, forbidden={5})
+        recipients = [(i, f"hi {i}") for i in range(10)]
+        stats = await Broadcaster(bot, rate=10000, workers=4, per_chat_interval=0).run(recipients)
+
+        self.assertEqual(sorted(bot.sent), [(i, f"hi {i}") for i in range(10) if i != 5])
+        self.assertEqual(stats.sent, 9)
+        self.assertEqual(stats.failed, 1)
+        self.assertEqual(stats.retried, 1)
+
+    async def test_accepts_async_iterables(self):
+        async def recipients():
+            for i in range(3):
+                yield i, "x"
+
+        bot = FakeBot()
+        stats = await Broadcaster(bot, rate=10000, workers=2, per_chat_interval=0).run(recipients())
+        self.assertEqual(stats.sent, 3)
+
+
+class TestTokenBucket(unittest.IsolatedAsyncioTestCase):
+
+    async def test_waits_when_empty(self):
+        clock = [0.0]
+        slept = []
+
+        async def sleep(seconds):
+            slept.append(seconds)
+            clock[0] += seconds
+
+        bucket = TokenBucket(rate=2, capacity=1, clock=lambda: clock[0], sleep=sleep)
+        await bucket.acquire()
+        await bucket.acquire()
+        self.assertEqual(slept, [0.5])
+
+        bucket.pause(3)
+        await bucket.acquire()
+        self.assertEqual(slept[1], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from unittest import mock
+
+import db
+from db_testcase import DatabaseTestCase
+from cache import LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_eviction_is_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set(1, "a")
+        cache.set(2, "b")
+        cache.get(1)
+        cache.set(3, "c")
+
+        self.assertIs(cache.get(2), LRUCache.MISSING)
+        self.assertEqual(cache.get(1), "a")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_ttl_expiry(self):
+        clock = FakeClock()
+        cache = LRUCache(maxsize=10, ttl=5, clock=clock)
+        cache.set(1, None)
+        self.assertIsNone(cache.get(1))
+        clock.now = 6
+        self.assertIs(cache.get(1), LRUCache.MISSING)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_stale_read_not_stored_after_write(self):
+        cache = LRUCache(maxsize=10, ttl=60)
+        epoch = cache.epoch
+        cache.invalidate(1)
+        cache.set(1, "stale", epoch)
+        self.assertIs(cache.get(1), LRUCache.MISSING)
+
+
+class TestUserCache(DatabaseTestCase):
+
+    readers = 0
+
+    async def test_repeat_reads_skip_disk(self):
+        await db.add_or_update_user(1, 10, 15.0, "en", 1000.0)
+        with mock.patch.object(db, "_fetch_user", wraps=db._fetch_user) as fetch:
+            for _ in range(5):
+                self.assertEqual((await db.get_user(1))["income_day"], 10)
+            self.assertEqual(fetch.await_count, 0)
+
+    async def test_writes_refresh_cache(self):
+        self.assertIsNone(await db.get_user(1))
+        await db.add_or_update_user(1, 10, 15.0, "en", 1000.0)
+        self.assertEqual((await db.get_user(1))["income_day"], 10)
+
+        await db.update_user_language(1, "ru")
+        self.assertEqual((await db.get_user(1))["language"], "ru")
+
+        db.user_cache.clear()
+        self.assertEqual((await db.get_user(1))["language"], "ru")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+from datetime import date, datetime
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendPhoto
+
+import charts
+
+LABELS = {"title": "Budget", "spent": "Spent", "daily_budget": "Daily", "remaining": "Left"}
+PLAN = {"target_date": datetime(2023, 11, 10, 12), "safe_to_spend_total": 1900.0, "daily_budget": 1900 / 21}
+
+
+def make_data():
+    return charts.chart_data(PLAN, date(2023, 10, 20), date(2023, 10, 10), {date(2023, 10, 12): 30.0}, LABELS)
+
+
+class FakeMessage:
+    def __init__(self, reject_file_ids=False):
+        self.photos = []
+        self.reject_file_ids = reject_file_ids
+
+    async def answer_photo(self, photo, **kwargs):
+        if isinstance(photo, str) and self.reject_file_ids:
+            raise TelegramBadRequest(SendPhoto(chat_id=1, photo=photo), "wrong file identifier")
+        self.photos.append(photo)
+        return SimpleNamespace(photo=[SimpleNamespace(file_id="small"), SimpleNamespace(file_id=f"file-{len(self.photos)}")])
+
+
+class TestCharts(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        charts.png_cache.clear()
+        charts.file_id_cache.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        charts.shutdown_pool()
+
+    def test_data_and_key(self):
+        data = make_data()
+        self.assertEqual(len(data["spent"]), 11)
+        self.assertEqual(data["spent"][2], 30.0)
+        self.assertEqual(charts.chart_key(data), charts.chart_key(make_data()))
+        other = charts.chart_data(PLAN, date(2023, 10, 20), date(2023, 10, 10), {date(2023, 10, 12): 31.0}, LABELS)
+        self.assertNotEqual(charts.chart_key(data), charts.chart_key(other))
+
+    async def test_renders_png_in_pool_once(self):
+        data = make_data()
+        png = await charts.render_chart(data)
+        self.assertTrue(png.startswith(b"\x89PNG"))
+        self.assertIs(await charts.render_chart(data), png)
+        self.assertEqual(charts.png_cache.stats()["hits"], 1)
+
+    async def test_pool_does_not_load_the_bot(self):
+        # Whatever __main__ is, the render processes start from chart_render
+        loaded = await charts._run_in_pool(eval, "sorted(__import__('sys').modules.keys() & {'aiogram', 'charts', 'main'})")
+        self.assertEqual(loaded, [])
+
+    async def test_reuses_file_id(self):
+        message = FakeMessage()
+        charts.png_cache.set(charts.chart_key(make_data()), b"png")
+        await charts.send_chart(message, make_data())
+        await charts.send_chart(message, make_data())
+        self.assertEqual(message.photos[0].data, b"png")
+        self.assertEqual(message.photos[1], "file-1")
+
+    async def test_uploads_again_if_file_id_is_rejected(self):
+        data = make_data()
+        charts.png_cache.set(charts.chart_key(data), b"png")
+        charts.file_id_cache.set(charts.chart_key(data), "stale")
+        message = FakeMessage(reject_file_ids=True)
+        await charts.send_chart(message, data)
+        self.assertEqual(message.photos[0].data, b"png")
+
+
+if __name__ == '__main__':
+    unittest.main()
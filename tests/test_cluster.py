@@ -0,0 +1,97 @@
+import asyncio
+import signal
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+import db
+from db_testcase import DatabaseTestCase
+import reminders
+from cluster import partition_order, run_reminder_tick, run_workers
+from test_broadcast import FakeBot
+
+
+class TestCluster(DatabaseTestCase):
+
+    async def test_lease_is_exclusive_until_expiry(self):
+        self.assertTrue(await db.try_acquire_lease("job", "a", 100, 60))
+        self.assertFalse(await db.try_acquire_lease("job", "b", 120, 60))
+        self.assertTrue(await db.try_acquire_lease("job", "a", 120, 60))
+        self.assertTrue(await db.try_acquire_lease("job", "b", 200, 60))
+
+    def test_partition_order(self):
+        self.assertEqual(partition_order(1, 2, 6), ([1, 3, 5], [0, 2, 4]))
+
+    async def test_replicas_send_each_reminder_once(self):
+        due = int(datetime(2024, 5, 10, 11, 0, tzinfo=timezone.utc).timestamp())
+        for user_id in range(1, 41):
+            await db.add_or_update_user(user_id, 10, 0, "en", 1000)
+            await db.update_user_reminder(user_id, "UTC", "11:00", due)
+
+        bot = FakeBot()
+        now = datetime(2024, 5, 10, 11, 0, 5, tzinfo=timezone.utc)
+        # Worker 2 of 3 is "down": the others must pick up its partitions
+        await asyncio.gather(
+            run_reminder_tick(bot, 0, 3, partitions=6, now=now, steal_delay=0),
+            run_reminder_tick(bot, 1, 3, partitions=6, now=now, steal_delay=0),
+        )
+        await run_reminder_tick(bot, 0, 3, partitions=6, now=now, steal_delay=0)
+
+        self.assertEqual(sorted(chat for chat, _ in bot.sent), list(range(1, 41)))
+
+    async def test_overlapping_ticks_send_each_reminder_once(self):
+        due = int(datetime(2024, 5, 10, 11, 0, tzinfo=timezone.utc).timestamp())
+        await db.user_storage.copy_users([(user_id, 10, 0.0, "en", 1000.0, "UTC", "11:00", due) for user_id in range(1, 1201)])
+
+        bot = FakeBot()
+        sending = peak = 0
+
+        async def send_due_reminders(*args, **kwargs):
+            nonlocal sending, peak
+            sending += 1
+            peak = max(peak, sending)
+            try:
+                return await reminders.send_due_reminders(*args, **kwargs)
+            finally:
+                sending -= 1
+
+        # The 11:01 tick starts while the 11:00 one is still sending the same partition
+        with mock.patch("cluster.BROADCAST_RATE", 100000), \
+                mock.patch("cluster.send_due_reminders", send_due_reminders):
+            await asyncio.gather(
+                run_reminder_tick(bot, 0, 2, partitions=1, now=datetime(2024, 5, 10, 11, 0, tzinfo=timezone.utc), steal_delay=0),
+                run_reminder_tick(bot, 1, 2, partitions=1, now=datetime(2024, 5, 10, 11, 1, tzinfo=timezone.utc), steal_delay=0),
+            )
+        self.assertEqual(peak, 1)
+        chats = [chat for chat, _ in bot.sent]
+        self.assertEqual(len(chats), 1200)
+        self.assertEqual(sorted(chats), list(range(1, 1201)))
+
+
+
+def crashing_worker(index: int):
+    # Worker 1 dies at once; worker 0 would run forever
+    if index == 1:
+        raise SystemExit(3)
+    time.sleep(60)
+
+
+class TestRunWorkers(unittest.TestCase):
+
+    def test_parent_exits_when_a_worker_dies(self):
+        handlers = signal.getsignal(signal.SIGTERM), signal.getsignal(signal.SIGINT)
+        start = time.monotonic()
+        try:
+            with self.assertRaises(SystemExit) as raised, self.assertLogs(level="ERROR"):
+                run_workers(2, crashing_worker)
+        finally:
+            signal.signal(signal.SIGTERM, handlers[0])
+            signal.signal(signal.SIGINT, handlers[1])
+        self.assertEqual(raised.exception.code, 1)
+        # The healthy worker was stopped instead of waited for
+        self.assertLess(time.monotonic() - start, 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+
+import db
+from db_testcase import DatabaseTestCase
+from metrics import DB_SECONDS
+
+
+class TestConnectionPool(DatabaseTestCase):
+
+    async def test_roundtrip_through_pool(self):
+        await db.add_or_update_user(1, 10, 15.0, "ru", 1000.0)
+        user = await db.get_user(1)
+        self.assertEqual(user["income_day"], 10)
+        self.assertEqual(user["language"], "ru")
+
+        await db.update_user_language(1, "en")
+        self.assertEqual((await db.get_user(1))["language"], "en")
+        self.assertEqual(await db.get_all_users(), [1])
+
+    async def test_wal_mode_enabled(self):
+        async with db._read() as conn:
+            async with conn.execute("PRAGMA journal_mode") as cursor:
+                self.assertEqual((await cursor.fetchone())[0], "wal")
+
+    async def test_readers_are_read_only(self):
+        async with db._read() as conn:
+            with self.assertRaises(Exception):
+                await conn.execute("DELETE FROM users")
+
+    async def test_iter_users_pages_in_order(self):
+        for user_id in (5, 1, 3, 2, 4):
+            await db.add_or_update_user(user_id, 10, 15.0, "ru" if user_id % 2 else "en", 1000.0)
+
+        rows = [row async for row in db.iter_users(("user_id", "language"), chunk_size=2)]
+        self.assertEqual(rows, [(1, "ru"), (2, "en"), (3, "ru"), (4, "en"), (5, "ru")])
+        self.assertEqual(await db.get_all_users(), [1, 2, 3, 4, 5])
+
+    async def test_iter_users_rejects_unknown_columns(self):
+        with self.assertRaises(ValueError):
+            async for _ in db.iter_users(("user_id; DROP TABLE users",)):
+                pass
+
+
+class TestUserWriteBehind(DatabaseTestCase):
+
+    async def stored_languages(self):
+        async with db._read() as conn:
+            async with conn.execute("SELECT user_id, language FROM users ORDER BY user_id") as cursor:
+                return await cursor.fetchall()
+
+    async def test_writes_are_batched_into_one_transaction(self):
+        flushes = DB_SECONDS.count("save_user_writes")
+        for user_id in range(1, 51):
+            await db.add_or_update_user(user_id, 10, 15.0, "en", 1000.0)
+        await db.update_user_language(7, "ru")
+        self.assertEqual(await self.stored_languages(), [])
+
+        await db.user_writes.flush()
+        rows = await self.stored_languages()
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(rows[6], (7, "ru"))
+        self.assertEqual(DB_SECONDS.count("save_user_writes"), flushes + 1)
+
+    async def test_reads_see_own_pending_writes(self):
+        await db.add_or_update_user(1, 10, 15.0, "en", 1000.0)
+        await db.user_writes.flush()
+        db.user_cache.clear()
+
+        await db.update_user_language(1, "ru")
+        db.user_cache.clear()
+        self.assertEqual((await db.get_user(1))["language"], "ru")
+        self.assertEqual(await self.stored_languages(), [(1, "en")])
+
+    async def test_flushes_on_interval_and_on_close(self):
+        db.user_writes.flush_interval = 0.01
+        try:
+            await db.add_or_update_user(1, 10, 15.0, "en", 1000.0)
+            await asyncio.sleep(0.1)
+            self.assertEqual(await self.stored_languages(), [(1, "en")])
+        finally:
+            db.user_writes.flush_interval = db.USER_WRITE_INTERVAL
+
+        await db.add_or_update_user(2, 10, 15.0, "ru", 1000.0)
+        await db.close_pool()
+        await db.open_pool(readers=1)
+        self.assertEqual(await self.stored_languages(), [(1, "en"), (2, "ru")])
+
+    async def test_reminder_update_sees_pending_user(self):
+        await db.add_or_update_user(1, 10, 15.0, "en", 1000.0)
+        await db.update_user_reminder(1, "Europe/Berlin", "09:00", 123)
+        self.assertEqual(await db.get_user_reminder(1), {"timezone": "Europe/Berlin", "reminder_time": "09:00"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from unittest import mock
+
+from aiogram.fsm.storage.base import StorageKey
+
+import db
+from db_testcase import DatabaseTestCase
+from fsm_storage import SQLiteStorage
+
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSQLiteStorage(DatabaseTestCase):
+
+    async def test_state_survives_restart(self):
+        storage = SQLiteStorage()
+        await storage.set_state(KEY, "Settings:income_day")
+        await storage.update_data(KEY, {"language": "ru"})
+        await storage.update_data(KEY, {"income_day": 10})
+        await storage.close()
+
+        restarted = SQLiteStorage()
+        self.assertEqual(await restarted.get_state(KEY), "Settings:income_day")
+        self.assertEqual(await restarted.get_data(KEY), {"language": "ru", "income_day": 10})
+        await restarted.close()
+
+    async def test_write_through_is_seen_by_another_process(self):
+        # Two storages on one database, as in two worker processes
+        first = SQLiteStorage(hot_ttl=0, write_through=True, flush_interval=60)
+        second = SQLiteStorage(hot_ttl=0, write_through=True, flush_interval=60)
+        await first.set_state(KEY, "Settings:income_day")
+        await first.set_data(KEY, {"language": "ru"})
+        self.assertEqual(await second.get_state(KEY), "Settings:income_day")
+        self.assertEqual(await second.get_data(KEY), {"language": "ru"})
+
+        await second.set_state(KEY, "Settings:monthly_income")
+        self.assertEqual(await first.get_state(KEY), "Settings:monthly_income")
+        await first.close()
+        await second.close()
+
+    async def test_writes_are_batched(self):
+        storage = SQLiteStorage(flush_interval=60)
+        with mock.patch("fsm_storage.save_fsm_records", wraps=db.save_fsm_records) as save:
+            for i in range(10):
+                await storage.update_data(StorageKey(bot_id=1, chat_id=i, user_id=i), {"step": i})
+            self.assertEqual(save.await_count, 0)
+            await storage.close()
+            self.assertEqual(save.await_count, 1)
+            self.assertEqual(len(save.await_args.args[0]), 10)
+
+    async def test_cleared_flow_is_deleted(self):
+        storage = SQLiteStorage()
+        await storage.set_state(KEY, "Settings:income_day")
+        await storage.flush()
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+        await storage.close()
+        self.assertIsNone(await db.load_fsm_record("1:42:42:::default"))
+
+    async def test_abandoned_flows_expire(self):
+        clock = FakeClock()
+        storage = SQLiteStorage(ttl=3600, clock=clock)
+        await storage.set_state(KEY, "Settings:monthly_income")
+        await storage.flush()
+
+        clock.now += 7200
+        await storage.expire()
+        self.assertIsNone(await storage.get_state(KEY))
+        await storage.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import io
+import unittest
+from datetime import date
+from unittest import mock
+
+import db
+from db_testcase import DatabaseTestCase
+import importer
+import ledger
+
+USER = {"income_day": 10, "savings_percent": 10.0, "language": "en", "monthly_income": 1000.0}
+
+STATEMENT = (
+    "Date;Description;Amount\n"
+    "20.10.2023;Coffee;-3,50\n"
+    "20.10.2023;Coffee;-3,50\n"
+    "21.10.2023;Salary;1 000,00\n"
+    "not a date;Broken;-1\n"
+)
+
+
+def rows(text):
+    stats = importer.ImportStats()
+    records = list(importer.normalize(importer.parse_csv(io.StringIO(text)), stats))
+    return records, stats
+
+
+class TestParsing(unittest.TestCase):
+
+    def test_parse_amount(self):
+        self.assertEqual(importer.parse_amount("1 234,56"), 1234.56)
+        self.assertEqual(importer.parse_amount("-1,234.56"), -1234.56)
+        self.assertEqual(importer.parse_amount("1,234"), 1234)
+        self.assertEqual(importer.parse_amount("(12.50)"), -12.5)
+        self.assertEqual(importer.parse_amount("−300 ₽"), -300)
+        self.assertIsNone(importer.parse_amount(""))
+        self.assertIsNone(importer.parse_amount("n/a"))
+
+    def test_parse_date(self):
+        self.assertEqual(importer.parse_date("2023-10-20"), date(2023, 10, 20))
+        self.assertEqual(importer.parse_date("20.10.2023 14:30"), date(2023, 10, 20))
+        self.assertEqual(importer.parse_date("2023-10-20T14:30:00"), date(2023, 10, 20))
+        self.assertIsNone(importer.parse_date("yesterday"))
+
+    def test_normalize_with_header(self):
+        records, stats = rows(STATEMENT)
+        self.assertEqual(records[0], (date(2023, 10, 20), -3.5, "Coffee"))
+        self.assertEqual(records[2], (date(2023, 10, 21), 1000.0, "Salary"))
+        self.assertEqual(len(records), 3)
+        self.assertEqual(stats.skipped, 1)
+
+    def test_normalize_debit_credit(self):
+        records, _ = rows("Date,Payee,Debit,Credit\n2023-10-20,Shop,12.00,\n2023-10-21,Employer,,500\n")
+        self.assertEqual(records, [(date(2023, 10, 20), -12.0, "Shop"), (date(2023, 10, 21), 500.0, "Employer")])
+
+    def test_normalize_without_header(self):
+        records, _ = rows("2023-10-20,-5,Bus\n")
+        self.assertEqual(records, [(date(2023, 10, 20), -5.0, "Bus")])
+
+    def test_decode_lines_across_chunks(self):
+        data = "Дата;Сумма\r\n20.10.2023;-100\r\n".encode("cp1251")
+        lines = list(importer.decode_lines(importer.read_chunks(io.BytesIO(data), chunk_size=11)))
+        self.assertEqual(lines, ["Дата;Сумма\r\n", "20.10.2023;-100\r\n"])
+
+    def test_fingerprints_are_stable_and_distinct(self):
+        records, _ = rows(STATEMENT)
+        first = [fp for *_, fp in importer.fingerprint(records)]
+        second = [fp for *_, fp in importer.fingerprint(records)]
+        self.assertEqual(first, second)
+        # Two identical coffees on the same day are two transactions
+        self.assertEqual(len(set(first)), 3)
+
+    def test_fingerprints_of_unsorted_duplicates(self):
+        records, _ = rows("2024-01-01,-3,coffee\n2024-01-02,-2,bread\n2024-01-01,-3,coffee\n")
+        fingerprints = [fp for *_, fp in importer.fingerprint(records)]
+        self.assertEqual(len(set(fingerprints)), 3)
+        # Counts carry over from one chunk to the next
+        self.assertEqual([fp for *_, fp in importer.fingerprint(records, chunk_size=1)], fingerprints)
+
+
+class TestImportStatement(DatabaseTestCase):
+
+    async def test_reimport_skips_duplicates(self):
+        data = STATEMENT.encode()
+        stats = await importer.import_statement(1, USER, io.BytesIO(data), batch_size=2)
+        self.assertEqual((stats.imported, stats.duplicates, stats.skipped), (3, 0, 1))
+
+        stats = await importer.import_statement(1, USER, io.BytesIO(data), batch_size=2)
+        self.assertEqual((stats.imported, stats.duplicates), (0, 3))
+
+        summary = await ledger.today_summary(1, USER, today=date(2023, 10, 25))
+        self.assertAlmostEqual(summary["cycle_spent"], 7)
+        self.assertAlmostEqual(summary["cycle_earned"], 1000)
+        # The reported balance already includes imported rows
+        self.assertIsNone(summary["balance"])
+
+        rows = await ledger.history(1, USER, today=date(2023, 10, 21), days=2)
+        self.assertEqual([(row["spent"], row["earned"]) for row in rows], [(0, 1000), (7, 0)])
+
+    async def test_interrupted_import_can_be_rerun(self):
+        data = STATEMENT.encode()
+        calls = iter((db.insert_transactions, None))
+
+        async def first_batch_only(*args):
+            insert = next(calls)
+            if insert is None:
+                raise RuntimeError("disk full")
+            await insert(*args)
+
+        # The second batch fails after the first one was committed
+        with mock.patch("importer.insert_transactions", first_batch_only):
+            with self.assertRaises(RuntimeError):
+                await importer.import_statement(1, USER, io.BytesIO(data), batch_size=2)
+
+        stats = await importer.import_statement(1, USER, io.BytesIO(data), batch_size=2)
+        self.assertEqual((stats.imported, stats.duplicates), (1, 2))
+        summary = await ledger.today_summary(1, USER, today=date(2023, 10, 25))
+        self.assertAlmostEqual(summary["cycle_spent"], 7)
+        self.assertAlmostEqual(summary["cycle_earned"], 1000)
+
+    async def test_unsorted_duplicates_are_imported(self):
+        data = b"2024-01-01,-3,coffee\n2024-01-02,-2,bread\n2024-01-01,-3,coffee\n"
+        stats = await importer.import_statement(1, USER, io.BytesIO(data))
+        self.assertEqual((stats.imported, stats.duplicates), (3, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import unittest
+from datetime import date
+from unittest import mock
+
+import db
+from db_testcase import DatabaseTestCase
+import ledger
+from logic import cycle_bounds
+
+USER = {"income_day": 10, "savings_percent": 10.0, "language": "en", "monthly_income": 1000.0}
+USER_5 = dict(USER, income_day=5)
+
+
+class TestCycleBounds(unittest.TestCase):
+
+    def test_bounds(self):
+        self.assertEqual(cycle_bounds(date(2023, 10, 20), 10), (date(2023, 10, 10), date(2023, 11, 10)))
+        self.assertEqual(cycle_bounds(date(2023, 10, 5), 10), (date(2023, 9, 10), date(2023, 10, 10)))
+        # Short months clamp the income day
+        self.assertEqual(cycle_bounds(date(2023, 3, 1), 31), (date(2023, 2, 28), date(2023, 3, 31)))
+
+    def test_place_in_stored_cycles(self):
+        stored = [("2023-09-05", "2023-10-05"), ("2023-10-05", "2023-10-25")]
+        self.assertEqual(db.place_in_cycles("2023-10-10", 25, stored), ("2023-10-05", "2023-10-25"))
+        # Outside the stored cycles: the income day's cycle, not overlapping them
+        self.assertEqual(db.place_in_cycles("2023-11-01", 25, stored), ("2023-10-25", "2023-11-25"))
+        self.assertEqual(db.place_in_cycles("2023-08-30", 25, stored), ("2023-08-25", "2023-09-05"))
+
+
+class TestLedger(DatabaseTestCase):
+
+    async def test_spend_updates_running_totals(self):
+        today = date(2023, 10, 20)
+        summary = await ledger.record_spend(1, USER, 50, "coffee", today=today)
+        self.assertEqual(summary["day_spent"], 50)
+        self.assertIsNone(summary["left_today"])
+
+        # 2000 - 100 savings over 21 days until Nov 10
+        await ledger.set_balance(1, USER, 2000, today=today)
+        summary = await ledger.record_spend(1, USER, 30, today=today)
+        self.assertAlmostEqual(summary["daily_budget"], 1900 / 21)
+        self.assertAlmostEqual(summary["left_today"], 1900 / 21 - 30)
+        self.assertAlmostEqual(summary["balance"], 1970)
+        self.assertAlmostEqual(summary["cycle_spent"], 80)
+
+        # Next day: the daily budget is recomputed from the running balance
+        summary = await ledger.today_summary(1, USER, today=date(2023, 10, 21))
+        self.assertEqual(summary["day_spent"], 0)
+        self.assertAlmostEqual(summary["daily_budget"], 1870 / 20)
+
+    async def test_repeated_balance_does_not_write(self):
+        today = date(2023, 10, 20)
+        await ledger.set_balance(1, USER, 2000, today=today)
+        with mock.patch("db.transaction", wraps=db.transaction) as transaction:
+            summary = await ledger.set_balance(1, USER, 2000, today=today)
+            self.assertEqual(transaction.call_count, 0)
+            self.assertAlmostEqual(summary["balance"], 2000)
+
+            # Spending moves the anchor, so the same report writes again
+            await ledger.record_spend(1, USER, 30, today=today)
+            transaction.reset_mock()
+            summary = await ledger.set_balance(1, USER, 2000, today=today)
+            self.assertEqual(transaction.call_count, 1)
+            self.assertEqual(summary["day_spent"], 0)
+            self.assertAlmostEqual(summary["balance"], 2000)
+
+    async def test_income_day_change_keeps_the_running_cycle(self):
+        today = date(2023, 10, 20)
+        await ledger.set_balance(1, USER_5, 800, today=today)
+        await ledger.record_spend(1, USER_5, 50, today=today)
+
+        # Payday moves from the 5th to the 25th: the cycle that started on
+        # Oct 5 now ends on Oct 25, and the balance is still known
+        moved = dict(USER_5, income_day=25)
+        summary = await ledger.today_summary(1, moved, today=today)
+        self.assertAlmostEqual(summary["balance"], 750)
+        summary = await ledger.record_spend(1, moved, 10, today=today)
+        self.assertAlmostEqual(summary["balance"], 740)
+        self.assertAlmostEqual(summary["cycle_spent"], 60)
+
+        summary = await ledger.record_spend(1, moved, 5, today=date(2023, 10, 26))
+        self.assertAlmostEqual(summary["balance"], 735)
+        self.assertAlmostEqual(summary["cycle_spent"], 5)
+
+        cycles = await db.get_recent_cycles(1, "2024-01-01", 10)
+        self.assertEqual([(c["cycle_start"], c["cycle_end"], c["spent"]) for c in cycles],
+                         [("2023-10-25", "2023-11-25", 5), ("2023-10-05", "2023-10-25", 60)])
+
+    async def test_new_cycle_carries_balance(self):
+        await ledger.set_balance(1, USER, 500, today=date(2023, 10, 20))
+        await ledger.record_income(1, USER, 1000, "salary", today=date(2023, 11, 10))
+
+        summary = await ledger.today_summary(1, USER, today=date(2023, 11, 10))
+        self.assertAlmostEqual(summary["balance"], 1500)
+        self.assertAlmostEqual(summary["cycle_spent"], 0)
+
+    async def test_bulk_history_goes_to_its_cycles_and_compacts(self):
+        await ledger.set_balance(1, USER, 500, today=date(2023, 10, 20))
+        entries = [(date(2022, 5, day), -10.0, None) for day in range(1, 20)]
+        summary = await ledger.record_transactions(1, USER, entries, today=date(2023, 10, 20), affect_balance=False)
+        self.assertAlmostEqual(summary["balance"], 500)
+
+        async with db._read() as conn:
+            async with conn.execute('SELECT cycle_start, spent, tx_count FROM ledger_cycles WHERE user_id = 1 ORDER BY cycle_start') as cursor:
+                rows = await cursor.fetchall()
+        self.assertEqual(rows[:2], [("2022-04-10", 90.0, 9), ("2022-05-10", 100.0, 10)])
+
+        self.assertEqual(await ledger.compact(date(2023, 10, 20)), 19)
+        self.assertEqual(await ledger.compact(date(2023, 10, 20)), 0)
+
+    async def test_history_from_daily_rollups(self):
+        today = date(2023, 10, 20)
+        await ledger.record_spend(1, USER, 40, today=date(2023, 10, 18))
+        await ledger.set_balance(1, USER, 2000, today=today)
+        await ledger.record_spend(1, USER, 30, today=today)
+        await ledger.record_spend(1, USER, 20, today=today)
+
+        rows = await ledger.history(1, USER, today=today, days=3)
+        self.assertEqual([row["day"] for row in rows], [today, date(2023, 10, 19), date(2023, 10, 18)])
+        self.assertEqual([row["spent"] for row in rows], [50, 0, 40])
+        self.assertAlmostEqual(rows[0]["budget"], 1900 / 21)
+        self.assertIsNone(rows[2]["budget"])
+
+    async def test_stats_by_week_and_cycle(self):
+        # Monday Oct 16 and the week before
+        await ledger.record_transactions(1, USER, [
+            (date(2023, 10, 12), -70.0, None), (date(2023, 10, 16), -10.0, None),
+            (date(2023, 10, 17), -5.0, None), (date(2023, 9, 20), -100.0, None),
+            (date(2023, 10, 17), 300.0, None),
+        ], today=date(2023, 10, 17))
+
+        report = await ledger.stats(1, USER, today=date(2023, 10, 17), weeks=2)
+        self.assertEqual(report["weeks"], [
+            {"week_start": date(2023, 10, 16), "spent": 15.0},
+            {"week_start": date(2023, 10, 9), "spent": 70.0},
+        ])
+        self.assertEqual(report["cycle_start"], "2023-10-10")
+        self.assertAlmostEqual(report["summary"]["cycle_spent"], 85)
+        self.assertAlmostEqual(report["cycle_avg"], 85 / 8)
+        self.assertEqual([(c["cycle_start"], c["spent"]) for c in report["cycles"]], [("2023-09-10", 100.0)])
+
+    async def test_rebuild_matches_incremental_rollups(self):
+        entries = [(date(2023, 10, day % 28 + 1), (-1) ** day * day, None) for day in range(60)]
+        await ledger.record_transactions(1, USER, entries, today=date(2023, 10, 28))
+
+        async def snapshot():
+            async with db._read() as conn:
+                async with conn.execute('SELECT * FROM ledger_days ORDER BY day') as cursor:
+                    days = await cursor.fetchall()
+                async with conn.execute('SELECT * FROM ledger_weeks ORDER BY week_start') as cursor:
+                    weeks = await cursor.fetchall()
+            return days, weeks
+
+        incremental = await snapshot()
+        async with db._write() as conn:
+            await conn.execute('UPDATE ledger_days SET spent = 0')
+            await conn.execute('DELETE FROM ledger_weeks')
+            await conn.commit()
+        await db.rebuild_rollups("2023-10-01")
+        self.assertEqual(await snapshot(), incremental)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import random
+import unittest
+from datetime import date, datetime
+
+from src import logic
+from src.logic import calculate_budget_plan, calculate_budget_plans
+
+
+class TestBulkBudgetLogic(unittest.TestCase):
+
+    def assert_matches_scalar(self, now, balances, days, percents, incomes):
+        bulk = calculate_budget_plans(balances, days, percents, incomes, now=now)
+        for i in range(len(balances)):
+            plan = calculate_budget_plan(balances[i], days[i], percents[i], incomes[i], now=now)
+            self.assertEqual(str(bulk["target_date"][i]), plan["target_date"].strftime("%Y-%m-%d"))
+            self.assertEqual(bulk["days_remaining"][i], plan["days_remaining"])
+            self.assertEqual(bulk["savings_amount"][i], plan["savings_amount"])
+            self.assertEqual(bulk["safe_to_spend_total"][i], plan["safe_to_spend_total"])
+            self.assertEqual(bulk["daily_budget"][i], plan["daily_budget"])
+
+    def test_matches_scalar_for_every_income_day(self):
+        rng = random.Random(42)
+        days = list(range(1, 32))
+        balances = [rng.uniform(-500, 100000) for _ in days]
+        percents = [rng.uniform(0, 100) for _ in days]
+        incomes = [rng.uniform(0, 50000) for _ in days]
+
+        for now in (
+            datetime(2023, 2, 15, 13, 30),   # short month, non-leap
+            datetime(2024, 2, 28, 9, 0),     # leap year
+            datetime(2023, 2, 28),           # clamped to today, zero days left
+            datetime(2023, 1, 31, 23, 59),   # next month is February
+            datetime(2023, 12, 20),          # year rollover
+            datetime(2023, 4, 30),           # last day of a 30-day month
+        ):
+            self.assert_matches_scalar(now, balances, days, percents, incomes)
+
+    def test_rejects_invalid_income_day(self):
+        with self.assertRaises(ValueError):
+            calculate_budget_plans([100], [0], [0], [0], now=datetime(2023, 1, 1))
+
+
+class TestIncomeDateCache(unittest.TestCase):
+
+    def test_cache_rolls_over_with_the_date(self):
+        self.assertEqual(logic.resolve_income_date(date(2023, 1, 31), 31), date(2023, 2, 28))
+        self.assertEqual(logic.resolve_income_date(date(2023, 1, 31), 31), date(2023, 2, 28))
+        self.assertEqual(logic._income_date_cache_day, date(2023, 1, 31))
+
+        self.assertEqual(logic.resolve_income_date(date(2023, 3, 1), 31), date(2023, 3, 31))
+        self.assertEqual(logic._income_date_cache, {31: date(2023, 3, 31)})
+
+
+if __name__ == '__main__':
+    unittest.main()
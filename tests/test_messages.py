@@ -0,0 +1,34 @@
+import unittest
+
+from src.messages import MESSAGES, Template, compile_templates, get_text
+
+
+class TestTemplates(unittest.TestCase):
+
+    def test_render_matches_str_format(self):
+        kwargs = dict(
+            next_income="2024-01-25", days_remaining=15, savings_percent=10.0,
+            monthly_income="5000.00", savings_amount="500.00",
+            safe_to_spend="900.00", daily_budget="60.00"
+        )
+        for lang in MESSAGES:
+            expected = MESSAGES[lang]["financial_plan"].format(**kwargs)
+            self.assertEqual(get_text("financial_plan", lang, **kwargs), expected)
+
+    def test_falls_back_to_english_and_key(self):
+        self.assertEqual(get_text("reminder", "de"), MESSAGES["en"]["reminder"])
+        self.assertEqual(get_text("no_such_key", "ru"), "no_such_key")
+
+    def test_key_missing_from_english(self):
+        templates = compile_templates({"en": {"a": "A"}, "ru": {"a": "А", "only_ru": "Б"}})
+        self.assertEqual(templates["ru"]["only_ru"].render(), "Б")
+        self.assertEqual(templates["en"]["a"].render(), "A")
+
+    def test_format_specs_use_str_format(self):
+        template = Template("{value:.2f} {{literal}}")
+        self.assertFalse(template.simple)
+        self.assertEqual(template.render(value=1.5), "1.50 {literal}")
+
+
+if __name__ == '__main__':
+    unittest.main()
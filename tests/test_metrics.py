@@ -0,0 +1,119 @@
+import threading
+import time
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot
+from aiogram.types import Update
+
+from cache import LRUCache
+from db_testcase import DatabaseTestCase
+import main
+import metrics
+from fake_telegram import FakeSession, make_message_update
+from middlewares import TelegramMetricsMiddleware
+from profiler import SamplingProfiler
+
+
+class TestRegistry(unittest.TestCase):
+
+    def test_render_counter_and_histogram(self):
+        registry = metrics.Registry()
+        counter = registry.register(metrics.Counter("requests_total", "Requests.", ("path",)))
+        histogram = registry.register(metrics.Histogram("latency_seconds", "Latency.", ("path",), buckets=(0.1, 1)))
+        counter.inc('/a"b')
+        counter.inc('/a"b', amount=2)
+        histogram.observe(0.05, "/x")
+        histogram.observe(0.1, "/x")
+        histogram.observe(3, "/x")
+
+        text = registry.render()
+        self.assertIn("# TYPE requests_total counter\n", text)
+        self.assertIn('requests_total{path="/a\\"b"} 3\n', text)
+        self.assertIn('latency_seconds_bucket{path="/x",le="0.1"} 2\n', text)
+        self.assertIn('latency_seconds_bucket{path="/x",le="1"} 2\n', text)
+        self.assertIn('latency_seconds_bucket{path="/x",le="+Inf"} 3\n', text)
+        self.assertIn('latency_seconds_count{path="/x"} 3\n', text)
+        with self.assertRaises(ValueError):
+            registry.register(metrics.Counter("requests_total", "Again."))
+
+    def test_watch_cache_exports_counters(self):
+        cache = LRUCache(maxsize=1)
+        metrics.watch_cache("test", cache)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+        cache.set("b", 2)
+        metrics.REGISTRY.render()
+        cache.get("b")
+        text = metrics.REGISTRY.render()
+        self.assertIn("# TYPE bot_cache_requests_total counter\n", text)
+        self.assertIn('bot_cache_requests_total{cache="test",result="hit"} 2\n', text)
+        self.assertIn('bot_cache_requests_total{cache="test",result="miss"} 1\n', text)
+        self.assertIn('bot_cache_evictions_total{cache="test"} 1\n', text)
+        self.assertIn('bot_cache_entries{cache="test"} 1\n', text)
+
+
+class TestInstrumentation(DatabaseTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.session = FakeSession()
+        self.session.middleware(TelegramMetricsMiddleware())
+        self.bot = Bot(token="42:TEST", session=self.session)
+
+    async def asyncTearDown(self):
+        await main.dp.storage.close()
+        await super().asyncTearDown()
+
+    async def test_handler_db_and_api_metrics(self):
+        handled = metrics.HANDLER_SECONDS.count("command_start_handler")
+        fetched = metrics.DB_SECONDS.count("get_user")
+        sent = metrics.TELEGRAM_SECONDS.count("SendMessage")
+
+        await main.dp.feed_update(self.bot, Update.model_validate(make_message_update(1, 7, "/start")))
+
+        self.assertEqual(metrics.HANDLER_SECONDS.count("command_start_handler"), handled + 1)
+        self.assertEqual(metrics.DB_SECONDS.count("get_user"), fetched + 1)
+        self.assertEqual(metrics.TELEGRAM_SECONDS.count("SendMessage"), sent + 1)
+
+    async def test_endpoint(self):
+        app = web.Application()
+        app.router.add_get("/metrics", metrics.metrics_handler)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get("/metrics")
+            self.assertEqual(response.status, 200)
+            self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+            text = await response.text()
+        self.assertIn("# TYPE bot_handler_seconds histogram", text)
+        self.assertIn('bot_cache_entries{cache="users"}', text)
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_samples_target_thread(self):
+        def busy_loop(stop):
+            while not stop.is_set():
+                sum(range(1000))
+
+        stop = threading.Event()
+        thread = threading.Thread(target=busy_loop, args=(stop,))
+        thread.start()
+        profiler = SamplingProfiler(interval=0.001)
+        try:
+            profiler.start(thread.ident)
+            time.sleep(0.1)
+            profiler.stop()
+        finally:
+            stop.set()
+            thread.join()
+
+        self.assertGreater(profiler.samples, 0)
+        self.assertIn("test_metrics.py:busy_loop", [name for name, _, _ in profiler.top()])
+        self.assertIn("test_metrics.py:busy_loop", profiler.collapsed())
+        self.assertFalse(profiler.running)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import asyncio
+import unittest
+
+from aiogram.types import Chat, User
+
+from metrics import UPDATES_DROPPED
+from middlewares import UserOrderingMiddleware
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+def context(user_id: int, bot=None) -> dict:
+    return {
+        "event_from_user": User(id=user_id, is_bot=False, first_name="U", language_code="en"),
+        "event_chat": Chat(id=user_id, type="private"),
+        "bot": bot,
+    }
+
+
+class TestUserOrdering(unittest.IsolatedAsyncioTestCase):
+
+    async def test_same_user_runs_in_order(self):
+        middleware = UserOrderingMiddleware()
+        log = []
+
+        async def handler(event, data):
+            log.append(("start", event))
+            # Later updates finish faster; they must still wait their turn
+            await asyncio.sleep(0.01 * (3 - event))
+            log.append(("end", event))
+            return event
+
+        results = await asyncio.gather(*(middleware(handler, i, context(1)) for i in range(3)))
+        self.assertEqual(results, [0, 1, 2])
+        self.assertEqual(log, [("start", 0), ("end", 0), ("start", 1), ("end", 1), ("start", 2), ("end", 2)])
+        self.assertEqual(middleware.lanes, {})
+
+    async def test_different_users_run_concurrently(self):
+        middleware = UserOrderingMiddleware()
+        running = 0
+        peak = 0
+
+        async def handler(event, data):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(middleware(handler, None, context(user_id)) for user_id in range(5)))
+        self.assertEqual(peak, 5)
+
+    async def test_flood_is_dropped_with_one_notice(self):
+        middleware = UserOrderingMiddleware(max_queue=2)
+        bot = FakeBot()
+        release = asyncio.Event()
+        handled = []
+        dropped = UPDATES_DROPPED.get("user_queue_full")
+
+        async def handler(event, data):
+            await release.wait()
+            handled.append(event)
+
+        tasks = [asyncio.create_task(middleware(handler, i, context(1, bot))) for i in range(5)]
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(handled, [0, 1])
+        self.assertEqual(UPDATES_DROPPED.get("user_queue_full"), dropped + 3)
+        self.assertEqual(len(bot.sent), 1)
+
+    async def test_queued_updates_hold_no_concurrency_permit(self):
+        middleware = UserOrderingMiddleware()
+        limit = asyncio.Semaphore(2)
+        release = asyncio.Event()
+
+        async def handler(event, data):
+            if event == "busy":
+                await release.wait()
+            return event
+
+        # One user's first update runs, two more wait in the lane
+        busy = [asyncio.create_task(middleware(handler, "busy", dict(context(1), concurrency_limit=limit)))
+                for _ in range(3)]
+        await asyncio.sleep(0.01)
+        other = await asyncio.wait_for(middleware(handler, "other", dict(context(2), concurrency_limit=limit)), 1)
+        self.assertEqual(other, "other")
+        release.set()
+        await asyncio.gather(*busy)
+
+    async def test_updates_without_user_pass_through(self):
+        middleware = UserOrderingMiddleware()
+
+        async def handler(event, data):
+            return "ok"
+
+        self.assertEqual(await middleware(handler, None, {}), "ok")
+
+
+if __name__ == '__main__':
+    unittest.main()
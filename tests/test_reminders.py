@@ -0,0 +1,57 @@
+import unittest
+from datetime import datetime, timezone
+
+import db
+from db_testcase import DatabaseTestCase
+from reminders import next_reminder_at, parse_reminder_time, send_due_reminders
+from test_broadcast import FakeBot
+
+
+def ts(*args, tz=timezone.utc):
+    return int(datetime(*args, tzinfo=tz).timestamp())
+
+
+class TestNextReminder(unittest.TestCase):
+
+    def test_later_today_or_tomorrow(self):
+        now = datetime(2024, 5, 10, 8, 0, tzinfo=timezone.utc)
+        self.assertEqual(next_reminder_at("UTC", "11:00", now), ts(2024, 5, 10, 11, 0))
+        self.assertEqual(next_reminder_at("UTC", "08:00", now), ts(2024, 5, 11, 8, 0))
+
+    def test_local_time_in_timezone(self):
+        # 11:00 in Moscow (UTC+3) is 08:00 UTC
+        now = datetime(2024, 5, 10, 0, 0, tzinfo=timezone.utc)
+        self.assertEqual(next_reminder_at("Europe/Moscow", "11:00", now), ts(2024, 5, 10, 8, 0))
+
+    def test_keeps_local_time_across_dst(self):
+        # Europe/London switches to BST on 2024-03-31
+        now = datetime(2024, 3, 30, 12, 0, tzinfo=timezone.utc)
+        self.assertEqual(next_reminder_at("Europe/London", "11:00", now), ts(2024, 3, 31, 10, 0))
+
+    def test_parse_reminder_time(self):
+        self.assertEqual(parse_reminder_time("9:05"), "09:05")
+        self.assertIsNone(parse_reminder_time("24:00"))
+        self.assertIsNone(parse_reminder_time("noon"))
+
+
+class TestSendDueReminders(DatabaseTestCase):
+
+    async def test_only_due_users_are_sent_once(self):
+        await db.add_or_update_user(1, 10, 0, "en", 1000)
+        await db.add_or_update_user(2, 10, 0, "ru", 1000)
+        await db.update_user_reminder(2, "Europe/Moscow", "09:00", ts(2024, 5, 10, 6, 0))
+
+        # User 1 is unscheduled: it gets the default 11:00 UTC slot
+        bot = FakeBot()
+        await send_due_reminders(bot, datetime(2024, 5, 10, 6, 0, tzinfo=timezone.utc))
+        self.assertEqual([chat for chat, _ in bot.sent], [2])
+
+        await send_due_reminders(bot, datetime(2024, 5, 10, 6, 1, tzinfo=timezone.utc))
+        self.assertEqual(len(bot.sent), 1)
+
+        await send_due_reminders(bot, datetime(2024, 5, 10, 11, 0, tzinfo=timezone.utc))
+        self.assertEqual([chat for chat, _ in bot.sent], [2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import time
+import unittest
+
+from startup import StartupTimer
+
+
+class TestStartupTimer(unittest.TestCase):
+
+    def test_marks_and_phases_in_order(self):
+        timer = StartupTimer()
+        time.sleep(0.01)
+        timer.mark("imports")
+        with timer.phase("init_db"):
+            time.sleep(0.01)
+        with self.assertRaises(RuntimeError):
+            with timer.phase("broken"):
+                raise RuntimeError()
+
+        self.assertEqual([name for name, _ in timer.phases], ["imports", "init_db", "broken"])
+        self.assertGreaterEqual(timer.phases[0][1], 0.01)
+        self.assertGreaterEqual(timer.elapsed(), 0.02)
+
+        with self.assertLogs(level="INFO") as logs:
+            line = timer.report("Serving")
+        self.assertIn("imports", line)
+        self.assertIn("init_db", line)
+        self.assertIn(line, logs.output[0])
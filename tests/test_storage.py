@@ -0,0 +1,171 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import aiosqlite
+
+import db
+from copy_storage import copy_users
+from migrations import SQLITE_SCHEMA_VERSION, migrate_sqlite, sqlite_schema_version
+
+# A disposable Postgres database; its users table is truncated by the tests
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "")
+
+try:
+    import asyncpg  # noqa: F401
+    HAVE_ASYNCPG = True
+except ImportError:
+    HAVE_ASYNCPG = False
+
+
+class TestSQLiteMigrations(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "test.db")
+
+    async def asyncTearDown(self):
+        self.tmp.cleanup()
+
+    async def test_fresh_database_reaches_latest_version(self):
+        async with aiosqlite.connect(self.path) as conn:
+            self.assertEqual(await migrate_sqlite(conn), SQLITE_SCHEMA_VERSION)
+            self.assertEqual(await sqlite_schema_version(conn), SQLITE_SCHEMA_VERSION)
+            # Nothing left to do on the next start
+            self.assertEqual(await migrate_sqlite(conn), 0)
+
+    async def test_unversioned_database_is_upgraded_in_place(self):
+        # The schema of the very first release, before any ALTERs
+        async with aiosqlite.connect(self.path) as conn:
+            await conn.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, income_day INTEGER NOT NULL, savings_percent REAL NOT NULL)')
+            await conn.execute('INSERT INTO users VALUES (7, 10, 15.0)')
+            await conn.commit()
+
+            await migrate_sqlite(conn)
+            async with conn.execute('SELECT user_id, language, monthly_income, next_reminder_at FROM users') as cursor:
+                self.assertEqual(await cursor.fetchall(), [(7, 'en', 0, None)])
+            self.assertEqual(await sqlite_schema_version(conn), SQLITE_SCHEMA_VERSION)
+
+
+class UserStorageContract:
+    """Behaviour every UserStorage must share; mixed into a TestCase per backend."""
+
+    async def make_storage(self):
+        raise NotImplementedError
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = await self.make_storage()
+        await self.storage.migrate()
+        await self.storage.open()
+
+    async def asyncTearDown(self):
+        await self.storage.close()
+        self.tmp.cleanup()
+
+    async def test_save_and_fetch(self):
+        await self.storage.save_users([(1, {"income_day": 10, "savings_percent": 15.0, "language": "ru", "monthly_income": 1000.0})], [])
+        await self.storage.save_users([], [(1, "en")])
+        self.assertEqual(await self.storage.fetch_user(1),
+                         {"income_day": 10, "savings_percent": 15.0, "language": "en", "monthly_income": 1000.0})
+        self.assertIsNone(await self.storage.fetch_user(2))
+
+    async def test_chunks_and_reminders(self):
+        await self.storage.save_users([
+            (user_id, {"income_day": 5, "savings_percent": 10.0, "language": "en", "monthly_income": 0.0})
+            for user_id in (3, 1, 2, 4)
+        ], [])
+        chunks = [rows async for rows in self.storage.iter_user_chunks(("language",), chunk_size=3)]
+        self.assertEqual([[tuple(row) for row in rows] for rows in chunks],
+                         [[(1, "en"), (2, "en"), (3, "en")], [(4, "en")]])
+
+        self.assertEqual(len(await self.storage.unscheduled_reminders(10)), 4)
+        await self.storage.update_reminder(1, "Europe/Moscow", "09:30", 100)
+        await self.storage.reschedule_reminders([(2, 50), (3, 200), (4, 90)])
+        self.assertEqual(tuple(await self.storage.get_reminder(1)), ("Europe/Moscow", "09:30"))
+        self.assertEqual([row[0] for row in await self.storage.claim_due_reminders(100, 10, 0, 2, lambda row: 500)], [2, 4])
+        due = await self.storage.claim_due_reminders(100, 10, 0, 1, lambda row: 1000 + row[0])
+        self.assertEqual([row[0] for row in due], [1])
+        # Claimed rows moved on, so nobody can claim them again
+        self.assertEqual(await self.storage.claim_due_reminders(100, 10, 0, 1, lambda row: 0), [])
+        self.assertEqual([row[0] for row in await self.storage.claim_due_reminders(500, 10, 0, 1, lambda row: 2000)], [3, 2, 4])
+        self.assertEqual(await self.storage.unscheduled_reminders(10), [])
+
+    async def test_lease_is_exclusive_until_expiry(self):
+        self.assertTrue(await self.storage.try_acquire_lease("job", "a", 100, 60))
+        self.assertFalse(await self.storage.try_acquire_lease("job", "b", 120, 60))
+        self.assertTrue(await self.storage.try_acquire_lease("job", "a", 120, 60))
+        self.assertTrue(await self.storage.try_acquire_lease("job", "b", 200, 60))
+        await self.storage.release_lease("job", "a")
+        self.assertFalse(await self.storage.try_acquire_lease("job", "a", 210, 60))
+        await self.storage.release_lease("job", "b")
+        self.assertTrue(await self.storage.try_acquire_lease("job", "a", 210, 60))
+        self.assertEqual(await self.storage.delete_expired_leases(269), 0)
+        self.assertEqual(await self.storage.delete_expired_leases(270), 1)
+
+    async def test_copy_users_upserts(self):
+        rows = [(user_id, 10, 20.0, "ru", 500.0, "UTC", "11:00", 1000 + user_id) for user_id in range(1, 8)]
+        await self.storage.copy_users(rows[:3])
+        await self.storage.copy_users(rows)
+        copied = [tuple(row) for rows in [r async for r in self.storage.iter_user_chunks()] for row in rows]
+        self.assertEqual(copied, rows)
+
+
+class TestSQLiteUserStorage(UserStorageContract, unittest.IsolatedAsyncioTestCase):
+
+    async def make_storage(self):
+        return db.create_user_storage("sqlite:" + os.path.join(self.tmp.name, "users.db"))
+
+    async def test_concurrent_claims_do_not_overlap(self):
+        rows = [(user_id, 10, 20.0, "en", 0.0, "UTC", "11:00", 100) for user_id in range(1, 201)]
+        await self.storage.copy_users(rows)
+        # A second storage on the same file, as in another process
+        other = db.create_user_storage("sqlite:" + os.path.join(self.tmp.name, "users.db"))
+        await other.open()
+
+        async def claim_all(storage):
+            claimed = []
+            while True:
+                batch = await storage.claim_due_reminders(100, 20, 0, 1, lambda row: 1000)
+                if not batch:
+                    return claimed
+                claimed.extend(row[0] for row in batch)
+
+        first, second = await asyncio.gather(claim_all(self.storage), claim_all(other))
+        await other.close()
+        self.assertEqual(sorted(first + second), list(range(1, 201)))
+
+    async def test_copy_between_files(self):
+        target = db.create_user_storage("sqlite:" + os.path.join(self.tmp.name, "copy.db"))
+        await target.migrate()
+        rows = [(user_id, 10, 20.0, "en", 0.0, None, None, None) for user_id in range(1, 12)]
+        await self.storage.copy_users(rows)
+
+        self.assertEqual(await copy_users(self.storage, target, chunk_size=4), 11)
+        self.assertEqual(await target.fetch_user(11), await self.storage.fetch_user(11))
+
+
+@unittest.skipUnless(TEST_DATABASE_URL and HAVE_ASYNCPG, "set TEST_DATABASE_URL to a disposable Postgres database")
+class TestPostgresUserStorage(UserStorageContract, unittest.IsolatedAsyncioTestCase):
+
+    async def make_storage(self):
+        storage = db.create_user_storage(TEST_DATABASE_URL)
+        await storage.migrate()
+        async with storage._connection() as conn:
+            await conn.execute("TRUNCATE users, job_leases")
+        return storage
+
+    async def test_migrations_are_recorded_once(self):
+        self.assertEqual(await self.storage.migrate(), 0)
+        self.assertGreaterEqual(await self.storage.schema_version(), 1)
+
+    async def test_copy_from_sqlite(self):
+        source = db.create_user_storage("sqlite:" + os.path.join(self.tmp.name, "users.db"))
+        await source.migrate()
+        rows = [(user_id, 10, 20.0, "ru", 0.0, "UTC", "11:00", None) for user_id in range(1, 1001)]
+        await source.copy_users(rows)
+
+        self.assertEqual(await copy_users(source, self.storage, chunk_size=300), 1000)
+        self.assertEqual(await self.storage.fetch_user(1000),
+                         {"income_day": 10, "savings_percent": 20.0, "language": "ru", "monthly_income": 0.0})
@@ -0,0 +1,68 @@
+import asyncio
+import unittest
+
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot
+
+from db_testcase import DatabaseTestCase
+import main
+from fake_telegram import FakeSession, make_message_update
+from messages import get_text
+from webhook import WEBHOOK_HANDLER, create_app
+
+SECRET = "s3cret"
+
+
+class TestWebhook(DatabaseTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.session = FakeSession()
+        self.bot = Bot(token="42:TEST", session=self.session)
+        self.app = create_app(main.dp, self.bot, path="/webhook", secret_token=SECRET)
+        self.client = TestClient(TestServer(self.app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await main.dp.storage.close()
+        await super().asyncTearDown()
+
+    async def post(self, update, secret=SECRET):
+        return await self.client.post(
+            "/webhook", json=update,
+            headers={"X-Telegram-Bot-Api-Secret-Token": secret}
+        )
+
+    async def wait_idle(self):
+        handler = self.app[WEBHOOK_HANDLER]
+        while handler.pending:
+            await asyncio.sleep(0.01)
+
+    async def test_recorded_update_is_processed(self):
+        response = await self.post(make_message_update(1, 100, "/help"))
+        self.assertEqual(response.status, 200)
+        await self.wait_idle()
+        self.assertEqual(self.session.sent_texts(100), [get_text("help_text", "en")])
+
+    async def test_limit_is_applied_inside_user_lanes(self):
+        # main.dp orders updates per user, so the permit is taken there
+        self.assertIn("concurrency_limit", self.app[WEBHOOK_HANDLER].data)
+
+    async def test_wrong_secret_is_rejected(self):
+        response = await self.post(make_message_update(1, 100, "/help"), secret="nope")
+        self.assertEqual(response.status, 401)
+        self.assertEqual(self.session.requests, [])
+
+    async def test_secret_is_required(self):
+        with self.assertRaises(RuntimeError):
+            create_app(main.dp, self.bot, path="/webhook", secret_token="")
+
+    async def test_draining_refuses_new_updates(self):
+        await self.app[WEBHOOK_HANDLER].drain()
+        response = await self.post(make_message_update(1, 100, "/help"))
+        self.assertEqual(response.status, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()